@@ -0,0 +1,136 @@
+"""initial schema
+
+Creates the tables that Base.metadata.create_all and migrate_db.py used to
+manage. Databases created by those keep their tables; only what is missing
+(tags/color columns, the change_log table and its backfill) is added.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "users" not in tables:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("hashed_password", sa.String(), nullable=False),
+            sa.Column("display_name", sa.String(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.Column("last_sync_at", sa.DateTime(), nullable=True),
+            sa.Column("is_deleted", sa.Boolean(), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("is_email_verified", sa.Boolean(), nullable=False),
+            sa.Column("email_verification_token", sa.String(), nullable=True),
+            sa.Column("email_verification_expires", sa.DateTime(), nullable=True),
+        )
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if "collections" not in tables:
+        op.create_table(
+            "collections",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("user_id", sa.String(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("description", sa.String(), nullable=True),
+            sa.Column("tags", sa.String(), nullable=True),
+            sa.Column("color", sa.String(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.Column("is_deleted", sa.Boolean(), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+        )
+        op.create_index("ix_collections_user_id", "collections", ["user_id"])
+    else:
+        columns = {c["name"] for c in inspector.get_columns("collections")}
+        with op.batch_alter_table("collections") as batch_op:
+            if "tags" not in columns:
+                batch_op.add_column(sa.Column("tags", sa.String(), nullable=True))
+            if "color" not in columns:
+                batch_op.add_column(sa.Column("color", sa.String(), nullable=True))
+
+    if "cards" not in tables:
+        op.create_table(
+            "cards",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("collection_id", sa.String(), sa.ForeignKey("collections.id"), nullable=False),
+            sa.Column("user_id", sa.String(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("front", sa.String(), nullable=False),
+            sa.Column("back", sa.String(), nullable=False),
+            sa.Column("ease_factor", sa.Float(), nullable=False),
+            sa.Column("interval", sa.Integer(), nullable=False),
+            sa.Column("repetitions", sa.Integer(), nullable=False),
+            sa.Column("next_review_date", sa.DateTime(), nullable=True),
+            sa.Column("last_review_date", sa.DateTime(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.Column("is_deleted", sa.Boolean(), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+        )
+        op.create_index("ix_cards_collection_id", "cards", ["collection_id"])
+        op.create_index("ix_cards_user_id", "cards", ["user_id"])
+        op.create_index("ix_cards_next_review_date", "cards", ["next_review_date"])
+
+    if "review_logs" not in tables:
+        op.create_table(
+            "review_logs",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("card_id", sa.String(), sa.ForeignKey("cards.id"), nullable=False),
+            sa.Column("user_id", sa.String(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("quality", sa.String(), nullable=False),
+            sa.Column("reviewed_at", sa.DateTime(), nullable=False),
+            sa.Column("interval_before", sa.Integer(), nullable=False),
+            sa.Column("interval_after", sa.Integer(), nullable=False),
+            sa.Column("ease_factor_before", sa.Float(), nullable=False),
+            sa.Column("ease_factor_after", sa.Float(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+        )
+        op.create_index("ix_review_logs_card_id", "review_logs", ["card_id"])
+        op.create_index("ix_review_logs_user_id", "review_logs", ["user_id"])
+
+    if "change_log" not in tables:
+        op.create_table(
+            "change_log",
+            sa.Column("seq", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("user_id", sa.String(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("entity_type", sa.String(), nullable=False),
+            sa.Column("entity_id", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sqlite_autoincrement=True,
+        )
+        op.create_index("ix_change_log_user_seq", "change_log", ["user_id", "seq"])
+
+        #one change per existing entity, oldest first so sequence order follows history
+        op.execute("""
+            INSERT INTO change_log (user_id, entity_type, entity_id, created_at)
+            SELECT user_id, entity_type, id, changed_at FROM (
+                SELECT user_id, 'collection' AS entity_type, id, updated_at AS changed_at FROM collections
+                UNION ALL
+                SELECT user_id, 'card', id, updated_at FROM cards
+                UNION ALL
+                SELECT user_id, 'review_log', id, created_at FROM review_logs
+            ) AS existing
+            ORDER BY changed_at
+        """)
+
+
+def downgrade() -> None:
+    op.drop_table("change_log")
+    op.drop_table("review_logs")
+    op.drop_table("cards")
+    op.drop_table("collections")
+    op.drop_table("users")
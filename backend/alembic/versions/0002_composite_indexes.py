@@ -0,0 +1,66 @@
+"""composite indexes for the per-user hot queries
+
+Every endpoint filters by user_id first, so the single-column user_id
+indexes are replaced by composite ones that also serve the second
+predicate or the sort. The due-card index is partial and only covers
+live cards.
+
+Indexes are built outside the migration transaction: CONCURRENTLY on
+Postgres so writes continue during the build, and one index per
+transaction on SQLite so the write lock is only held for one build at a
+time.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+#name, table, columns, live rows only
+INDEXES = [
+    ("ix_collections_user_updated", "collections", ["user_id", "updated_at"], False),
+    ("ix_cards_user_updated", "cards", ["user_id", "updated_at"], False),
+    ("ix_cards_user_collection", "cards", ["user_id", "collection_id"], False),
+    ("ix_cards_user_due", "cards", ["user_id", "next_review_date"], True),
+    ("ix_review_logs_user_created", "review_logs", ["user_id", "created_at"], False),
+    ("ix_review_logs_user_reviewed", "review_logs", ["user_id", "reviewed_at"], False),
+]
+
+#covered by the leading user_id column of the composite indexes
+REPLACED_INDEXES = [
+    ("ix_collections_user_id", "collections", ["user_id"]),
+    ("ix_cards_user_id", "cards", ["user_id"]),
+    ("ix_review_logs_user_id", "review_logs", ["user_id"]),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, live_only in INDEXES:
+            where = {}
+            if live_only:
+                where = {
+                    "sqlite_where": sa.text("is_deleted = 0"),
+                    "postgresql_where": sa.text("is_deleted = false"),
+                }
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True, **where)
+
+        for name, table, _ in REPLACED_INDEXES:
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in REPLACED_INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+
+        for name, table, _, _ in INDEXES:
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
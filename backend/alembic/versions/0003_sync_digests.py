@@ -0,0 +1,38 @@
+"""per-user sync digests
+
+One revision counter per user ('' row) and per collection, bumped in the
+same transaction as every change. Existing users and collections start
+at revision 1.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "sync_digests",
+        sa.Column("user_id", sa.String(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("collection_id", sa.String(), primary_key=True),
+        sa.Column("revision", sa.Integer(), nullable=False),
+    )
+
+    op.execute("""
+        INSERT INTO sync_digests (user_id, collection_id, revision)
+        SELECT id, '', 1 FROM users
+        UNION ALL
+        SELECT user_id, id, 1 FROM collections
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table("sync_digests")
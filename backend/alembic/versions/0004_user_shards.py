@@ -0,0 +1,31 @@
+"""per-user shard placement
+
+users.shard records which database holds a user's collections, cards,
+review logs and change feed (NULL: shard 0, the database that also holds
+the user directory). users.shard_moving is set while the rebalance tool
+moves a user. Every shard runs the full schema.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("users") as batch:
+        batch.add_column(sa.Column("shard", sa.Integer(), nullable=True))
+        batch.add_column(sa.Column("shard_moving", sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("shard_moving")
+        batch.drop_column("shard")
@@ -0,0 +1,51 @@
+"""indexed expired registration cleanup
+
+users.original_email holds the email of a deleted account while a new
+registration uses it (the account's email is deleted_{id}_{email}), so
+restoring or dropping it is an index lookup instead of a LIKE scan.
+Renamed accounts are backfilled. The partial index covers the cleanup
+job's scan of pending registrations by expiry.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("users") as batch:
+        batch.add_column(sa.Column("original_email", sa.String(), nullable=True))
+        batch.create_index("ix_users_original_email", ["original_email"])
+    op.create_index(
+        "ix_users_unverified_expires", "users", ["email_verification_expires"],
+        sqlite_where=sa.text("is_email_verified = 0 AND is_deleted = 0"),
+        postgresql_where=sa.text("is_email_verified = false AND is_deleted = false"),
+    )
+
+    conn = op.get_bind()
+    renamed = conn.execute(sa.text("SELECT id, email FROM users WHERE email LIKE 'deleted\\_%' ESCAPE '\\'")).all()
+    for user_id, email in renamed:
+        #deleted_{uuid}_{original_email}
+        match = re.match(r'^deleted_[^_]+_(.+)$', email)
+        if match:
+            conn.execute(
+                sa.text("UPDATE users SET original_email = :original WHERE id = :id"),
+                {"original": match.group(1), "id": user_id}
+            )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_unverified_expires", table_name="users")
+    with op.batch_alter_table("users") as batch:
+        batch.drop_index("ix_users_original_email")
+        batch.drop_column("original_email")
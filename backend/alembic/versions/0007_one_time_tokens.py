@@ -0,0 +1,77 @@
+"""one-time tokens
+
+Email link tokens move from users.email_verification_token (plaintext,
+unindexed, shared by verification and password reset) to one_time_tokens,
+which keeps their sha256 under a unique index with a purpose, an expiry
+and the time they were used. Outstanding tokens are carried over: a
+pending account's token is a verification token, a verified account's a
+reset token. Downgrading drops them, their links stop working.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+import hashlib
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    tokens = op.create_table(
+        "one_time_tokens",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("token_hash", sa.String(), nullable=False),
+        sa.Column("user_id", sa.String(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("purpose", sa.String(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("used_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_one_time_tokens_token_hash", "one_time_tokens", ["token_hash"], unique=True)
+    op.create_index("ix_one_time_tokens_expires_at", "one_time_tokens", ["expires_at"])
+    op.create_index("ix_one_time_tokens_user_purpose", "one_time_tokens", ["user_id", "purpose"])
+
+    conn = op.get_bind()
+    now = datetime.utcnow()
+    users = sa.table(
+        "users",
+        sa.column("id", sa.String()),
+        sa.column("email_verification_token", sa.String()),
+        sa.column("email_verification_expires", sa.DateTime()),
+        sa.column("is_email_verified", sa.Boolean()),
+    )
+    outstanding = conn.execute(
+        sa.select(users.c.id, users.c.email_verification_token, users.c.email_verification_expires, users.c.is_email_verified)
+        .where(users.c.email_verification_token.is_not(None))
+    ).all()
+    if outstanding:
+        op.bulk_insert(tokens, [
+            {
+                "token_hash": hashlib.sha256(token.encode()).hexdigest(),
+                "user_id": user_id,
+                "purpose": "reset_password" if verified else "verify_email",
+                "expires_at": expires or now + timedelta(hours=24),
+                "created_at": now,
+            }
+            for user_id, token, expires, verified in outstanding
+        ])
+
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("email_verification_token")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("users") as batch:
+        batch.add_column(sa.Column("email_verification_token", sa.String(), nullable=True))
+    op.drop_index("ix_one_time_tokens_user_purpose", table_name="one_time_tokens")
+    op.drop_index("ix_one_time_tokens_expires_at", table_name="one_time_tokens")
+    op.drop_index("ix_one_time_tokens_token_hash", table_name="one_time_tokens")
+    op.drop_table("one_time_tokens")
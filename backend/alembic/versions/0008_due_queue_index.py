@@ -0,0 +1,52 @@
+"""due queue index with the card id
+
+ix_cards_user_due gains the card id as its last column, so the due
+queue's keyset pages (next_review_date, id) and the new cards (no
+next_review_date, by id) are read in index order without a sort.
+On Postgres it is built like 0002, CONCURRENTLY outside the migration
+transaction, under a temporary name and swapped in once built, so the
+due queue always has an index. On SQLite the old index is replaced in
+the migration transaction.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+LIVE_ONLY = {
+    "sqlite_where": sa.text("is_deleted = 0"),
+    "postgresql_where": sa.text("is_deleted = false"),
+}
+
+
+def _rebuild(columns: list[str]) -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        #SQLite DDL is transactional: readers see the old index until the new one commits
+        op.drop_index("ix_cards_user_due", table_name="cards", if_exists=True)
+        op.create_index("ix_cards_user_due", "cards", columns, **LIVE_ONLY)
+        return
+
+    #the new index is built beside the old one, which serves the due queue
+    #until the swap; a leftover of a failed concurrent build is dropped first
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_cards_user_due_new", table_name="cards", if_exists=True, postgresql_concurrently=True)
+        op.create_index("ix_cards_user_due_new", "cards", columns, postgresql_concurrently=True, **LIVE_ONLY)
+        op.drop_index("ix_cards_user_due", table_name="cards", if_exists=True, postgresql_concurrently=True)
+        op.execute("ALTER INDEX ix_cards_user_due_new RENAME TO ix_cards_user_due")
+
+
+def upgrade() -> None:
+    _rebuild(["user_id", "next_review_date", "id"])
+
+
+def downgrade() -> None:
+    _rebuild(["user_id", "next_review_date"])
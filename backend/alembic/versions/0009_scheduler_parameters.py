@@ -0,0 +1,34 @@
+"""scheduler parameters
+
+Per-user FSRS weights fitted to the user's review logs, with the review
+count and log loss of the fit, in the directory database.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "scheduler_parameters",
+        sa.Column("user_id", sa.String(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("weights", sa.JSON(), nullable=False),
+        sa.Column("request_retention", sa.Float(), nullable=False),
+        sa.Column("review_count", sa.Integer(), nullable=False),
+        sa.Column("log_loss", sa.Float(), nullable=False),
+        sa.Column("default_log_loss", sa.Float(), nullable=False),
+        sa.Column("fitted_at", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("scheduler_parameters")
@@ -0,0 +1,37 @@
+"""review stats
+
+Hourly review counts per user and collection, maintained with every
+review log insert. Existing history is loaded by
+`python -m app.services.review_stats backfill`.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "review_stats",
+        sa.Column("user_id", sa.String(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("collection_id", sa.String(), primary_key=True),
+        sa.Column("hour", sa.DateTime(), primary_key=True),
+        sa.Column("reviews", sa.Integer(), nullable=False),
+        sa.Column("wrong", sa.Integer(), nullable=False),
+        sa.Column("hard", sa.Integer(), nullable=False),
+        sa.Column("good", sa.Integer(), nullable=False),
+        sa.Column("easy", sa.Integer(), nullable=False),
+        sa.Column("perfect", sa.Integer(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("review_stats")
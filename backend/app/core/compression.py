@@ -0,0 +1,119 @@
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+
+class _GzipCompressor:
+    encoding = "gzip"
+
+    def __init__(self):
+        self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        out = self._obj.compress(data)
+        return out + self._obj.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _ZstdCompressor:
+    encoding = "zstd"
+
+    def __init__(self):
+        self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        out = self._obj.compress(data)
+        if final:
+            return out + self._obj.flush()
+        return out + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+
+def choose_compressor(accept_encoding: str):
+    """Pick the best encoding the client accepts (zstd over gzip), or None"""
+    accepted = {token.split(";")[0].strip().lower() for token in accept_encoding.split(",")}
+    if zstandard is not None and "zstd" in accepted:
+        return _ZstdCompressor
+    if "gzip" in accepted:
+        return _GzipCompressor
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Negotiated zstd/gzip response compression.
+    Bodies smaller than `minimum_size` are sent as is. Streamed bodies are
+    flushed per chunk so NDJSON lines reach the client as they are produced.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        compressor_cls = choose_compressor(Headers(scope=scope).get("accept-encoding", ""))
+        if compressor_cls is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = Headers(raw=message["headers"])
+                passthrough = (
+                    "content-encoding" in headers
+                    or headers.get("content-type", "").startswith("text/event-stream")
+                )
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                initial, start_message = start_message, None
+                if passthrough or (not more_body and len(body) < self.minimum_size):
+                    passthrough = True
+                    await send(initial)
+                    await send(message)
+                    return
+
+                compressor = compressor_cls()
+                headers = MutableHeaders(raw=initial["headers"])
+                headers["Content-Encoding"] = compressor.encoding
+                headers.add_vary_header("Accept-Encoding")
+                body = compressor.compress(body, final=not more_body)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(initial)
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            if passthrough:
+                await send(message)
+                return
+
+            body = compressor.compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import List
+from typing import Dict, List
 
 
 class Settings(BaseSettings):
@@ -8,6 +8,25 @@ class Settings(BaseSettings):
     DEBUG: bool = Field(...)
 
     database_url: str = Field(...)
+    SHARD_DATABASE_URLS: List[str] = Field(default=[])
+    REPLICA_DATABASE_URLS: Dict[int, List[str]] = Field(default={})
+    REPLICA_POLL_SECONDS: float = Field(default=1.0)
+    REPLICA_MAX_LAG_SECONDS: float = Field(default=30.0)
+    DB_ENGINE_PROFILE: str = Field(default="auto")
+    SQLITE_BUSY_TIMEOUT_MS: int = Field(default=5000)
+    SQLITE_SYNCHRONOUS: str = Field(default="NORMAL")
+    SQLITE_MMAP_SIZE: int = Field(default=268435456)
+    SQLITE_CACHE_SIZE: int = Field(default=-65536)
+    SQLITE_TEMP_STORE: str = Field(default="MEMORY")
+    SQLITE_WRITE_PIPELINE: bool = Field(default=False)
+    WRITE_PIPELINE_MAX_BATCH: int = Field(default=256)
+    DB_POOL_SIZE: int = Field(default=10)
+    DB_MAX_OVERFLOW: int = Field(default=20)
+    DB_POOL_PRE_PING: bool = Field(default=True)
+    DB_POOL_RECYCLE_SECONDS: int = Field(default=1800)
+    DB_POOL_TIMEOUT_SECONDS: int = Field(default=30)
+    DB_STATEMENT_TIMEOUT_MS: int = Field(default=30000)
+    DB_IDLE_IN_TRANSACTION_TIMEOUT_MS: int = Field(default=60000)
     
     secret_key: str = Field(...)
     algorithm: str = Field(...)
@@ -42,6 +61,7 @@ class Settings(BaseSettings):
     VERSION: str = Field(...)
     
     MAX_REQUEST_SIZE: int = Field(...)
+    COMPRESSION_MIN_BYTES: int = Field(default=1024)
     
     LOG_LEVEL: str = Field(...)
     LOG_FILE: str = Field(...)
@@ -54,6 +74,37 @@ class Settings(BaseSettings):
     MAX_SYNC_ITEMS_PER_REQUEST: int = Field(...)
     SYNC_BATCH_SIZE: int = Field(...)
     SYNC_DEBOUNCE_SECONDS: int = Field(...)
+    SYNC_PAGE_SIZE: int = Field(default=1000)
+    SYNC_LAST_SEEN_RESOLUTION_SECONDS: int = Field(default=300)
+    SYNC_STREAM_KEEPALIVE_SECONDS: int = Field(default=25)
+    DUE_PAGE_SIZE: int = Field(default=100)
+    DUE_MAX_PAGE_SIZE: int = Field(default=1000)
+    STATS_DEFAULT_DAYS: int = Field(default=30)
+    STATS_MAX_DAYS: int = Field(default=3660)
+    BROADCAST_URL: str = Field(default="memory://")
+    IDEMPOTENCY_CACHE_SIZE: int = Field(default=10000)
+    IDEMPOTENCY_TTL_SECONDS: int = Field(default=600)
+    AUTH_TOKEN_CACHE_SIZE: int = Field(default=10000)
+    AUTH_USER_CACHE_SIZE: int = Field(default=10000)
+    AUTH_USER_CACHE_TTL_SECONDS: int = Field(default=10)
+    PASSWORD_HASH_WORKERS: int = Field(default=2)
+    PASSWORD_HASH_MAX_QUEUE: int = Field(default=32)
+    LOGIN_IP_MAX_ATTEMPTS: int = Field(default=100)
+    RATE_LIMIT_URL: str = Field(default="memory://")
+    RATE_LIMIT_MAX_KEYS: int = Field(default=100000)
+    EMAIL_OUTBOX_BATCH_SIZE: int = Field(default=50)
+    EMAIL_OUTBOX_POLL_SECONDS: float = Field(default=5.0)
+    EMAIL_MAX_ATTEMPTS: int = Field(default=8)
+    EMAIL_RETRY_BASE_SECONDS: float = Field(default=30.0)
+    EMAIL_RETRY_MAX_SECONDS: float = Field(default=3600.0)
+    EMAIL_SMTP_IDLE_SECONDS: float = Field(default=60.0)
+    MAINTENANCE_INTERVAL_SECONDS: float = Field(default=300.0)
+    MAINTENANCE_CHUNK_SIZE: int = Field(default=500)
+    SCHEDULER_CHUNK_SIZE: int = Field(default=10000)
+    SCHEDULER_FIT_MIN_REVIEWS: int = Field(default=500)
+    SCHEDULER_FIT_STEPS: int = Field(default=40)
+    SCHEDULER_FIT_BATCH_REVIEWS: int = Field(default=16384)
+    SCHEDULER_FIT_WORKERS: int = Field(default=0)
 
     class Config:
         env_file = ".env"
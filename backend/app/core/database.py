@@ -1,23 +1,66 @@
-from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import settings
+from app.core.engine_profiles import build_engine, build_async_engine
+
+#async drivers for the plain database URLs used in settings
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def async_database_url(url: str) -> str:
+    """Same database through its async driver (aiosqlite/asyncpg), URLs naming a driver are kept"""
+    parsed = make_url(url)
+    if "+" in parsed.drivername or parsed.drivername not in ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=ASYNC_DRIVERS[parsed.drivername]).render_as_string(hide_password=False)
+
+
+#blocking engine for migrations, scripts and background jobs
+engine = build_engine(settings.database_url)
+
+#request handlers use the async engine, both are tuned by DB_ENGINE_PROFILE
+async_engine = build_async_engine(async_database_url(settings.database_url))
 
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False}  # needed for sqlite 
-)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class SyncSession(Session):
+    """
+    Session class behind both factories, AsyncSession wraps one of these.
+    Session events (change feed, notifications) are registered on it.
+    """
+
+
+SessionLocal = sessionmaker(class_=SyncSession, autocommit=False, autoflush=False, bind=engine)
+
+#attributes stay loaded after commit, an expired attribute would need IO to reload
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    sync_session_class=SyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
 Base = declarative_base()
 
 
-def get_db():
+async def get_db():
     """Dependency for database sessions"""
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+def on_conflict_insert(bind):
+    """insert() of a dialect supporting INSERT ... ON CONFLICT (SQLite/Postgres), None for others"""
+    dialect = bind.dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert
+    if dialect == "postgresql":
+        return postgresql.insert
+    return None
@@ -0,0 +1,105 @@
+from typing import Optional
+
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.core.config import settings
+
+
+#"auto" picks sqlite_wal or postgres from the database URL
+PROFILES = ("default", "sqlite_wal", "postgres")
+
+
+def resolve_profile(url: str, profile: Optional[str] = None) -> str:
+    """Engine profile for a database URL, DB_ENGINE_PROFILE unless given"""
+    profile = profile or settings.DB_ENGINE_PROFILE
+    if profile == "auto":
+        backend = make_url(url).get_backend_name()
+        if backend == "sqlite":
+            return "sqlite_wal"
+        if backend == "postgresql":
+            return "postgres"
+        return "default"
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown DB_ENGINE_PROFILE: {profile} (expected auto or one of {', '.join(PROFILES)})")
+    return profile
+
+
+SQLITE_SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+SQLITE_TEMP_STORES = ("DEFAULT", "FILE", "MEMORY")
+
+
+def sqlite_pragmas() -> dict:
+    """Per-connection pragmas of the sqlite_wal profile, applied in this order"""
+    if settings.SQLITE_SYNCHRONOUS.upper() not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {settings.SQLITE_SYNCHRONOUS}")
+    if settings.SQLITE_TEMP_STORE.upper() not in SQLITE_TEMP_STORES:
+        raise ValueError(f"Invalid SQLITE_TEMP_STORE: {settings.SQLITE_TEMP_STORE}")
+    return {
+        "journal_mode": "WAL",
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "temp_store": settings.SQLITE_TEMP_STORE,
+    }
+
+
+def _engine_options(url: str, profile: str, is_async: bool) -> dict:
+    backend = make_url(url).get_backend_name()
+    options = {}
+
+    if backend == "sqlite" and not is_async:
+        options["connect_args"] = {"check_same_thread": False}  # needed for sqlite
+
+    if profile == "postgres":
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        )
+        timeouts = {
+            "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS),
+            "idle_in_transaction_session_timeout": str(settings.DB_IDLE_IN_TRANSACTION_TIMEOUT_MS),
+        }
+        if is_async:
+            #asyncpg takes server settings directly
+            options["connect_args"] = {"server_settings": timeouts}
+        else:
+            options["connect_args"] = {"options": " ".join(f"-c {k}={v}" for k, v in timeouts.items())}
+
+    return options
+
+
+def _install_sqlite_pragmas(engine: Engine) -> None:
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def build_engine(url: str, profile: Optional[str] = None) -> Engine:
+    """Blocking engine configured by an engine profile"""
+    profile = resolve_profile(url, profile)
+    engine = create_engine(url, **_engine_options(url, profile, is_async=False))
+    if profile == "sqlite_wal":
+        _install_sqlite_pragmas(engine)
+    return engine
+
+
+def build_async_engine(url: str, profile: Optional[str] = None) -> AsyncEngine:
+    """Async engine configured by an engine profile, pragmas hook onto its sync_engine"""
+    profile = resolve_profile(url, profile)
+    engine = create_async_engine(url, **_engine_options(url, profile, is_async=True))
+    if profile == "sqlite_wal":
+        _install_sqlite_pragmas(engine.sync_engine)
+    return engine
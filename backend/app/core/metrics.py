@@ -0,0 +1,109 @@
+import threading
+from typing import Callable, Iterable, Optional
+
+
+#every metric of this process, rendered by GET /metrics
+registry: list["Metric"] = []
+
+
+class Metric:
+    """One metric family in the Prometheus text format, values keyed by label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterable[tuple[str, tuple, float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{_labels(self.labels, key)} {value:g}")
+        return "\n".join(lines)
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value set by its owner, or read from `collect` at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), collect: Optional[Callable[[], dict]] = None):
+        super().__init__(name, help, labels)
+        self._collect = collect
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> Iterable[tuple[str, tuple, float]]:
+        if self._collect is not None:
+            #collect returns {label values tuple: value}
+            return [(self.name, key, value) for key, value in self._collect().items()]
+        return super().samples()
+
+
+class Histogram(Metric):
+    """Cumulative buckets plus _sum and _count, buckets in seconds"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+    )):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[tuple, list[int]] = {}
+        self._sums: dict[tuple, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, counts in self._counts.items():
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    le = bound if bound == "+Inf" else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_labels((*self.labels, 'le'), (*key, le))} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {self._sums[key]:g}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {counts[-1]}")
+        return "\n".join(lines)
+
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in registry) + "\n"
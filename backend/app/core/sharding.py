@@ -0,0 +1,114 @@
+import hashlib
+
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+from app.core.database import (
+    SyncSession,
+    SessionLocal,
+    AsyncSessionLocal,
+    engine,
+    async_engine,
+    async_database_url
+)
+from app.core.engine_profiles import build_engine, build_async_engine
+from app.models.models import User
+
+#database_url is shard 0 and also holds the user directory (accounts, emails, tokens)
+DIRECTORY_SHARD = 0
+
+
+class ShardMap:
+    """
+    Databases holding per-user data: database_url first, then SHARD_DATABASE_URLS.
+    Every query on user data is scoped to one user, so all of a user's rows
+    live on one shard, recorded in the directory as users.shard. New users
+    are placed by a stable hash of their id, moving a user is the job of
+    app.services.shard_rebalance.
+    """
+
+    def __init__(self, urls: list[str]):
+        self.urls = urls
+        #shard 0 reuses the default engines and session factories
+        self._engines = {DIRECTORY_SHARD: engine}
+        self._async_engines: dict[int, AsyncEngine] = {DIRECTORY_SHARD: async_engine}
+        self._sessions = {DIRECTORY_SHARD: SessionLocal}
+        self._async_sessions = {DIRECTORY_SHARD: AsyncSessionLocal}
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def placement(self, user_id: str) -> int:
+        """
+        Shard a user belongs on with the current shard count. Jump consistent
+        hashing: adding a shard only moves the users that now belong on it.
+        """
+        key = int.from_bytes(hashlib.sha256(user_id.encode()).digest()[:8], "big")
+        shard, candidate = -1, 0
+        while candidate < len(self.urls):
+            shard = candidate
+            key = (key * 2862933555777941757 + 1) % 2**64
+            candidate = int((shard + 1) * ((1 << 31) / ((key >> 33) + 1)))
+        return shard
+
+    def shard_of(self, user) -> int:
+        """Shard currently holding a directory user's data"""
+        return user.shard if user.shard is not None else DIRECTORY_SHARD
+
+    def _check(self, shard: int) -> None:
+        if not 0 <= shard < len(self.urls):
+            raise ValueError(f"Unknown shard {shard} ({len(self.urls)} configured)")
+
+    def sessions(self, shard: int) -> sessionmaker:
+        """Blocking session factory of a shard, for scripts and tooling"""
+        self._check(shard)
+        if shard not in self._sessions:
+            self._engines[shard] = build_engine(self.urls[shard])
+            self._sessions[shard] = sessionmaker(
+                class_=SyncSession, autocommit=False, autoflush=False,
+                bind=self._engines[shard], info={"shard": shard}
+            )
+        return self._sessions[shard]
+
+    def async_sessions(self, shard: int) -> async_sessionmaker:
+        """Async session factory of a shard, sessions carry info["shard"]"""
+        self._check(shard)
+        if shard not in self._async_sessions:
+            self._async_engines[shard] = build_async_engine(async_database_url(self.urls[shard]))
+            self._async_sessions[shard] = async_sessionmaker(
+                self._async_engines[shard],
+                sync_session_class=SyncSession,
+                autoflush=False,
+                expire_on_commit=False,
+                info={"shard": shard}
+            )
+        return self._async_sessions[shard]
+
+    def user_sessions(self, user) -> async_sessionmaker:
+        return self.async_sessions(self.shard_of(user))
+
+    async def dispose(self) -> None:
+        for shard, shard_engine in self._async_engines.items():
+            if shard != DIRECTORY_SHARD:
+                await shard_engine.dispose()
+        for shard, shard_engine in self._engines.items():
+            if shard != DIRECTORY_SHARD:
+                shard_engine.dispose()
+
+
+def ensure_shard_user(db: Session, user_id: str) -> None:
+    """
+    Placeholder users row on a shard other than the directory, for the
+    foreign keys of the user's data. The account itself stays in the directory.
+    """
+    if db.get(User, user_id) is None:
+        db.add(User(id=user_id, email=user_id, hashed_password=""))
+
+
+def session_shard(db) -> int:
+    """Shard a (blocking or async) session belongs to"""
+    return db.info.get("shard", DIRECTORY_SHARD)
+
+
+shard_map = ShardMap([settings.database_url, *settings.SHARD_DATABASE_URLS])
@@ -1,17 +1,55 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from app.core.database import engine, Base
-from app.routers import auth, collections, cards, review_logs, sync
+from app.core.compression import CompressionMiddleware
+from app.core.database import async_engine
+from app.core.metrics import render_metrics
+from app.core.sharding import shard_map
+from app.routers import auth, collections, cards, review_logs, sync, scheduler, stats
+from app.services.auth_cache import auth_cache
+from app.services.email_outbox import email_dispatcher
+from app.services.maintenance import maintenance
+from app.services.notifications import notifier, OriginDeviceMiddleware
+from app.services.password_hasher import password_hasher
+from app.services.rate_limit import login_limiter
+from app.services.read_replicas import replica_router
+from app.services.write_pipeline import start_pipelines, stop_pipelines
 
 from app.core.config import settings
 
-Base.metadata.create_all(bind=engine)
+#the schema is managed by Alembic: run `alembic upgrade head` before starting the app
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await notifier.start()
+    await auth_cache.start()
+    if settings.SQLITE_WRITE_PIPELINE:
+        await start_pipelines()
+    await replica_router.start()
+    await email_dispatcher.start()
+    await maintenance.start()
+    yield
+    await maintenance.stop()
+    await email_dispatcher.stop()
+    await replica_router.stop()
+    await stop_pipelines()
+    await auth_cache.stop()
+    await notifier.stop()
+    password_hasher.shutdown()
+    await login_limiter.close()
+    await shard_map.dispose()
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="FlashCards API",
     description="FlashCards",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -22,11 +60,16 @@ app.add_middleware(
     allow_headers=settings.allowed_headers,
 )
 
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_BYTES)
+app.add_middleware(OriginDeviceMiddleware)
+
 app.include_router(auth.router)
 app.include_router(collections.router)
 app.include_router(cards.router)
 app.include_router(review_logs.router)
 app.include_router(sync.router)
+app.include_router(scheduler.router)
+app.include_router(stats.router)
 
 
 @app.get("/")
@@ -41,6 +84,12 @@ def health():
     return {"status": "healthy", "version": "1.0.0"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics of this worker"""
+    return render_metrics()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
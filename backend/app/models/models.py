@@ -1,5 +1,5 @@
-from datetime import datetime, timezone
-from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey, Index, JSON, text
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
@@ -7,9 +7,20 @@ from app.core.database import Base
 #user model matching flutter user_model.dart
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        #expired registration cleanup, pending registrations only
+        Index(
+            "ix_users_unverified_expires", "email_verification_expires",
+            sqlite_where=text("is_email_verified = 0 AND is_deleted = 0"),
+            postgresql_where=text("is_email_verified = false AND is_deleted = false"),
+        ),
+    )
 
     id = Column(String, primary_key=True)
     email = Column(String, unique=True, index=True, nullable=False)
+    #set while a deleted account's email is lent to a pending registration
+    #(email is then deleted_{id}_{original_email})
+    original_email = Column(String, nullable=True, index=True)
     hashed_password = Column(String, nullable=False)
     display_name = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -19,9 +30,12 @@ class User(Base):
     version = Column(Integer, default=1, nullable=False)
     
     is_email_verified = Column(Boolean, default=False, nullable=False)
-    email_verification_token = Column(String, nullable=True)
     email_verification_expires = Column(DateTime, nullable=True)
 
+    #shard holding the user's data (NULL: shard 0), set while the data is being moved
+    shard = Column(Integer, nullable=True)
+    shard_moving = Column(Boolean, default=False, nullable=False)
+
 
     collections = relationship("Collection", back_populates="user", cascade="all, delete-orphan")
     cards = relationship("Card", back_populates="user", cascade="all, delete-orphan")
@@ -31,15 +45,18 @@ class User(Base):
 #collection model matching Flutter collection_model.dart
 class Collection(Base):
     __tablename__ = "collections"
+    __table_args__ = (
+        Index("ix_collections_user_updated", "user_id", "updated_at"),
+    )
 
     id = Column(String, primary_key=True)
-    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
     name = Column(String, nullable=False)
     description = Column(String, nullable=True)
     tags = Column(String, nullable=True)  #comma separated
     color = Column(String, nullable=True)  #hex
-    created_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     is_deleted = Column(Boolean, default=False, nullable=False)
     version = Column(Integer, default=1, nullable=False)
 
@@ -51,10 +68,20 @@ class Collection(Base):
 #card model matching Flutter card_model.dart
 class Card(Base):
     __tablename__ = "cards"
+    __table_args__ = (
+        Index("ix_cards_user_updated", "user_id", "updated_at"),
+        Index("ix_cards_user_collection", "user_id", "collection_id"),
+        #due queue, live cards only
+        Index(
+            "ix_cards_user_due", "user_id", "next_review_date", "id",
+            sqlite_where=text("is_deleted = 0"),
+            postgresql_where=text("is_deleted = false"),
+        ),
+    )
 
     id = Column(String, primary_key=True)
     collection_id = Column(String, ForeignKey("collections.id"), nullable=False, index=True)
-    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
     front = Column(String, nullable=False)
     back = Column(String, nullable=False)
     
@@ -79,10 +106,14 @@ class Card(Base):
 #reviewLog model matching Flutter review_log.dart
 class ReviewLog(Base):
     __tablename__ = "review_logs"
+    __table_args__ = (
+        Index("ix_review_logs_user_created", "user_id", "created_at"),
+        Index("ix_review_logs_user_reviewed", "user_id", "reviewed_at"),
+    )
 
     id = Column(String, primary_key=True)
     card_id = Column(String, ForeignKey("cards.id"), nullable=False, index=True)
-    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
     quality = Column(String, nullable=False)  # 'wrong', 'hard', 'good', 'easy', 'perfect'
     reviewed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
@@ -97,3 +128,100 @@ class ReviewLog(Base):
 
     card = relationship("Card", back_populates="review_logs")
     user = relationship("User", back_populates="review_logs")
+
+
+#append-only per-user change feed, one row per mutation of a synced entity
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index("ix_change_log_user_seq", "user_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    entity_type = Column(String, nullable=False)  # 'collection', 'card', 'review_log'
+    entity_id = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+#per-user state digest, bumped in the same transaction as every change
+#collection_id "" is the digest of the whole account
+class SyncDigest(Base):
+    __tablename__ = "sync_digests"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    collection_id = Column(String, primary_key=True)
+    revision = Column(Integer, default=0, nullable=False)
+
+
+#reviews per user, collection and UTC hour, kept by app.services.review_stats in the
+#same transaction as the review logs. collection_id "" holds the user's totals
+class ReviewStats(Base):
+    __tablename__ = "review_stats"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    collection_id = Column(String, primary_key=True)
+    hour = Column(DateTime, primary_key=True)  #start of the UTC hour
+    reviews = Column(Integer, default=0, nullable=False)
+    wrong = Column(Integer, default=0, nullable=False)
+    hard = Column(Integer, default=0, nullable=False)
+    good = Column(Integer, default=0, nullable=False)
+    easy = Column(Integer, default=0, nullable=False)
+    perfect = Column(Integer, default=0, nullable=False)
+
+
+#transactional outbox of account emails, written with the change that triggers them
+#and sent by app.services.email_outbox
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        #dispatcher queue, unsent messages only
+        Index(
+            "ix_email_outbox_due", "next_attempt_at",
+            sqlite_where=text("status = 'pending'"),
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    template = Column(String, nullable=False)  # 'verification', 'password_reset'
+    recipient = Column(String, nullable=False)
+    context = Column(JSON, nullable=False)  #template variables
+    status = Column(String, default="pending", nullable=False)  # 'pending', 'sent', 'failed'
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+
+#single-use email link tokens (verification, password reset), only the
+#sha256 of a token is stored, see app.services.one_time_tokens
+class OneTimeToken(Base):
+    __tablename__ = "one_time_tokens"
+    __table_args__ = (
+        Index("ix_one_time_tokens_user_purpose", "user_id", "purpose"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    token_hash = Column(String, unique=True, index=True, nullable=False)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    purpose = Column(String, nullable=False)  # 'verify_email', 'reset_password'
+    expires_at = Column(DateTime, index=True, nullable=False)
+    used_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+#FSRS weights fitted to a user's review logs by app.services.scheduler.optimizer,
+#kept in the directory next to the account
+class SchedulerParameters(Base):
+    __tablename__ = "scheduler_parameters"
+
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    weights = Column(JSON, nullable=False)  #19 FSRS weights
+    request_retention = Column(Float, nullable=False)
+    review_count = Column(Integer, nullable=False)  #review logs the fit saw
+    log_loss = Column(Float, nullable=False)
+    default_log_loss = Column(Float, nullable=False)  #of the default weights on the same reviews
+    fitted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -1,5 +1,5 @@
 from datetime import timedelta, datetime
-from typing import Annotated
+from typing import Annotated, AsyncIterator
 from uuid import uuid4
 from pathlib import Path
 
@@ -7,19 +7,33 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.database import get_db
-from app.core.security import verify_password, get_password_hash, create_access_token, decode_access_token
+from app.core.sharding import shard_map, ensure_shard_user, DIRECTORY_SHARD
+from app.core.security import create_access_token
 from app.models.models import User
+from app.services.auth_cache import auth_cache
+from app.services.maintenance import remove_registrations, purge_registration_shards
+from app.services.password_hasher import password_hasher
+from app.services.rate_limit import login_limiter
+from app.services.read_replicas import replica_router
 from app.schemas.schemas import UserCreate, UserLogin, Token, TokenWithUser, UserResponse, UserUpdate, PasswordResetRequest, PasswordReset, PasswordChange
 from app.services.email_service import (
-    send_verification_email, 
-    send_password_reset_email,
-    generate_verification_token,
+    queue_verification_email,
+    queue_password_reset_email,
     get_verification_expiry
 )
+from app.services.one_time_tokens import (
+    VERIFY_EMAIL,
+    RESET_PASSWORD,
+    issue_token,
+    peek_token,
+    consume_token,
+    token_expired
+)
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
@@ -29,12 +43,8 @@ templates = Jinja2Templates(directory=str(templates_dir))
 security = HTTPBearer()
 
 
-def get_current_user(
-    credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
-    db: Session = Depends(get_db)
-) -> User:
-    token = credentials.credentials
-    payload = decode_access_token(token)
+def _token_user_id(credentials: HTTPAuthorizationCredentials) -> str:
+    payload = auth_cache.tokens.decode(credentials.credentials)
     
     if payload is None:
         raise HTTPException(
@@ -49,60 +59,107 @@ def get_current_user(
             detail="Could not validate credentials"
         )
     
-    user = db.query(User).filter(User.id == user_id, User.is_deleted == False).first()
+    return user_id
+
+
+async def _load_user(db: AsyncSession, user_id: str) -> User:
+    user = await db.scalar(select(User).where(User.id == user_id, User.is_deleted == False))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
-    
+    return user
+
+
+def _check_verified(user: User) -> None:
     if settings.ENABLE_EMAIL_VERIFICATION and not user.is_email_verified:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Email not verified. Please verify your email to continue."
         )
-    
-    return user
 
 
-def cleanup_expired_registrations(db: Session):
+async def get_current_user(
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
+    db: AsyncSession = Depends(get_db)
+) -> User:
     """
-    Clean up expired unverified registrations and restore renamed emails.
-    Called during registration to keep the database clean.
+    Authenticated user, from the auth cache when it holds the row. The row is
+    detached and shared between requests: handlers that modify the user
+    depend on get_current_user_for_update instead.
     """
-    import re
-    
-    expired_users = db.query(User).filter(
-        User.is_email_verified == False,
-        User.is_deleted == False,
-        User.email_verification_expires < datetime.utcnow()
-    ).all()
-    
-    for expired_user in expired_users:
-        #deleted_{uuid}_{original_email}
-        pattern = f"deleted_%_{expired_user.email}"
-        old_deleted_user = db.query(User).filter(
-            User.email.like(pattern),
-            User.is_deleted == True
-        ).first()
-        
-        if old_deleted_user:
-            #deleted_{uuid}_{original_email}
-            match = re.match(r'^deleted_[^_]+_(.+)$', old_deleted_user.email)
-            if match:
-                original_email = match.group(1)
-                old_deleted_user.email = original_email
-        
-        db.delete(expired_user)
+    user_id = _token_user_id(credentials)
     
-    if expired_users:
-        db.commit()
+    user = auth_cache.users.get(user_id)
+    if user is None:
+        generation = auth_cache.users.generation
+        user = await _load_user(db, user_id)
+        db.expunge(user)
+        auth_cache.users.put(user, generation)
+    
+    _check_verified(user)
+    return user
 
 
-@router.post("/register", response_model=TokenWithUser)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def get_current_user_for_update(
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """Authenticated user loaded in the request's session, bypassing the auth cache"""
+    user = await _load_user(db, _token_user_id(credentials))
+    _check_verified(user)
+    return user
+
+
+async def get_user_db(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> AsyncIterator[AsyncSession]:
+    """Dependency for a session on the shard holding the current user's data"""
+    if current_user.shard_moving:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Account data is being moved, please retry shortly",
+            headers={"Retry-After": "2"}
+        )
     
-    cleanup_expired_registrations(db)
+    shard = shard_map.shard_of(current_user)
+    if shard == DIRECTORY_SHARD:
+        yield db
+        return
+    
+    async with shard_map.async_sessions(shard)() as shard_db:
+        yield shard_db
+
+
+async def get_read_db(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_user_db)
+) -> AsyncIterator[AsyncSession]:
+    """Dependency for read-only handlers: a replica session once replicas have the user's last write"""
+    replica_sessions = await replica_router.read_sessions(current_user)
+    if replica_sessions is None:
+        yield db
+        return
+    
+    async with replica_sessions() as replica_db:
+        yield replica_db
+
+
+async def _place_user(user: User) -> None:
+    """Pick the shard of a new user, its placeholder row there is written before the account"""
+    user.shard = shard_map.placement(user.id)
+    if user.shard == DIRECTORY_SHARD:
+        return
+    
+    async with shard_map.async_sessions(user.shard)() as shard_db:
+        await shard_db.run_sync(ensure_shard_user, user.id)
+        await shard_db.commit()
+
+
+@router.post("/register", response_model=TokenWithUser)
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     
     if not settings.ENABLE_REGISTRATION:
         raise HTTPException(
@@ -116,7 +173,16 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
             detail=f"Password must be at least {settings.MIN_PASSWORD_LENGTH} characters"
         )
     
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user_data.email))
+    
+    expired_registrations = []
+    if (existing_user and not existing_user.is_deleted and not existing_user.is_email_verified
+            and existing_user.email_verification_expires
+            and existing_user.email_verification_expires < datetime.utcnow()):
+        #abandoned before verification, the maintenance job just has not reached it yet
+        expired_registrations = await db.run_sync(remove_registrations, [existing_user])
+        db.expunge(existing_user)
+        existing_user = await db.scalar(select(User).where(User.email == user_data.email))
     
     if existing_user and not existing_user.is_deleted:
         raise HTTPException(
@@ -128,32 +194,39 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     if existing_user and existing_user.is_deleted:
         original_email_backup = existing_user.email
         existing_user.email = f"deleted_{existing_user.id}_{original_email_backup}"
-        db.flush()
+        existing_user.original_email = original_email_backup
+        await db.flush()
     
-    verification_token = generate_verification_token()
     verification_expires = get_verification_expiry()
     
     user = User(
         id=str(uuid4()),
         email=user_data.email,
         display_name=user_data.display_name,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=await password_hasher.hash(user_data.password),
         is_email_verified=not settings.ENABLE_EMAIL_VERIFICATION,
-        email_verification_token=verification_token,
         email_verification_expires=verification_expires
     )
     
+    await _place_user(user)
     db.add(user)
-    db.commit()
-    db.refresh(user)
     
+    #sent by the outbox dispatcher once the account is committed
     if settings.ENABLE_EMAIL_VERIFICATION:
-        await send_verification_email(
+        queue_verification_email(
+            db,
             email=user.email,
-            token=verification_token,
+            token=await issue_token(db, user.id, VERIFY_EMAIL),
             user_name=user.display_name
         )
     
+    await db.commit()
+    await db.refresh(user)
+    
+    if expired_registrations:
+        await purge_registration_shards(expired_registrations)
+        await auth_cache.invalidate(*(u.id for u in expired_registrations))
+    
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
         data={"sub": user.id}, expires_delta=access_token_expires
@@ -173,19 +246,23 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=TokenWithUser)
-def login(credentials: UserLogin, db: Session = Depends(get_db)):
-    """Login with email and password"""
-    user = db.query(User).filter(
+async def login(credentials: UserLogin, request: Request, db: AsyncSession = Depends(get_db)):
+    """Login with email and password, attempts are rate limited per email and per client IP"""
+    await login_limiter.check(credentials.email, request.client.host if request.client else None)
+    
+    user = await db.scalar(select(User).where(
         User.email == credentials.email,
         User.is_deleted == False
-    ).first()
+    ))
     
-    if not user or not verify_password(credentials.password, user.hashed_password):
+    if not user or not await password_hasher.verify(credentials.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
     
+    await login_limiter.succeeded(credentials.email)
+    
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
         data={"sub": user.id}, expires_delta=access_token_expires
@@ -206,7 +283,7 @@ def login(credentials: UserLogin, db: Session = Depends(get_db)):
 
 
 @router.get("/me", response_model=UserResponse)
-def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: User = Depends(get_current_user)):
     """Get current user information"""
     return current_user
 
@@ -214,8 +291,8 @@ def get_me(current_user: User = Depends(get_current_user)):
 @router.put("/profile", response_model=UserResponse)
 async def update_profile(
     user_update: UserUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_for_update),
+    db: AsyncSession = Depends(get_db)
 ):
     """Update current user profile"""
     
@@ -225,11 +302,11 @@ async def update_profile(
         current_user.display_name = user_update.display_name if user_update.display_name else None
     
     if user_update.email is not None and user_update.email != current_user.email:
-        existing_user = db.query(User).filter(
+        existing_user = await db.scalar(select(User).where(
             User.email == user_update.email,
             User.id != current_user.id,
             User.is_deleted == False
-        ).first()
+        ))
         
         if existing_user:
             raise HTTPException(
@@ -238,25 +315,23 @@ async def update_profile(
             )
         
         if settings.ENABLE_EMAIL_VERIFICATION:
-            verification_token = generate_verification_token()
-            verification_expires = get_verification_expiry()
-            
             current_user.email = user_update.email
             current_user.is_email_verified = False
-            current_user.email_verification_token = verification_token
-            current_user.email_verification_expires = verification_expires
+            current_user.email_verification_expires = get_verification_expiry()
             email_changed = True
             
-            await send_verification_email(
+            queue_verification_email(
+                db,
                 email=user_update.email,
-                token=verification_token,
+                token=await issue_token(db, current_user.id, VERIFY_EMAIL),
                 user_name=current_user.display_name
             )
         else:
             current_user.email = user_update.email
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await auth_cache.invalidate(current_user.id)
+    await db.refresh(current_user)
     
     #verification is required, raise 403 to force re-login
     if email_changed:
@@ -269,42 +344,39 @@ async def update_profile(
 
 
 @router.get("/verify-email")
-async def verify_email(token: str, db: Session = Depends(get_db)):
+async def verify_email(token: str, db: AsyncSession = Depends(get_db)):
     """Verify user email address"""
 
-    user = db.query(User).filter(
-        User.email_verification_token == token,
-        User.is_deleted == False
-    ).first()
+    user_id = await consume_token(db, token, VERIFY_EMAIL)
+    user = await db.get(User, user_id) if user_id else None
     
-    if not user:
+    if not user or user.is_deleted:
+        if await token_expired(db, token, VERIFY_EMAIL):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Verification token has expired"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid verification token"
         )
     
-    if user.email_verification_expires and user.email_verification_expires < datetime.utcnow():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Verification token has expired"
-        )
-    
     if user.is_email_verified:
         return {"message": "Email already verified"}
     
-    old_deleted_user = db.query(User).filter(
-        User.email.like(f"deleted_%_{user.email}"),
+    old_deleted_user = await db.scalar(select(User).where(
+        User.original_email == user.email,
         User.is_deleted == True
-    ).first()
+    ))
     
     if old_deleted_user:
-        db.delete(old_deleted_user)
+        await db.delete(old_deleted_user)
     
     user.is_email_verified = True
-    user.email_verification_token = None
     user.email_verification_expires = None
     
-    db.commit()
+    await db.commit()
+    await auth_cache.invalidate(user.id)
     
     return {"message": "Email verified successfully"}
 
@@ -312,7 +384,7 @@ async def verify_email(token: str, db: Session = Depends(get_db)):
 @router.post("/resend-verification")
 async def resend_verification(
     email: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Resend email verification"""
     
@@ -322,10 +394,10 @@ async def resend_verification(
             detail="Email verification is not enabled"
         )
     
-    user = db.query(User).filter(
+    user = await db.scalar(select(User).where(
         User.email == email,
         User.is_deleted == False
-    ).first()
+    ))
     
     if not user:
         return {"message": "If the email exists, a verification email will be sent"}
@@ -336,27 +408,24 @@ async def resend_verification(
             detail="Email is already verified"
         )
     
-    verification_token = generate_verification_token()
-    verification_expires = get_verification_expiry()
-    
-    user.email_verification_token = verification_token
-    user.email_verification_expires = verification_expires
+    user.email_verification_expires = get_verification_expiry()
     
-    db.commit()
-    
-    await send_verification_email(
+    queue_verification_email(
+        db,
         email=user.email,
-        token=verification_token,
+        token=await issue_token(db, user.id, VERIFY_EMAIL),
         user_name=user.display_name
     )
     
+    await db.commit()
+    
     return {"message": "Verification email sent"}
 
 
 @router.post("/forgot-password")
 async def forgot_password(
     request: PasswordResetRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Request password reset"""
     
@@ -366,28 +435,23 @@ async def forgot_password(
             detail="Password reset is currently disabled"
         )
     
-    user = db.query(User).filter(
+    user = await db.scalar(select(User).where(
         User.email == request.email,
         User.is_deleted == False
-    ).first()
+    ))
     
     if not user:
         return {"message": "If the email exists, a password reset link will be sent"}
     
-    reset_token = generate_verification_token()
-    reset_expires = get_verification_expiry()
-    
-    user.email_verification_token = reset_token
-    user.email_verification_expires = reset_expires
-    
-    db.commit()
-    
-    await send_password_reset_email(
+    queue_password_reset_email(
+        db,
         email=user.email,
-        token=reset_token,
+        token=await issue_token(db, user.id, RESET_PASSWORD),
         user_name=user.display_name
     )
     
+    await db.commit()
+    
     return {"message": "If the email exists, a password reset link will be sent"}
 
 #for safe fallback
@@ -401,38 +465,42 @@ async def reset_password_form(request: Request, token: str):
 @router.post("/reset-password")
 async def reset_password(
     reset_data: PasswordReset,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Reset password with token (API endpoint)"""
     
-    user = db.query(User).filter(
-        User.email_verification_token == reset_data.token,
-        User.is_deleted == False
-    ).first()
-    
-    if not user:
+    if not await peek_token(db, reset_data.token, RESET_PASSWORD):
+        if await token_expired(db, reset_data.token, RESET_PASSWORD):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Reset token has expired"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or expired reset token"
         )
     
-    if user.email_verification_expires and user.email_verification_expires < datetime.utcnow():
+    if len(reset_data.new_password) < settings.MIN_PASSWORD_LENGTH:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Reset token has expired"
+            detail=f"Password must be at least {settings.MIN_PASSWORD_LENGTH} characters"
         )
     
-    if len(reset_data.new_password) < settings.MIN_PASSWORD_LENGTH:
+    #hashed before the token is used, so its write lock is not held during bcrypt
+    hashed_password = await password_hasher.hash(reset_data.new_password)
+    
+    user_id = await consume_token(db, reset_data.token, RESET_PASSWORD)
+    user = await db.get(User, user_id) if user_id else None
+    if not user or user.is_deleted:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Password must be at least {settings.MIN_PASSWORD_LENGTH} characters"
+            detail="Invalid or expired reset token"
         )
     
-    user.hashed_password = get_password_hash(reset_data.new_password)
-    user.email_verification_token = None
-    user.email_verification_expires = None
+    user.hashed_password = hashed_password
     
-    db.commit()
+    await db.commit()
+    await auth_cache.invalidate(user.id)
     
     return {"message": "Password reset successfully"}
 
@@ -440,19 +508,20 @@ async def reset_password(
 @router.delete("/me")
 async def delete_account(
     password: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_for_update),
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete the current user's account (soft delete)"""
     
-    if not verify_password(password, current_user.hashed_password):
+    if not await password_hasher.verify(password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect password"
         )
     
     current_user.is_deleted = True
-    db.commit()
+    await db.commit()
+    await auth_cache.invalidate(current_user.id)
     
     return {"message": "Account deleted successfully"}
 
@@ -460,12 +529,12 @@ async def delete_account(
 @router.post("/change-password")
 async def change_password(
     password_change: PasswordChange,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_for_update),
+    db: AsyncSession = Depends(get_db)
 ):
     """Change password for authenticated user"""
     
-    if not verify_password(password_change.current_password, current_user.hashed_password):
+    if not await password_hasher.verify(password_change.current_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
@@ -477,13 +546,14 @@ async def change_password(
             detail=f"Password must be at least {settings.MIN_PASSWORD_LENGTH} characters"
         )
     
-    if verify_password(password_change.new_password, current_user.hashed_password):
+    if await password_hasher.verify(password_change.new_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="New password must be different from current password"
         )
     
-    current_user.hashed_password = get_password_hash(password_change.new_password)
-    db.commit()
+    current_user.hashed_password = await password_hasher.hash(password_change.new_password)
+    await db.commit()
+    await auth_cache.invalidate(current_user.id)
     
     return {"message": "Password changed successfully"}
@@ -2,50 +2,108 @@ from uuid import uuid4
 from typing import List, Optional
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.config import settings
 from app.models.models import User, Card, Collection
-from app.routers.auth import get_current_user
-from app.schemas.schemas import CardCreate, CardUpdate, CardResponse
+from app.routers.auth import get_current_user, get_user_db, get_read_db
+from app.services.change_feed import head_seq, changed_ids, resolve_after_seq
+from app.services.due_queue import due_page, due_counts, encode_due_cursor, decode_due_cursor, InvalidDueCursor
+from app.services.read_replicas import replica_router
+from app.services.streaming import wants_ndjson, ndjson_response, stream_rows
+from app.services.wire_format import wants_msgpack, msgpack_list_response
+from app.services.write_pipeline import run_write
+from app.schemas.schemas import CardCreate, CardUpdate, CardResponse, DueCardsResponse
 
 router = APIRouter(prefix="/api/cards", tags=["cards"])
 
 
 @router.get("", response_model=List[CardResponse])
-def get_cards(
+async def get_cards(
+    request: Request,
+    response: Response,
     collection_id: Optional[str] = None,
     since: Optional[str] = None,
+    after_seq: Optional[int] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all cards for the current user, optionally filtered by collection and update time"""
-    query = db.query(Card).filter(Card.user_id == current_user.id)
+    """
+    Get all cards for the current user, optionally filtered by collection and change feed position.
+    Streamed one card per line when Accept is application/x-ndjson,
+    MessagePack (columnar) when Accept is application/x-msgpack.
+    """
+    query = select(Card).where(Card.user_id == current_user.id)
     
     if collection_id:
-        query = query.filter(Card.collection_id == collection_id)
+        query = query.where(Card.collection_id == collection_id)
     
-    if since:
-        from datetime import datetime
-        since_dt = datetime.fromisoformat(since.replace('Z', '+00:00'))
-        query = query.filter(Card.updated_at > since_dt)
+    #head is read first so nothing committed meanwhile is skipped by the client's next call
+    change_seq = str(await db.run_sync(head_seq, current_user.id))
+    response.headers["X-Change-Seq"] = change_seq
+    
+    after_seq = await db.run_sync(resolve_after_seq, current_user.id, since, after_seq)
+    if after_seq is not None:
+        query = query.where(Card.id.in_(changed_ids(current_user.id, "card", after_seq)))
+    
+    if wants_ndjson(request):
+        return ndjson_response(stream_rows(query, CardResponse, replica_router.factory_of(db)), headers={"X-Change-Seq": change_seq})
+    
+    cards = (await db.scalars(query)).all()
+    
+    if wants_msgpack(request):
+        return msgpack_list_response((CardResponse.model_validate(c) for c in cards), headers={"X-Change-Seq": change_seq})
     
-    cards = query.all()
     return cards
 
 
+@router.get("/due", response_model=DueCardsResponse)
+async def get_due_cards(
+    collection_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(default=None, ge=1),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Cards due for review, new cards first then by next review date, in
+    pages of `limit` (DUE_PAGE_SIZE by default). Send next_cursor back as
+    cursor for the next page, it is null on the last one. The first page
+    also carries the number of due cards per collection.
+    """
+    try:
+        after = decode_due_cursor(cursor) if cursor else None
+    except InvalidDueCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    limit = min(limit or settings.DUE_PAGE_SIZE, settings.DUE_MAX_PAGE_SIZE)
+    now = datetime.utcnow()
+    cards, position = await db.run_sync(due_page, current_user.id, collection_id, after, limit, now)
+    
+    return DueCardsResponse(
+        cards=[CardResponse.model_validate(c) for c in cards],
+        next_cursor=encode_due_cursor(position) if position else None,
+        due_counts=await db.run_sync(due_counts, current_user.id, now) if after is None else None
+    )
+
+
 @router.get("/{card_id}", response_model=CardResponse)
-def get_card(
+async def get_card(
     card_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Get a specific card"""
-    card = db.query(Card).filter(
+    card = await db.scalar(select(Card).where(
         Card.id == card_id,
         Card.user_id == current_user.id
-    ).first()
+    ))
     
     if not card:
         raise HTTPException(
@@ -57,17 +115,20 @@ def get_card(
 
 
 @router.post("", response_model=CardResponse)
-def create_card(
+async def create_card(
     card_data: CardCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Create a new card (or update if exists during sync)"""
+    return await run_write(db, _create_card, current_user.id, card_data)
+
 
-    collection = db.query(Collection).filter(
+def _create_card(db: Session, user_id: str, card_data: CardCreate) -> Card:
+    collection = db.scalar(select(Collection).where(
         Collection.id == card_data.collection_id,
-        Collection.user_id == current_user.id
-    ).first()
+        Collection.user_id == user_id
+    ))
     
     if not collection:
         raise HTTPException(
@@ -76,10 +137,10 @@ def create_card(
         )
     
     card_id = card_data.id or str(uuid4())
-    existing_card = db.query(Card).filter(
+    existing_card = db.scalar(select(Card).where(
         Card.id == card_id,
-        Card.user_id == current_user.id
-    ).first()
+        Card.user_id == user_id
+    ))
     
     if existing_card:
         existing_card.collection_id = card_data.collection_id
@@ -100,37 +161,37 @@ def create_card(
         if hasattr(card_data, 'version') and card_data.version is not None:
             existing_card.version = card_data.version
             
-        db.commit()
-        db.refresh(existing_card)
         return existing_card
     
     card = Card(
         id=card_id,
-        user_id=current_user.id,
+        user_id=user_id,
         collection_id=card_data.collection_id,
         front=card_data.front,
         back=card_data.back
     )
     
     db.add(card)
-    db.commit()
-    db.refresh(card)
     
     return card
 
 
 @router.put("/{card_id}", response_model=CardResponse)
-def update_card(
+async def update_card(
     card_id: str,
     card_data: CardUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Update a card (used for sync and spaced repetition)"""
-    card = db.query(Card).filter(
+    return await run_write(db, _update_card, current_user.id, card_id, card_data)
+
+
+def _update_card(db: Session, user_id: str, card_id: str, card_data: CardUpdate) -> Card:
+    card = db.scalar(select(Card).where(
         Card.id == card_id,
-        Card.user_id == current_user.id
-    ).first()
+        Card.user_id == user_id
+    ))
     
     if not card:
         raise HTTPException(
@@ -163,24 +224,26 @@ def update_card(
     
     card.version = card_data.version
     
-    db.commit()
-    db.refresh(card)
-    
     return card
 
 
 @router.delete("/{card_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_card(
+async def delete_card(
     card_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Soft delete a card"""
+    await run_write(db, _delete_card, current_user.id, card_id)
     
-    card = db.query(Card).filter(
+    return None
+
+
+def _delete_card(db: Session, user_id: str, card_id: str) -> None:
+    card = db.scalar(select(Card).where(
         Card.id == card_id,
-        Card.user_id == current_user.id
-    ).first()
+        Card.user_id == user_id
+    ))
     
     if not card:
         raise HTTPException(
@@ -190,6 +253,3 @@ def delete_card(
     
     card.is_deleted = True
     card.version += 1
-    db.commit()
-    
-    return None
@@ -2,12 +2,16 @@ from uuid import uuid4
 from typing import List, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
 from app.models.models import User, Collection
-from app.routers.auth import get_current_user
+from app.routers.auth import get_current_user, get_user_db, get_read_db
+from app.services.change_feed import head_seq, changed_ids, resolve_after_seq
+from app.services.wire_format import wants_msgpack, msgpack_list_response
+from app.services.write_pipeline import run_write
 from app.schemas.schemas import CollectionCreate, CollectionUpdate, CollectionResponse
 
 router = APIRouter(prefix="/api/collections", tags=["collections"])
@@ -34,35 +38,48 @@ def collection_to_response(collection: Collection) -> dict:
 
 
 @router.get("")
-def get_collections(
+async def get_collections(
+    request: Request,
+    response: Response,
     since: Optional[str] = None,
+    after_seq: Optional[int] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all collections for the current user, optionally filtered by update time"""
-    query = db.query(Collection).filter(Collection.user_id == current_user.id)
+    """Get all collections for the current user, optionally filtered by change feed position"""
+    query = select(Collection).where(Collection.user_id == current_user.id)
     
-    if since:
-        from datetime import datetime
-        since_dt = datetime.fromisoformat(since.replace('Z', '+00:00'))
-        query = query.filter(Collection.updated_at > since_dt)
+    #head is read first so nothing committed meanwhile is skipped by the client's next call
+    change_seq = str(await db.run_sync(head_seq, current_user.id))
+    response.headers["X-Change-Seq"] = change_seq
+    
+    after_seq = await db.run_sync(resolve_after_seq, current_user.id, since, after_seq)
+    if after_seq is not None:
+        query = query.where(Collection.id.in_(changed_ids(current_user.id, "collection", after_seq)))
+    
+    collections = (await db.scalars(query)).all()
+    
+    if wants_msgpack(request):
+        return msgpack_list_response(
+            (CollectionResponse(**collection_to_response(c)) for c in collections),
+            headers={"X-Change-Seq": change_seq}
+        )
     
-    collections = query.all()
     return [collection_to_response(c) for c in collections]
 
 
 @router.get("/{collection_id}")
-def get_collection(
+async def get_collection(
     collection_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Get a specific collection"""
 
-    collection = db.query(Collection).filter(
+    collection = await db.scalar(select(Collection).where(
         Collection.id == collection_id,
         Collection.user_id == current_user.id
-    ).first()
+    ))
     
     if not collection:
         raise HTTPException(
@@ -74,18 +91,22 @@ def get_collection(
 
 
 @router.post("")
-def create_collection(
+async def create_collection(
     collection_data: CollectionCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Create a new collection (with upsert behavior for sync)"""
+    return await run_write(db, _create_collection, current_user.id, collection_data)
+
+
+def _create_collection(db: Session, user_id: str, collection_data: CollectionCreate) -> dict:
     collection_id = collection_data.id or str(uuid4())
     
-    existing_collection = db.query(Collection).filter(
+    existing_collection = db.scalar(select(Collection).where(
         Collection.id == collection_id,
-        Collection.user_id == current_user.id
-    ).first()
+        Collection.user_id == user_id
+    ))
     
     if existing_collection:
         tags_str = ','.join(collection_data.tags) if collection_data.tags else None
@@ -101,15 +122,14 @@ def create_collection(
         else:
             existing_collection.version = existing_collection.version + 1
         
-        db.commit()
-        db.refresh(existing_collection)
+        db.flush()
         return collection_to_response(existing_collection)
     
     tags_str = ','.join(collection_data.tags) if collection_data.tags else None
     
     collection = Collection(
         id=collection_id,
-        user_id=current_user.id,
+        user_id=user_id,
         name=collection_data.name,
         description=collection_data.description,
         tags=tags_str,
@@ -117,25 +137,27 @@ def create_collection(
     )
     
     db.add(collection)
-    db.commit()
-    db.refresh(collection)
+    db.flush()
     
     return collection_to_response(collection)
 
 
 @router.put("/{collection_id}")
-def update_collection(
+async def update_collection(
     collection_id: str,
     collection_data: CollectionUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Update a collection (used for sync)"""
+    return await run_write(db, _update_collection, current_user.id, collection_id, collection_data)
 
-    collection = db.query(Collection).filter(
+
+def _update_collection(db: Session, user_id: str, collection_id: str, collection_data: CollectionUpdate) -> dict:
+    collection = db.scalar(select(Collection).where(
         Collection.id == collection_id,
-        Collection.user_id == current_user.id
-    ).first()
+        Collection.user_id == user_id
+    ))
     
     if not collection:
         raise HTTPException(
@@ -159,24 +181,28 @@ def update_collection(
         collection.is_deleted = collection_data.is_deleted
     
     collection.version = collection_data.version
-    
-    db.commit()
-    db.refresh(collection)
+    db.flush()
     
     return collection_to_response(collection)
 
 
 @router.delete("/{collection_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_collection(
+async def delete_collection(
     collection_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Soft delete a collection"""
-    collection = db.query(Collection).filter(
+    await run_write(db, _delete_collection, current_user.id, collection_id)
+    
+    return None
+
+
+def _delete_collection(db: Session, user_id: str, collection_id: str) -> None:
+    collection = db.scalar(select(Collection).where(
         Collection.id == collection_id,
-        Collection.user_id == current_user.id
-    ).first()
+        Collection.user_id == user_id
+    ))
     
     if not collection:
         raise HTTPException(
@@ -186,6 +212,3 @@ def delete_collection(
     
     collection.is_deleted = True
     collection.version += 1
-    db.commit()
-    
-    return None
@@ -1,52 +1,81 @@
+from datetime import datetime
 from uuid import uuid4
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
 from app.models.models import User, ReviewLog, Card
-from app.routers.auth import get_current_user
+from app.routers.auth import get_current_user, get_user_db, get_read_db
+from app.services.change_feed import head_seq, changed_ids, resolve_after_seq
+from app.services.read_replicas import replica_router
+from app.services.review_stats import record_reviews
+from app.services.streaming import wants_ndjson, ndjson_response, stream_rows
+from app.services.wire_format import wants_msgpack, msgpack_list_response
+from app.services.write_pipeline import run_write
 from app.schemas.schemas import ReviewLogCreate, ReviewLogResponse
 
 router = APIRouter(prefix="/api/review-logs", tags=["review-logs"])
 
 
 @router.get("", response_model=List[ReviewLogResponse])
-def get_review_logs(
+async def get_review_logs(
+    request: Request,
+    response: Response,
     card_id: Optional[str] = None,
     since: Optional[str] = None,
+    after_seq: Optional[int] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all review logs for the current user"""
+    """
+    Get all review logs for the current user.
+    Streamed when Accept is application/x-ndjson, MessagePack when Accept is application/x-msgpack.
+    """
 
-    query = db.query(ReviewLog).filter(ReviewLog.user_id == current_user.id)
+    query = select(ReviewLog).where(ReviewLog.user_id == current_user.id)
     
     if card_id:
-        query = query.filter(ReviewLog.card_id == card_id)
+        query = query.where(ReviewLog.card_id == card_id)
     
-    if since:
-        from datetime import datetime
-        since_dt = datetime.fromisoformat(since.replace('Z', '+00:00'))
-        query = query.filter(ReviewLog.created_at > since_dt)
+    #head is read first so nothing committed meanwhile is skipped by the client's next call
+    change_seq = str(await db.run_sync(head_seq, current_user.id))
+    response.headers["X-Change-Seq"] = change_seq
+    
+    after_seq = await db.run_sync(resolve_after_seq, current_user.id, since, after_seq)
+    if after_seq is not None:
+        query = query.where(ReviewLog.id.in_(changed_ids(current_user.id, "review_log", after_seq)))
+    
+    query = query.order_by(ReviewLog.reviewed_at.desc())
+    
+    if wants_ndjson(request):
+        return ndjson_response(stream_rows(query, ReviewLogResponse, replica_router.factory_of(db)), headers={"X-Change-Seq": change_seq})
+    
+    logs = (await db.scalars(query)).all()
+    
+    if wants_msgpack(request):
+        return msgpack_list_response((ReviewLogResponse.model_validate(l) for l in logs), headers={"X-Change-Seq": change_seq})
     
-    logs = query.order_by(ReviewLog.reviewed_at.desc()).all()
     return logs
 
 
 @router.post("", response_model=ReviewLogResponse)
-def create_review_log(
+async def create_review_log(
     log_data: ReviewLogCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Create a new review log (or update if exists during sync)"""
-    
-    card = db.query(Card).filter(
+    return await run_write(db, _create_review_log, current_user.id, log_data)
+
+
+def _create_review_log(db: Session, user_id: str, log_data: ReviewLogCreate) -> ReviewLog:
+    card = db.scalar(select(Card).where(
         Card.id == log_data.card_id,
-        Card.user_id == current_user.id
-    ).first()
+        Card.user_id == user_id
+    ))
     
     if not card:
         raise HTTPException(
@@ -55,28 +84,27 @@ def create_review_log(
         )
     
     log_id = log_data.id or str(uuid4())
-    existing_log = db.query(ReviewLog).filter(
+    existing_log = db.scalar(select(ReviewLog).where(
         ReviewLog.id == log_id,
-        ReviewLog.user_id == current_user.id
-    ).first()
+        ReviewLog.user_id == user_id
+    ))
     
     if existing_log:
         return existing_log
     
     log = ReviewLog(
         id=log_id,
-        user_id=current_user.id,
+        user_id=user_id,
         card_id=log_data.card_id,
         quality=log_data.quality,
         interval_before=log_data.interval_before,
         interval_after=log_data.interval_after,
         ease_factor_before=log_data.ease_factor_before,
         ease_factor_after=log_data.ease_factor_after,
-        reviewed_at=log_data.reviewed_at
+        reviewed_at=log_data.reviewed_at or datetime.utcnow()
     )
     
     db.add(log)
-    db.commit()
-    db.refresh(log)
+    record_reviews(db, user_id, [(card.collection_id, log.quality, log.reviewed_at)])
     
     return log
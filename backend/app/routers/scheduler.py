@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.models.models import User, SchedulerParameters
+from app.routers.auth import get_current_user
+from app.services.scheduler import DEFAULT_WEIGHTS, REQUEST_RETENTION
+from app.schemas.schemas import SchedulerParametersResponse
+
+router = APIRouter(prefix="/api/scheduler", tags=["scheduler"])
+
+
+@router.get("/parameters", response_model=SchedulerParametersResponse)
+async def get_scheduler_parameters(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    FSRS weights for the current user's reviews: the ones fitted to their
+    review logs by app.services.scheduler.optimizer, or the defaults.
+    """
+    parameters = await db.get(SchedulerParameters, current_user.id)
+    if parameters is None:
+        return SchedulerParametersResponse(
+            weights=DEFAULT_WEIGHTS.tolist(),
+            request_retention=REQUEST_RETENTION,
+            personalized=False
+        )
+    return SchedulerParametersResponse(
+        weights=parameters.weights,
+        request_retention=parameters.request_retention,
+        personalized=True,
+        review_count=parameters.review_count,
+        log_loss=parameters.log_loss,
+        default_log_loss=parameters.default_log_loss,
+        fitted_at=parameters.fitted_at
+    )
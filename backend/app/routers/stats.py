@@ -0,0 +1,58 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.models import User
+from app.routers.auth import get_current_user, get_read_db
+from app.services.review_stats import range_stats
+from app.schemas.schemas import StatsResponse, StatsDay, ReviewCounts
+
+router = APIRouter(prefix="/api/stats", tags=["stats"])
+
+
+@router.get("", response_model=StatsResponse)
+async def get_stats(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    collection_id: Optional[str] = None,
+    utc_offset_hours: int = Query(default=0, ge=-12, le=14),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Review statistics of the days start..end (inclusive, local days of
+    UTC + utc_offset_hours), of one collection or the whole account.
+    Defaults to the last STATS_DEFAULT_DAYS days up to today. Served from
+    the hourly rollups, so the cost follows the number of days.
+    """
+    end = end or (datetime.utcnow() + timedelta(hours=utc_offset_hours)).date()
+    start = start or end - timedelta(days=settings.STATS_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start is after end"
+        )
+    if (end - start).days + 1 > settings.STATS_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Ranges are limited to {settings.STATS_MAX_DAYS} days"
+        )
+    
+    stats = await db.run_sync(range_stats, current_user.id, collection_id, start, end, utc_offset_hours)
+    totals = stats.totals
+    
+    return StatsResponse(
+        start=start,
+        end=end,
+        utc_offset_hours=utc_offset_hours,
+        collection_id=collection_id,
+        totals=ReviewCounts(**totals),
+        retention=1 - totals["wrong"] / totals["reviews"] if totals["reviews"] else None,
+        days=[StatsDay(day=day, **counts) for day, counts in sorted(stats.days.items())],
+        hours=stats.hours,
+        current_streak=stats.current_streak,
+        longest_streak=stats.longest_streak
+    )
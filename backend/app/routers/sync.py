@@ -1,120 +1,369 @@
-from datetime import datetime
-from typing import Optional
+import json
+from functools import partial
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Header
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
-from app.models.models import User, Collection, Card, ReviewLog
-from app.routers.auth import get_current_user
-from app.schemas.schemas import SyncRequest, SyncResponse, CollectionUpdate, CardUpdate, ReviewLogCreate
-from uuid import uuid4
+from app.core.config import settings
+from app.core.sharding import shard_map
+from app.models.models import User
+from app.routers.auth import get_current_user, get_user_db
+from app.routers.collections import collection_to_response
+from app.schemas.schemas import SyncRequest, SyncResponse, CardResponse, ReviewLogResponse
+from app.services.change_feed import account_digest, head_seq
+from app.services.idempotency import idempotency_store, fingerprint, IdempotencyKeyReused
+from app.services.notifications import notifier, origin_device
+from app.services.read_replicas import replica_router
+from app.services.sync_coalescer import sync_coalescer
+from app.services.streaming import wants_ndjson, ndjson_response, ndjson_line, with_session
+from app.services.wire_format import wants_msgpack, msgpack_model_response
+from app.services.write_pipeline import run_write
+from app.services.sync_engine import (
+    apply_push,
+    count_sync_items,
+    start_seq,
+    pull_page,
+    iter_pull_pages,
+    sync_digests,
+    unchanged_collections,
+    encode_cursor,
+    is_continuation,
+    InvalidCursor
+)
 
 router = APIRouter(prefix="/api/sync", tags=["sync"])
 
 
 @router.post("", response_model=SyncResponse)
-def sync(
+async def sync(
     sync_data: SyncRequest,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """
     Sync endpoint for offline-first architecture.
     Accepts local changes and returns server changes since last sync.
-    Implements Last Write Wins conflict resolution based on updated_at timestamps.
+    Implements Last Write Wins conflict resolution based on version numbers.
+    Pushed items are applied in batches of SYNC_BATCH_SIZE.
+    Server changes are read from the per-user change feed and returned in
+    pages of at most SYNC_PAGE_SIZE items. Keep next_cursor and send it as
+    cursor on the next call: while has_more is set that fetches the next
+    page, afterwards it only returns changes made since. A dropped
+    connection resumes from the last cursor.
+    With Accept: application/x-ndjson the whole pull is streamed instead
+    (limit is ignored), see _sync_lines. With Accept: application/x-msgpack
+    the page is MessagePack encoded with columnar entity lists.
+    Retries may send the same Idempotency-Key header: the first result is
+    replayed (Idempotent-Replayed: true) without touching the database, and a
+    duplicate that arrives while the original is running waits for it.
+    Streamed syncs are not replayed.
+    The last page of a pull carries the account digest (also sent as ETag)
+    and one digest per collection. A sync that pushes nothing and sends the
+    account digest in If-None-Match gets 304 Not Modified after a single
+    primary key lookup. Collections listed in collection_digests with a
+    current digest are left out of the pull.
+    Syncs of one user are coalesced: bursts within SYNC_DEBOUNCE_SECONDS
+    share one database pass that applies all their pushes in one
+    transaction. Fetching the next page of a pull is not held back by the
+    window. X-Sync-Coalesced tells how many requests that pass served.
     """
     
-    if sync_data.collections:
-        for coll_update in sync_data.collections:
-            existing = db.query(Collection).filter(
-                Collection.id == coll_update.id if hasattr(coll_update, 'id') else False,
-                Collection.user_id == current_user.id
-            ).first()
-            
-            if existing:
-                #last write wins
-                if existing.version <= coll_update.version:
-                    if coll_update.name is not None:
-                        existing.name = coll_update.name
-                    if coll_update.description is not None:
-                        existing.description = coll_update.description
-                    if coll_update.is_deleted is not None:
-                        existing.is_deleted = coll_update.is_deleted
-                    existing.version = coll_update.version
-    
-    if sync_data.cards:
-        for card_update in sync_data.cards:
-            existing = db.query(Card).filter(
-                Card.id == card_update.id if hasattr(card_update, 'id') else False,
-                Card.user_id == current_user.id
-            ).first()
-            
-            if existing:
-                #last write wins
-                if existing.version <= card_update.version:
-                    if card_update.front is not None:
-                        existing.front = card_update.front
-                    if card_update.back is not None:
-                        existing.back = card_update.back
-                    if card_update.collection_id is not None:
-                        existing.collection_id = card_update.collection_id
-                    if card_update.ease_factor is not None:
-                        existing.ease_factor = card_update.ease_factor
-                    if card_update.interval is not None:
-                        existing.interval = card_update.interval
-                    if card_update.repetitions is not None:
-                        existing.repetitions = card_update.repetitions
-                    if card_update.next_review_date is not None:
-                        existing.next_review_date = card_update.next_review_date
-                    if card_update.last_review_date is not None:
-                        existing.last_review_date = card_update.last_review_date
-                    if card_update.is_deleted is not None:
-                        existing.is_deleted = card_update.is_deleted
-                    existing.version = card_update.version
-    
-    if sync_data.review_logs:
-        for log_create in sync_data.review_logs:
-            existing = db.query(ReviewLog).filter(
-                ReviewLog.id == log_create.id if hasattr(log_create, 'id') and log_create.id else False
-            ).first()
-            
-            if not existing:
-                log = ReviewLog(
-                    id=log_create.id or str(uuid4()),
-                    user_id=current_user.id,
-                    card_id=log_create.card_id,
-                    quality=log_create.quality,
-                    ease_factor=log_create.ease_factor,
-                    interval=log_create.interval,
-                    reviewed_at=log_create.reviewed_at or datetime.utcnow()
-                )
-                db.add(log)
-    
-    db.commit()
-    
-    since_dt = sync_data.since
-    
-    coll_query = db.query(Collection).filter(Collection.user_id == current_user.id)
-    if since_dt:
-        coll_query = coll_query.filter(Collection.updated_at > since_dt)
-    collections = coll_query.all()
-    
-    card_query = db.query(Card).filter(Card.user_id == current_user.id)
-    if since_dt:
-        card_query = card_query.filter(Card.updated_at > since_dt)
-    cards = card_query.all()
-    
-    log_query = db.query(ReviewLog).filter(ReviewLog.user_id == current_user.id)
-    if since_dt:
-        log_query = log_query.filter(ReviewLog.created_at > since_dt)
-    review_logs = log_query.all()
-    
-    current_user.last_sync_at = datetime.utcnow()
-    db.commit()
+    if count_sync_items(sync_data) > settings.MAX_SYNC_ITEMS_PER_REQUEST:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many items in sync request (max {settings.MAX_SYNC_ITEMS_PER_REQUEST})"
+        )
+    
+    limit = min(sync_data.limit or settings.SYNC_PAGE_SIZE, settings.SYNC_PAGE_SIZE)
+    if limit < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit must be positive"
+        )
+    
+    if if_none_match and count_sync_items(sync_data) == 0:
+        not_modified = await _not_modified(db, current_user, if_none_match)
+        if not_modified is not None:
+            return not_modified
+    
+    if wants_ndjson(request):
+        after_seq = await run_write(db, _push, current_user.id, sync_data)
+        user_id = current_user.id
+        client_digests = sync_data.collection_digests
+        return ndjson_response(with_session(
+            lambda stream_db: _sync_lines(stream_db, user_id, after_seq, client_digests),
+            (await replica_router.read_sessions(current_user, after_seq)) or shard_map.user_sessions(current_user)
+        ))
+    
+    coalesced = None
+    
+    async def produce() -> SyncResponse:
+        nonlocal coalesced
+        page, coalesced = await sync_coalescer.submit(
+            current_user.id,
+            (sync_data, limit),
+            partial(_run_sync_batch, current_user),
+            urgent=is_continuation(sync_data.cursor)
+        )
+        return page
+    
+    if idempotency_key:
+        try:
+            result, replayed = await idempotency_store.run(
+                current_user.id,
+                idempotency_key,
+                fingerprint(sync_data.model_dump_json()),
+                produce
+            )
+        except IdempotencyKeyReused as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=str(e)
+            )
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+    else:
+        result = await produce()
+    
+    if result.digest is not None:
+        response.headers["ETag"] = _etag(result.digest)
+    if coalesced is not None:
+        response.headers["X-Sync-Coalesced"] = str(coalesced)
+    
+    if wants_msgpack(request):
+        return msgpack_model_response(
+            result,
+            columnar_fields=("collections", "cards", "review_logs"),
+            headers=dict(response.headers)
+        )
+    
+    return result
+
+
+def _etag(digest: str) -> str:
+    return f'"{digest}"'
+
+
+def _last_sync_due(user: User) -> bool:
+    """
+    The sync time is recorded at SYNC_LAST_SEEN_RESOLUTION_SECONDS granularity,
+    so a polling device writes the users row once per interval instead of on every call.
+    """
+    resolution = timedelta(seconds=settings.SYNC_LAST_SEEN_RESOLUTION_SECONDS)
+    return user.last_sync_at is None or datetime.utcnow() - user.last_sync_at >= resolution
+
+
+def _touch_last_sync(db: Session, user_id: str) -> None:
+    user = db.get(User, user_id)
+    if _last_sync_due(user):
+        user.last_sync_at = datetime.utcnow()
+
+
+async def _not_modified(db: AsyncSession, user: User, if_none_match: str) -> Optional[Response]:
+    """304 response if the client already holds the current account digest"""
+    etag = _etag(await db.run_sync(account_digest, user.id))
+    if etag not in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return None
+    
+    #the sync time is kept on the shard's users row
+    if _last_sync_due(await db.get(User, user.id)):
+        await run_write(db, _touch_last_sync, user.id)
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def _push(db: Session, user_id: str, sync_data: SyncRequest) -> int:
+    """Apply the push half, returns the change feed position the pull starts after"""
+    try:
+        after_seq = start_seq(db, user_id, sync_data.since, sync_data.cursor)
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    if count_sync_items(sync_data) > 0:
+        apply_push(db, user_id, sync_data)
+    _touch_last_sync(db, user_id)
+    return after_seq
+
+
+async def _run_sync_batch(
+    user: User,
+    user_id: str,
+    requests: list[tuple[SyncRequest, int]]
+) -> list:
+    """
+    One database pass for a batch of coalesced syncs of a user.
+    All pushes are applied in one transaction (LWW resolves items pushed
+    by several requests), then each request gets its own page. Returns a
+    SyncResponse or an exception per request.
+    The pages are read from a replica when one has the pushes and every
+    cursor of the batch, otherwise from the primary.
+    """
+    async with shard_map.user_sessions(user)() as db:
+        after_seqs = await run_write(db, _push_batch, user_id, requests)
+        cursors = [seq for seq in after_seqs if isinstance(seq, int)]
+        replica_sessions = await replica_router.read_sessions(user, max(cursors, default=0))
+        if replica_sessions is None:
+            return await db.run_sync(_pull_batch, user_id, requests, after_seqs)
+    
+    async with replica_sessions() as replica_db:
+        return await replica_db.run_sync(_pull_batch, user_id, requests, after_seqs)
+
+
+def _push_batch(db: Session, user_id: str, requests: list[tuple[SyncRequest, int]]) -> list:
+    """Apply the pushes of a batch, returns the position each pull starts after (or its error)"""
+    after_seqs = []
+    for sync_data, _ in requests:
+        try:
+            after_seqs.append(start_seq(db, user_id, sync_data.since, sync_data.cursor))
+        except InvalidCursor as e:
+            after_seqs.append(HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            ))
+    
+    pushes = [
+        sync_data for (sync_data, _), after_seq in zip(requests, after_seqs)
+        if not isinstance(after_seq, Exception)
+    ]
+    merged = SyncRequest(
+        collections=[c for p in pushes for c in p.collections or ()],
+        cards=[c for p in pushes for c in p.cards or ()],
+        review_logs=[r for p in pushes for r in p.review_logs or ()]
+    )
+    if count_sync_items(merged) > 0:
+        apply_push(db, user_id, merged)
+    _touch_last_sync(db, user_id)
+    return after_seqs
+
+
+def _pull_batch(db: Session, user_id: str, requests: list[tuple[SyncRequest, int]], after_seqs: list) -> list:
+    """Pages of a batch after its pushes committed, requests pulling the same page share it"""
+    #digests are read before the changes, a change racing the pull only makes them stale (never ahead)
+    digest, collection_digests = sync_digests(db, user_id)
+    
+    pages = {}
+    results = []
+    for (sync_data, limit), after_seq in zip(requests, after_seqs):
+        if isinstance(after_seq, Exception):
+            results.append(after_seq)
+            continue
+        
+        client_digests = sync_data.collection_digests or {}
+        key = (after_seq, limit, tuple(sorted(client_digests.items())))
+        if key not in pages:
+            skip_collections = unchanged_collections(client_digests, collection_digests)
+            pages[key] = _sync_page(
+                db, user_id, after_seq, limit, skip_collections, digest, collection_digests
+            )
+        results.append(pages[key])
+    return results
+
+
+def _sync_page(
+    db: Session,
+    user_id: str,
+    after_seq: int,
+    limit: int,
+    skip_collections: set,
+    digest: str,
+    collection_digests: dict
+) -> SyncResponse:
+    page, next_cursor, has_more = pull_page(db, user_id, after_seq, limit, skip_collections)
     
     return SyncResponse(
-        collections=collections,
-        cards=cards,
-        review_logs=review_logs
+        collections=[collection_to_response(c) for c in page["collections"]],
+        cards=page["cards"],
+        review_logs=page["review_logs"],
+        next_cursor=next_cursor,
+        has_more=has_more,
+        #only the last page is a complete view of the digested state
+        digest=None if has_more else digest,
+        collection_digests=None if has_more else collection_digests
     )
+
+
+async def _sync_lines(
+    db: AsyncSession,
+    user_id: str,
+    after_seq: int,
+    client_digests: Optional[dict]
+) -> AsyncIterator[str]:
+    """
+    NDJSON body for a streamed sync: one {"type", "data"} line per entity and a
+    {"type": "cursor"} line after every batch, ending with {"type": "end"}
+    which carries the digests.
+    A client that loses the connection resumes from the last cursor line it read.
+    """
+    digest, collection_digests = await db.run_sync(sync_digests, user_id)
+    skip_collections = unchanged_collections(client_digests, collection_digests)
+    
+    next_cursor = encode_cursor(after_seq)
+    async for page, next_cursor in iter_pull_pages(db, user_id, after_seq, skip_collections):
+        for collection in page["collections"]:
+            yield ndjson_line({"type": "collection", "data": collection_to_response(collection)})
+        for card in page["cards"]:
+            yield ndjson_line({"type": "card", "data": CardResponse.model_validate(card)})
+        for log in page["review_logs"]:
+            yield ndjson_line({"type": "review_log", "data": ReviewLogResponse.model_validate(log)})
+        yield ndjson_line({"type": "cursor", "next_cursor": next_cursor})
+    yield ndjson_line({
+        "type": "end",
+        "next_cursor": next_cursor,
+        "has_more": False,
+        "digest": digest,
+        "collection_digests": collection_digests
+    })
+
+
+@router.get("/stream")
+async def sync_stream(current_user: User = Depends(get_current_user)):
+    """
+    Server-Sent Events stream of change notifications for the current user.
+    Sends {"seq": N} as a "changed" event on connect and whenever another
+    device commits changes, N being the latest change feed position; the
+    client answers with a normal sync. Send the same X-Device-Id header here
+    and on writes to not be notified of the device's own changes. A comment
+    line is sent every SYNC_STREAM_KEEPALIVE_SECONDS to keep proxies from
+    closing an idle connection.
+    """
+    return StreamingResponse(
+        _change_events(current_user.id, origin_device.get(), shard_map.user_sessions(current_user)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _head_seq(sessions: async_sessionmaker, user_id: str) -> int:
+    async with sessions() as db:
+        return await db.run_sync(head_seq, user_id)
+
+
+async def _change_events(
+    user_id: str,
+    device_id: Optional[str],
+    sessions: async_sessionmaker
+) -> AsyncIterator[str]:
+    #subscribe before reading the head so a commit in between is not missed
+    subscription = notifier.hub.subscribe(user_id, device_id, 0)
+    try:
+        subscription.notify(await _head_seq(sessions, user_id))
+        sent = None
+        while True:
+            if subscription.seq != sent:
+                sent = subscription.seq
+                subscription.changed.clear()
+                yield f"id: {sent}\nevent: changed\ndata: {json.dumps({'seq': sent})}\n\n"
+            elif not await subscription.wait(settings.SYNC_STREAM_KEEPALIVE_SECONDS):
+                yield ": keepalive\n\n"
+    finally:
+        notifier.hub.unsubscribe(subscription)
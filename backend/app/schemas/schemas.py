@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime, timezone
 from typing import Optional
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, field_validator
 
 
 # ==========================================
@@ -91,6 +91,7 @@ class CollectionCreate(CollectionBase):
 
 
 class CollectionUpdate(BaseModel):
+    id: Optional[str] = None
     name: Optional[str] = None
     description: Optional[str] = None
     tags: Optional[list[str]] = None
@@ -131,6 +132,7 @@ class CardCreate(CardBase):
 
 
 class CardUpdate(BaseModel):
+    id: Optional[str] = None
     front: Optional[str] = None
     back: Optional[str] = None
     collection_id: Optional[str] = None
@@ -160,6 +162,13 @@ class CardResponse(CardBase):
         from_attributes = True
 
 
+class DueCardsResponse(BaseModel):
+    cards: list[CardResponse]
+    next_cursor: Optional[str] = None
+    #due cards per collection id, on the first page only
+    due_counts: Optional[dict[str, int]] = None
+
+
 # ==========================================
 # REVIEWLOG
 # ==========================================
@@ -176,6 +185,14 @@ class ReviewLogCreate(ReviewLogBase):
     id: Optional[str] = None
     reviewed_at: Optional[datetime] = None
 
+    @field_validator("reviewed_at")
+    @classmethod
+    def _naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        #stored naive UTC like every other timestamp, the stats rollups bucket the stored value
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
 
 class ReviewLogResponse(ReviewLogBase):
     id: str
@@ -192,6 +209,9 @@ class ReviewLogResponse(ReviewLogBase):
 # ==========================================
 class SyncRequest(BaseModel):
     since: Optional[datetime] = None
+    cursor: Optional[str] = None
+    limit: Optional[int] = None
+    collection_digests: Optional[dict[str, str]] = None
     collections: Optional[list[CollectionUpdate]] = None
     cards: Optional[list[CardUpdate]] = None
     review_logs: Optional[list[ReviewLogCreate]] = None
@@ -201,3 +221,53 @@ class SyncResponse(BaseModel):
     collections: list[CollectionResponse]
     cards: list[CardResponse]
     review_logs: list[ReviewLogResponse]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+    digest: Optional[str] = None
+    collection_digests: Optional[dict[str, str]] = None
+
+
+# ==========================================
+# SCHEDULER
+# ==========================================
+class SchedulerParametersResponse(BaseModel):
+    weights: list[float]
+    request_retention: float
+    #False while the defaults apply: the user has not been fitted yet
+    personalized: bool
+    review_count: int = 0
+    log_loss: Optional[float] = None
+    default_log_loss: Optional[float] = None
+    fitted_at: Optional[datetime] = None
+
+
+# ==========================================
+# STATS
+# ==========================================
+class ReviewCounts(BaseModel):
+    reviews: int
+    wrong: int
+    hard: int
+    good: int
+    easy: int
+    perfect: int
+
+
+class StatsDay(ReviewCounts):
+    day: date
+
+
+class StatsResponse(BaseModel):
+    start: date
+    end: date
+    utc_offset_hours: int
+    collection_id: Optional[str] = None
+    totals: ReviewCounts
+    #share of reviews not answered wrong, None without reviews
+    retention: Optional[float] = None
+    #days with reviews, in order
+    days: list[StatsDay]
+    #reviews by local hour of day, 0-23
+    hours: list[int]
+    current_streak: int
+    longest_streak: int
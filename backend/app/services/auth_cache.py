@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.core.security import decode_access_token
+from app.models.models import User
+from app.services.notifications import BroadcastBackend, create_backend
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "flashcards:auth"
+
+lookups = Counter(
+    "auth_cache_lookups_total",
+    "Authentication cache lookups by cache and result",
+    ("cache", "result")
+)
+
+
+class TokenCache:
+    """
+    Payloads of verified access tokens keyed by the token's digest, each kept
+    until the token's own exp. Tokens that fail verification are not cached.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[bytes, tuple[dict, float]] = OrderedDict()
+
+    def decode(self, token: str) -> Optional[dict]:
+        key = hashlib.sha256(token.encode()).digest()
+        entry = self._entries.get(key)
+        if entry is not None:
+            payload, expires_at = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                lookups.inc(cache="token", result="hit")
+                return payload
+            del self._entries[key]
+
+        lookups.inc(cache="token", result="miss")
+        payload = decode_access_token(token)
+        if payload is not None and isinstance(payload.get("exp"), (int, float)):
+            self._entries[key] = (payload, payload["exp"])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return payload
+
+
+class UserCache:
+    """
+    Detached users rows of recently authenticated users, least recently used
+    evicted past max_entries and every entry reloaded after ttl_seconds.
+    Callers must not modify the cached objects. `generation` changes on
+    every invalidation: a row loaded before one is not cached, it may
+    predate the change.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self._entries: OrderedDict[str, tuple[User, float]] = OrderedDict()
+
+    def get(self, user_id: str) -> Optional[User]:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            user, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(user_id)
+                lookups.inc(cache="user", result="hit")
+                return user
+            del self._entries[user_id]
+        lookups.inc(cache="user", result="miss")
+        return None
+
+    def put(self, user: User, generation: int) -> None:
+        if self.ttl_seconds <= 0 or generation != self.generation:
+            return
+        self._entries[user.id] = (user, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(user.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        self.generation += 1
+        self._entries.pop(user_id, None)
+
+
+class AuthCache:
+    """
+    Token and user caches of get_current_user. Changes to a users row are
+    announced with invalidate(), which drops the entry here and, through a
+    broadcast backend on its own channel of BROADCAST_URL, on every other
+    worker.
+    """
+
+    def __init__(self):
+        self.tokens = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE)
+        self.users = UserCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL_SECONDS)
+        self._backend: Optional[BroadcastBackend] = None
+
+    async def start(self) -> None:
+        self._backend = create_backend(settings.BROADCAST_URL, CHANNEL)
+        await self._backend.start(lambda user_id, seq, origin: self.users.invalidate(user_id))
+
+    async def stop(self) -> None:
+        if self._backend is not None:
+            await self._backend.stop()
+            self._backend = None
+
+    async def invalidate(self, *user_ids: str) -> None:
+        for user_id in user_ids:
+            self.users.invalidate(user_id)
+            if self._backend is not None:
+                try:
+                    await self._backend.publish(user_id, 0, None)
+                except Exception as e:
+                    logger.warning("Failed to broadcast auth cache invalidation: %s", e)
+
+
+def broadcast_reaches_workers() -> bool:
+    """Whether a process outside the app (a script) can invalidate the workers' caches"""
+    return not settings.BROADCAST_URL.startswith("memory://")
+
+
+async def publish_invalidation(*user_ids: str) -> None:
+    """Invalidate cached users on every worker from outside the app"""
+    backend = create_backend(settings.BROADCAST_URL, CHANNEL)
+    await backend.start(lambda user_id, seq, origin: None)
+    try:
+        for user_id in user_ids:
+            await backend.publish(user_id, 0, None)
+    finally:
+        await backend.stop()
+
+
+auth_cache = AuthCache()
@@ -0,0 +1,233 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable, Optional
+
+from sqlalchemy import select, insert, update, func, event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.database import SyncSession, on_conflict_insert
+from app.models.models import User, Collection, Card, ReviewLog, ChangeLog, SyncDigest
+
+
+ENTITY_TYPES = {
+    "collection": Collection,
+    "card": Card,
+    "review_log": ReviewLog,
+}
+MODEL_ENTITY_TYPES = {model: name for name, model in ENTITY_TYPES.items()}
+
+
+ACCOUNT_DIGEST = ""
+
+#device that issued the current request (X-Device-Id), it is not notified of its own writes
+origin_device: ContextVar[Optional[str]] = ContextVar("origin_device", default=None)
+
+
+#bump_digests runs on every flush touching synced entities. A dialect insert() with
+#on_conflict_do_update() has no cache key and would be recompiled each time, this
+#statement is compiled once (same syntax on SQLite and Postgres)
+_DIGEST_UPSERT = text(
+    "INSERT INTO sync_digests (user_id, collection_id, revision) VALUES (:user_id, :collection_id, 1) "
+    "ON CONFLICT (user_id, collection_id) DO UPDATE SET revision = sync_digests.revision + 1"
+)
+
+
+def bump_digests(db: Session, user_id: str, collection_ids: Iterable[Optional[str]]) -> None:
+    """Increment the account digest and the digests of the touched collections"""
+    keys = sorted({ACCOUNT_DIGEST} | {c for c in collection_ids if c})
+    table = SyncDigest.__table__
+    conn = db.connection()
+
+    if on_conflict_insert(conn) is not None:
+        conn.execute(_DIGEST_UPSERT, [{"user_id": user_id, "collection_id": key} for key in keys])
+        return
+
+    for key in keys:
+        bumped = conn.execute(
+            update(table)
+            .where(table.c.user_id == user_id, table.c.collection_id == key)
+            .values(revision=table.c.revision + 1)
+        )
+        if bumped.rowcount == 0:
+            conn.execute(insert(table).values(user_id=user_id, collection_id=key, revision=1))
+
+
+def lock_change_feed(db: Session, user_id: str) -> None:
+    """
+    Lock the user's row of this shard (a placeholder off the directory)
+    before writing their change rows, until the transaction ends. A user's
+    writers then take sequence numbers in commit order: a client whose
+    cursor reached a seq never misses a lower one committed later, as it
+    could on Postgres when two transactions commit out of seq order.
+    FOR NO KEY UPDATE still lets review writers take their FOR KEY SHARE
+    (review_stats.lock_rollups). No-op on SQLite, where writers are
+    serialized anyway.
+    """
+    table = User.__table__
+    db.connection().execute(select(table.c.id).where(table.c.id == user_id).with_for_update(key_share=True))
+
+
+def record_changes(db: Session, user_id: str, entity_type: str, changes: dict[str, Optional[str]]) -> None:
+    """
+    Append change rows for entities written outside the ORM (bulk upserts).
+    `changes` maps each written entity id to its collection id.
+    """
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": user_id, "entity_type": entity_type, "entity_id": entity_id, "created_at": now}
+        for entity_id in changes
+    ]
+    if rows:
+        lock_change_feed(db, user_id)
+        db.execute(insert(ChangeLog), rows)
+        bump_digests(db, user_id, changes.values())
+        _note_head(db, user_id, head_seq(db, user_id))
+
+
+def _note_head(session: Session, user_id: str, seq: int) -> None:
+    #highest change written per user in the current transaction, published on commit.
+    #a transaction carrying writes of several devices (group commit) notifies all of them
+    heads = session.info.setdefault("change_heads", {})
+    origin = origin_device.get()
+    if user_id in heads:
+        head, noted_origin = heads[user_id]
+        seq = max(seq, head)
+        if noted_origin != origin:
+            origin = None
+    heads[user_id] = (seq, origin)
+
+
+def pop_change_heads(session: Session) -> dict[str, tuple[int, Optional[str]]]:
+    """Take the {user id: (seq, origin device)} heads written by the transaction that just ended"""
+    return session.info.pop("change_heads", {})
+
+
+def _collection_of(session: Session, obj) -> Optional[str]:
+    if isinstance(obj, Collection):
+        return obj.id
+    if isinstance(obj, Card):
+        return obj.collection_id
+    with session.no_autoflush:
+        card = session.get(Card, obj.card_id)
+    return card.collection_id if card else None
+
+
+@event.listens_for(SyncSession, "before_flush")
+def _record_orm_changes(session: Session, flush_context, instances) -> None:
+    """Write a change row and bump digests in the same transaction as every ORM insert/update of a synced entity"""
+    touched = {}
+    for obj in list(session.new) + list(session.dirty):
+        entity_type = MODEL_ENTITY_TYPES.get(type(obj))
+        if entity_type is None:
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        entities, collection_ids = touched.setdefault(obj.user_id, ([], set()))
+        entities.append((entity_type, obj.id))
+        collection_ids.add(_collection_of(session, obj))
+
+    #users in a fixed order, so two flushes touching the same users cannot deadlock
+    for user_id, (entities, collection_ids) in sorted(touched.items()):
+        lock_change_feed(session, user_id)
+        for entity_type, entity_id in entities:
+            change = ChangeLog(user_id=user_id, entity_type=entity_type, entity_id=entity_id)
+            session.add(change)
+            session.info.setdefault("pending_changes", []).append(change)
+        bump_digests(session, user_id, collection_ids)
+
+
+@event.listens_for(SyncSession, "after_flush")
+def _note_orm_heads(session: Session, flush_context) -> None:
+    #sequence numbers are assigned by the flush
+    for change in session.info.pop("pending_changes", []):
+        if change.seq is not None:
+            _note_head(session, change.user_id, change.seq)
+
+
+@event.listens_for(SyncSession, "after_soft_rollback")
+def _drop_heads(session: Session, previous_transaction) -> None:
+    #a savepoint rollback leaves the enclosing transaction's heads to its owner (write pipeline)
+    if previous_transaction.nested:
+        return
+    session.info.pop("pending_changes", None)
+    session.info.pop("change_heads", None)
+
+
+def get_digests(db: Session, user_id: str) -> dict[str, str]:
+    """Current digests of a user keyed by collection id (ACCOUNT_DIGEST for the whole account)"""
+    rows = db.execute(
+        select(SyncDigest.collection_id, SyncDigest.revision).where(SyncDigest.user_id == user_id)
+    ).all()
+    return {row.collection_id: str(row.revision) for row in rows}
+
+
+def account_digest(db: Session, user_id: str) -> str:
+    """Digest of the whole account, one primary key lookup"""
+    revision = db.scalar(
+        select(SyncDigest.revision).where(
+            SyncDigest.user_id == user_id,
+            SyncDigest.collection_id == ACCOUNT_DIGEST
+        )
+    )
+    return str(revision or 0)
+
+
+def head_seq(db: Session, user_id: str) -> int:
+    """Latest change sequence number for a user (0 if nothing changed yet)"""
+    return db.scalar(select(func.max(ChangeLog.seq)).where(ChangeLog.user_id == user_id)) or 0
+
+
+def seq_at(db: Session, user_id: str, since: datetime) -> int:
+    """Translate a legacy `since` timestamp into a change sequence number"""
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return db.scalar(
+        select(func.max(ChangeLog.seq)).where(
+            ChangeLog.user_id == user_id,
+            ChangeLog.created_at <= since
+        )
+    ) or 0
+
+
+def changes_after(db: Session, user_id: str, after_seq: int, limit: Optional[int] = None) -> list:
+    """Changes after `after_seq` in sequence order, a range scan on (user_id, seq)"""
+    stmt = (
+        select(ChangeLog.seq, ChangeLog.entity_type, ChangeLog.entity_id)
+        .where(ChangeLog.user_id == user_id, ChangeLog.seq > after_seq)
+        .order_by(ChangeLog.seq)
+    )
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.execute(stmt).all()
+
+
+async def stream_changes_after(db: AsyncSession, user_id: str, after_seq: int, batch_size: int) -> AsyncIterator[list]:
+    """Like changes_after, but read through a server-side cursor in batches of `batch_size`"""
+    stmt = (
+        select(ChangeLog.seq, ChangeLog.entity_type, ChangeLog.entity_id)
+        .where(ChangeLog.user_id == user_id, ChangeLog.seq > after_seq)
+        .order_by(ChangeLog.seq)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await db.stream(stmt)
+    async for partition in result.partitions():
+        yield partition
+
+
+def changed_ids(user_id: str, entity_type: str, after_seq: int):
+    """Subquery of entity ids of one type changed after `after_seq`"""
+    return select(ChangeLog.entity_id).where(
+        ChangeLog.user_id == user_id,
+        ChangeLog.seq > after_seq,
+        ChangeLog.entity_type == entity_type
+    )
+
+
+def resolve_after_seq(db: Session, user_id: str, since: Optional[str], after_seq: Optional[int]) -> Optional[int]:
+    """Change feed position for the list endpoints' `after_seq` or legacy ISO `since` parameter"""
+    if after_seq is not None:
+        return after_seq
+    if since:
+        return seq_at(db, user_id, datetime.fromisoformat(since.replace('Z', '+00:00')))
+    return None
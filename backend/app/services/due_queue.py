@@ -0,0 +1,108 @@
+"""
+Cards due for review, read page by page from the partial index
+ix_cards_user_due (user_id, next_review_date, id over live cards).
+
+The queue is ordered like the app's local one: new cards (no
+next_review_date) first, then scheduled cards by next_review_date, with
+the card id breaking ties. A page resumes after the last card of the
+previous one (keyset), so every page is an index range scan of `limit`
+entries however large the deck, and cards reviewed meanwhile do not shift
+the pages that follow.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.orm import Session
+
+from app.models.models import Card, Collection
+
+
+class InvalidDueCursor(ValueError):
+    pass
+
+
+#position in the queue: (None, id) among new cards, (next_review_date, id) among scheduled ones
+Position = tuple[Optional[datetime], str]
+
+
+def encode_due_cursor(position: Position) -> str:
+    """Opaque cursor pointing after a card of the queue"""
+    due, card_id = position
+    data = {"due": due.isoformat() if due else None, "id": card_id}
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_due_cursor(cursor: str) -> Position:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        due = datetime.fromisoformat(data["due"]) if data["due"] is not None else None
+        card_id = data["id"]
+        if not isinstance(card_id, str):
+            raise TypeError("card id")
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidDueCursor("Invalid due cursor") from e
+    return due, card_id
+
+
+def _due_cards(user_id: str, collection_id: Optional[str]):
+    query = (
+        select(Card)
+        .join(Collection, Collection.id == Card.collection_id)
+        .where(Card.user_id == user_id, Card.is_deleted == False, Collection.is_deleted == False)
+    )
+    if collection_id:
+        query = query.where(Card.collection_id == collection_id)
+    return query
+
+
+def due_page(
+    db: Session,
+    user_id: str,
+    collection_id: Optional[str],
+    after: Optional[Position],
+    limit: int,
+    now: datetime
+) -> tuple[list[Card], Optional[Position]]:
+    """Up to `limit` due cards after `after`, and the position to resume from if more are due"""
+    base = _due_cards(user_id, collection_id)
+    cards: list[Card] = []
+
+    if after is None or after[0] is None:
+        new = base.where(Card.next_review_date.is_(None))
+        if after is not None:
+            new = new.where(Card.id > after[1])
+        cards += db.scalars(new.order_by(Card.id).limit(limit + 1)).all()
+
+    if len(cards) <= limit:
+        scheduled = base.where(Card.next_review_date <= now)
+        if after is not None and after[0] is not None:
+            due, card_id = after
+            scheduled = scheduled.where(or_(
+                Card.next_review_date > due,
+                and_(Card.next_review_date == due, Card.id > card_id)
+            ))
+        cards += db.scalars(
+            scheduled.order_by(Card.next_review_date, Card.id).limit(limit + 1 - len(cards))
+        ).all()
+
+    if len(cards) <= limit:
+        return cards, None
+    cards = cards[:limit]
+    return cards, (cards[-1].next_review_date, cards[-1].id)
+
+
+def due_counts(db: Session, user_id: str, now: datetime) -> dict[str, int]:
+    """Number of due cards per collection"""
+    counts: dict[str, int] = {}
+    #grouped on the joined collection: grouping on cards.collection_id lets SQLite walk
+    #ix_cards_user_collection over every card of the user to skip the sort
+    base = _due_cards(user_id, None).with_only_columns(Collection.id, func.count())
+    for due in (Card.next_review_date.is_(None), Card.next_review_date <= now):
+        for collection_id, count in db.execute(base.where(due).group_by(Collection.id)):
+            counts[collection_id] = counts.get(collection_id, 0) + count
+    return counts
@@ -0,0 +1,238 @@
+"""
+Background delivery of the email outbox.
+
+Handlers queue messages with app.services.email_service in their own
+transaction, so a request only pays for an INSERT. The dispatcher claims
+due messages in batches of EMAIL_OUTBOX_BATCH_SIZE, sends them over one
+SMTP connection that stays open while there is mail (closed after
+EMAIL_SMTP_IDLE_SECONDS without) and retries failures with exponential
+backoff up to EMAIL_MAX_ATTEMPTS. It wakes on every commit that queued a
+message and otherwise polls every EMAIL_OUTBOX_POLL_SECONDS.
+
+Claiming a message moves its next attempt a lease into the future, so
+several workers can run dispatchers on one database, and a worker that
+dies mid-send leaves the message to be retried when the lease runs out
+(delivery is at least once).
+
+For local runs and tests point MAIL_SERVER/MAIL_PORT at the stand-in
+server: python -m app.services.smtp_sink --port 1025
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import Optional
+
+import aiosmtplib
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SyncSession, AsyncSessionLocal
+from app.core.metrics import Counter
+from app.models.models import EmailOutbox
+from app.services.email_service import render_email
+
+
+logger = logging.getLogger(__name__)
+
+#how long a claimed message is left to its dispatcher before another may retry it
+CLAIM_LEASE = timedelta(minutes=5)
+
+deliveries = Counter(
+    "email_outbox_deliveries_total", "Outbox delivery attempts by template and result", ("template", "result")
+)
+
+
+class SmtpConnection:
+    """One SMTP connection reused for consecutive messages, reconnected when the server drops it"""
+
+    def __init__(self):
+        self._client: Optional[aiosmtplib.SMTP] = None
+        self._last_used = 0.0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=settings.MAIL_SERVER,
+            port=settings.MAIL_PORT,
+            use_tls=settings.MAIL_SSL_TLS,
+            start_tls=settings.MAIL_STARTTLS,
+            validate_certs=True,
+            timeout=30
+        )
+        await client.connect()
+        if settings.MAIL_USERNAME:
+            await client.login(settings.MAIL_USERNAME, settings.MAIL_PASSWORD)
+        return client
+
+    async def send(self, message: EmailMessage) -> None:
+        for retry in (False, True):
+            if self._client is None or not self._client.is_connected:
+                self._client = await self._connect()
+            try:
+                await self._client.send_message(message)
+                self._last_used = time.monotonic()
+                return
+            except aiosmtplib.SMTPServerDisconnected:
+                #an idle connection the server closed, worth one fresh connection
+                self._client = None
+                if retry:
+                    raise
+
+    async def close_if_idle(self) -> None:
+        if self._client is not None and time.monotonic() - self._last_used >= settings.EMAIL_SMTP_IDLE_SECONDS:
+            await self.close()
+
+    async def close(self) -> None:
+        client, self._client = self._client, None
+        if client is not None and client.is_connected:
+            try:
+                await client.quit()
+            except aiosmtplib.SMTPException:
+                client.close()
+
+
+def _backoff(attempts: int) -> timedelta:
+    seconds = min(settings.EMAIL_RETRY_MAX_SECONDS, settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=seconds * random.uniform(0.5, 1.0))
+
+
+def _message(row: EmailOutbox) -> EmailMessage:
+    subject, html = render_email(row.template, row.context)
+    message = EmailMessage()
+    message["From"] = formataddr((settings.MAIL_FROM_NAME, settings.MAIL_FROM))
+    message["To"] = row.recipient
+    message["Subject"] = subject
+    message.set_content(html, subtype="html")
+    return message
+
+
+class EmailDispatcher:
+    def __init__(self):
+        self.smtp = SmtpConnection()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._loop = None
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.smtp.close()
+
+    def wake_threadsafe(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is not None and wake is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                sent = await self.dispatch_batch()
+            except Exception:
+                logger.exception("Email outbox dispatch failed")
+                sent = 0
+            if sent >= settings.EMAIL_OUTBOX_BATCH_SIZE:
+                #a full batch, more is probably due
+                continue
+
+            await self.smtp.close_if_idle()
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.EMAIL_OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _claim(self) -> list[EmailOutbox]:
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            due = (await db.execute(
+                select(EmailOutbox.id, EmailOutbox.next_attempt_at)
+                .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+                .order_by(EmailOutbox.next_attempt_at)
+                .limit(settings.EMAIL_OUTBOX_BATCH_SIZE)
+            )).all()
+
+            claimed = []
+            for message_id, next_attempt_at in due:
+                #another dispatcher may have claimed it since the select
+                result = await db.execute(
+                    update(EmailOutbox)
+                    .where(EmailOutbox.id == message_id, EmailOutbox.next_attempt_at == next_attempt_at)
+                    .values(next_attempt_at=now + CLAIM_LEASE, attempts=EmailOutbox.attempts + 1)
+                )
+                if result.rowcount:
+                    claimed.append(message_id)
+            await db.commit()
+
+            if not claimed:
+                return []
+            return list((await db.scalars(select(EmailOutbox).where(EmailOutbox.id.in_(claimed)))).all())
+
+    async def dispatch_batch(self) -> int:
+        """Send the messages due now (at most a batch), returns how many were claimed"""
+        rows = await self._claim()
+        if not rows:
+            return 0
+
+        outcomes = {}
+        unreachable = None
+        for row in rows:
+            retry = "failed" if row.attempts >= settings.EMAIL_MAX_ATTEMPTS else "retry"
+            try:
+                message = _message(row)
+            except Exception as e:
+                #a message that cannot be built must not hold up the rest of the batch
+                logger.exception("Building outbox message %d failed", row.id)
+                outcomes[row.id] = (retry, f"{type(e).__name__}: {e}")
+                continue
+
+            try:
+                if unreachable is not None:
+                    #no point connecting again for every message of the batch
+                    raise unreachable
+                await self.smtp.send(message)
+            except aiosmtplib.SMTPRecipientsRefused as e:
+                outcomes[row.id] = ("failed", str(e))
+            except (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError) as e:
+                if isinstance(e, (aiosmtplib.SMTPConnectError, OSError, asyncio.TimeoutError)):
+                    unreachable = e
+                logger.warning("Sending outbox message %d failed: %s", row.id, e)
+                outcomes[row.id] = (retry, str(e))
+            else:
+                outcomes[row.id] = ("sent", None)
+
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            for row in rows:
+                result, error = outcomes[row.id]
+                deliveries.inc(template=row.template, result=result)
+                if result == "sent":
+                    #the context holds the token links, not kept once delivered
+                    values = {"status": "sent", "sent_at": now, "last_error": None, "context": {}}
+                elif result == "retry":
+                    values = {"next_attempt_at": now + _backoff(row.attempts), "last_error": error}
+                else:
+                    values = {"status": "failed", "last_error": error}
+                await db.execute(update(EmailOutbox).where(EmailOutbox.id == row.id).values(**values))
+            await db.commit()
+        return len(rows)
+
+
+email_dispatcher = EmailDispatcher()
+
+
+@event.listens_for(SyncSession, "after_commit")
+def _wake_dispatcher(session: Session) -> None:
+    if session.info.pop("email_queued", False):
+        email_dispatcher.wake_threadsafe()
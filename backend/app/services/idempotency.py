@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from app.core.config import settings
+
+
+class IdempotencyKeyReused(Exception):
+    pass
+
+
+@dataclass
+class _Entry:
+    fingerprint: str
+    result: asyncio.Future
+    expires_at: float
+
+
+def fingerprint(body: str) -> str:
+    """Digest of a request body, used to reject a key reused for a different request"""
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Bounded, TTL-evicted cache of recent results keyed by (user id, idempotency key).
+    The first request with a key runs; duplicates arriving while it is in
+    flight await the same future instead of running again, and later
+    duplicates get the cached result until it expires. Failed runs are not
+    cached, so the client can retry them; when the running request is
+    cancelled, one of the waiting duplicates runs it instead.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    async def run(
+        self,
+        user_id: str,
+        key: str,
+        request_fingerprint: str,
+        produce: Callable[[], Awaitable[Any]],
+    ) -> tuple[Any, bool]:
+        """Return (result, replayed) for an idempotent request, running `produce` at most once per key"""
+        cache_key = (user_id, key)
+        while True:
+            now = time.monotonic()
+            self._evict(now)
+
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                break
+            if entry.fingerprint != request_fingerprint:
+                raise IdempotencyKeyReused("Idempotency-Key was already used for a different request")
+            self._entries.move_to_end(cache_key)
+            try:
+                return await asyncio.shield(entry.result), True
+            except asyncio.CancelledError:
+                if not entry.result.cancelled():
+                    raise
+                #the first request was cancelled (its client went away), not this one:
+                #its entry is gone, so run the request here or wait for whoever does
+
+        entry = _Entry(
+            fingerprint=request_fingerprint,
+            result=asyncio.get_running_loop().create_future(),
+            expires_at=now + self.ttl_seconds,
+        )
+        self._entries[cache_key] = entry
+
+        try:
+            result = await produce()
+        except BaseException as e:
+            if self._entries.get(cache_key) is entry:
+                del self._entries[cache_key]
+            if isinstance(e, asyncio.CancelledError):
+                entry.result.cancel()
+            else:
+                entry.result.set_exception(e)
+                #mark retrieved, waiters (if any) re-raise it themselves
+                entry.result.exception()
+            raise
+
+        entry.result.set_result(result)
+        return result, False
+
+
+idempotency_store = IdempotencyStore(
+    max_entries=settings.IDEMPOTENCY_CACHE_SIZE,
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+)
@@ -0,0 +1,154 @@
+"""
+Periodic maintenance jobs. Every worker runs them every
+MAINTENANCE_INTERVAL_SECONDS (0 disables them, e.g. on all workers but
+one). A job works in chunks of MAINTENANCE_CHUNK_SIZE rows, one short
+transaction per chunk, and is safe to run on several workers at once.
+
+    python -m app.services.maintenance    runs every job once, e.g. from cron
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import select, delete, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import Counter
+from app.core.sharding import shard_map, DIRECTORY_SHARD
+from app.models.models import User, OneTimeToken
+from app.services.auth_cache import auth_cache
+from app.services.one_time_tokens import sweep_expired_tokens
+from app.services.shard_rebalance import purge_users
+
+
+logger = logging.getLogger(__name__)
+
+processed = Counter("maintenance_rows_total", "Rows removed or fixed by maintenance jobs", ("job",))
+
+
+def expired_registrations(db: Session, limit: int) -> list[Row]:
+    """Oldest expired unverified registrations (id, email, shard), from the partial index"""
+    return db.execute(
+        select(User.id, User.email, User.shard)
+        .where(
+            User.is_email_verified == False,
+            User.is_deleted == False,
+            User.email_verification_expires < datetime.utcnow()
+        )
+        .order_by(User.email_verification_expires)
+        .limit(limit)
+    ).all()
+
+
+def remove_registrations(db: Session, users: list[Row]) -> list[Row]:
+    """
+    Delete expired registrations from the directory and give their emails
+    back to the deleted accounts that held them before. Registrations
+    verified meanwhile are kept, data included. Returns the removed ones.
+    """
+    guard = (
+        User.id.in_([user.id for user in users]),
+        User.is_email_verified == False,
+        User.email_verification_expires < datetime.utcnow()
+    )
+    #the guarded rows are locked first: their data goes before them (foreign keys)
+    #and a verification waits until they are gone instead of keeping an emptied account
+    removed = list(db.scalars(select(User.id).where(*guard).with_for_update()).all())
+    if removed:
+        purge_users(db, removed, DIRECTORY_SHARD)
+        removed = set(db.scalars(delete(User).where(User.id.in_(removed), *guard[1:]).returning(User.id)).all())
+    removed_users = [user for user in users if user.id in removed]
+    if removed:
+        db.execute(delete(OneTimeToken).where(OneTimeToken.user_id.in_(removed)))
+
+    if removed_users:
+        #the registration is gone, so its email is free again
+        db.execute(
+            update(User)
+            .where(User.original_email.in_([user.email for user in removed_users]), User.is_deleted == True)
+            .values(email=User.original_email, original_email=None)
+        )
+    return removed_users
+
+
+async def purge_registration_shards(users: list[Row]) -> None:
+    """Drop the placeholder rows removed registrations left on their data shards"""
+    by_shard: dict[int, list[str]] = {}
+    for user in users:
+        if user.shard not in (None, DIRECTORY_SHARD):
+            by_shard.setdefault(user.shard, []).append(user.id)
+
+    for shard, ids in by_shard.items():
+        async with shard_map.async_sessions(shard)() as db:
+            await db.run_sync(purge_users, ids, shard)
+            await db.commit()
+
+
+async def cleanup_expired_registrations() -> int:
+    """Remove expired unverified registrations chunk by chunk, returns how many"""
+    removed = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            users = await db.run_sync(expired_registrations, settings.MAINTENANCE_CHUNK_SIZE)
+            if not users:
+                break
+            removed_users = await db.run_sync(remove_registrations, users)
+            await db.commit()
+
+        await purge_registration_shards(removed_users)
+        await auth_cache.invalidate(*(user.id for user in removed_users))
+        removed += len(removed_users)
+        if len(users) < settings.MAINTENANCE_CHUNK_SIZE:
+            break
+    return removed
+
+
+class Maintenance:
+    def __init__(self, jobs: dict[str, Callable[[], Awaitable[int]]]):
+        self.jobs = jobs
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if settings.MAINTENANCE_INTERVAL_SECONDS > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.run_once()
+            await asyncio.sleep(settings.MAINTENANCE_INTERVAL_SECONDS)
+
+    async def run_once(self) -> None:
+        for name, job in self.jobs.items():
+            try:
+                count = await job()
+            except Exception:
+                logger.exception("Maintenance job %s failed", name)
+                continue
+            if count:
+                processed.inc(count, job=name)
+                logger.info("Maintenance job %s processed %d rows", name, count)
+
+
+maintenance = Maintenance({
+    "expired_registrations": cleanup_expired_registrations,
+    "expired_tokens": sweep_expired_tokens,
+})
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(maintenance.run_once())
+
+
+if __name__ == "__main__":
+    main()
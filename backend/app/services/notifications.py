@@ -0,0 +1,292 @@
+import asyncio
+import json
+import logging
+import random
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.database import SyncSession
+from app.services.change_feed import origin_device, pop_change_heads
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # only needed for the redis:// broadcast backend
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, int, Optional[str]], None]
+
+#backoff between attempts to resubscribe after the broadcast connection is lost
+RECONNECT_MIN_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 30.0
+
+#errors of a lost broadcast connection, socket errors may also surface unwrapped
+CONNECTION_ERRORS = (OSError,) + ((redis.ConnectionError, redis.TimeoutError) if redis is not None else ())
+
+
+class OriginDeviceMiddleware:
+    """Expose the X-Device-Id request header to the commit hook through origin_device"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = origin_device.set(Headers(scope=scope).get("x-device-id"))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            origin_device.reset(token)
+
+
+class Subscription:
+    """
+    One connected device. Notifications only raise `seq`, so a device that
+    is slow to read gets a single "changed up to" for a whole burst.
+    """
+
+    def __init__(self, user_id: str, device_id: Optional[str], seq: int):
+        self.user_id = user_id
+        self.device_id = device_id
+        self.seq = seq
+        self.changed = asyncio.Event()
+
+    def notify(self, seq: int) -> None:
+        if seq > self.seq:
+            self.seq = seq
+            self.changed.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for a newer seq, False on timeout"""
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.changed.clear()
+        return True
+
+
+class ChangeHub:
+    """
+    In-process fan-out of change notifications to this worker's connections.
+    An idle connection is one Subscription (an Event and an int), so a
+    worker holds thousands of them cheaply.
+    """
+
+    def __init__(self):
+        self._subscriptions: dict[str, set[Subscription]] = {}
+
+    def subscribe(self, user_id: str, device_id: Optional[str], seq: int) -> Subscription:
+        subscription = Subscription(user_id, device_id, seq)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.user_id]
+
+    def deliver(self, user_id: str, seq: int, origin: Optional[str]) -> None:
+        for subscription in self._subscriptions.get(user_id, ()):
+            if origin is None or subscription.device_id != origin:
+                subscription.notify(seq)
+
+    @property
+    def connections(self) -> int:
+        return sum(len(s) for s in self._subscriptions.values())
+
+
+class BroadcastBackend:
+    """
+    Carries notifications between workers. Every worker's hub receives every
+    published notification, including the publishing worker's own.
+    """
+
+    async def start(self, deliver: Deliver) -> None:
+        raise NotImplementedError
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, user_id: str, seq: int, origin: Optional[str]) -> None:
+        raise NotImplementedError
+
+
+class InMemoryBroadcast(BroadcastBackend):
+    """Single worker backend (and the one used in tests): delivers straight to the local hub"""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def stop(self) -> None:
+        self._deliver = None
+
+    async def publish(self, user_id: str, seq: int, origin: Optional[str]) -> None:
+        if self._deliver is not None:
+            self._deliver(user_id, seq, origin)
+
+
+class RedisBroadcast(BroadcastBackend):
+    """
+    Redis pub/sub backend for several uvicorn workers or hosts. When the
+    connection drops the listener resubscribes with backoff; notifications
+    published meanwhile are lost, their devices catch up on the next change
+    or when their long poll times out.
+    """
+
+    channel = "flashcards:changes"
+
+    def __init__(self, url: str, channel: Optional[str] = None, client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("BROADCAST_URL uses redis:// but the redis package is not installed")
+            client = redis.from_url(url)
+        self._client = client
+        if channel is not None:
+            self.channel = channel
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(pubsub, deliver))
+
+    async def _listen(self, pubsub, deliver: Deliver) -> None:
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            try:
+                async with pubsub:
+                    if not pubsub.subscribed:
+                        await pubsub.subscribe(self.channel)
+                        logger.info("Resubscribed to change notifications")
+                    delay = RECONNECT_MIN_SECONDS
+                    async for message in pubsub.listen():
+                        try:
+                            data = json.loads(message["data"])
+                            deliver(data["user_id"], int(data["seq"]), data.get("origin"))
+                        except (ValueError, KeyError, TypeError):
+                            logger.warning("Dropping malformed change notification")
+            except CONNECTION_ERRORS as e:
+                logger.warning("Change notifications interrupted, resubscribing in %.1fs: %s", delay, e)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+        await self._client.aclose()
+
+    async def publish(self, user_id: str, seq: int, origin: Optional[str]) -> None:
+        data = json.dumps({"user_id": user_id, "seq": seq, "origin": origin})
+        await self._client.publish(self.channel, data)
+
+
+def create_backend(url: str, channel: Optional[str] = None) -> BroadcastBackend:
+    """Broadcast backend for BROADCAST_URL: memory:// or redis://host:port/db"""
+    if url.startswith("memory://"):
+        return InMemoryBroadcast()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBroadcast(url, channel)
+    raise ValueError(f"Unsupported BROADCAST_URL: {url}")
+
+
+class ChangeNotifier:
+    """
+    Publishes "changed up to seq N" after every commit that wrote change
+    feed rows and feeds received notifications to the local hub.
+    Blocking sessions commit on worker threads, so publishing hops onto the
+    event loop the notifier was started on. Outside a running app
+    (scripts, migrations) commits publish nothing.
+    Observers get (user_id, seq) for this worker's commits right away and
+    for other workers' commits when their notification arrives.
+    """
+
+    def __init__(self, backend_factory: Callable[[], BroadcastBackend]):
+        self.hub = ChangeHub()
+        self.observers: list[Callable[[str, int], None]] = []
+        self._backend_factory = backend_factory
+        self._backend: Optional[BroadcastBackend] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        #the loop only keeps weak references to tasks, publishes in flight are held here
+        self._publishing: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        self._backend = self._backend_factory()
+        await self._backend.start(self._deliver)
+        self._loop = asyncio.get_running_loop()
+
+    def _deliver(self, user_id: str, seq: int, origin: Optional[str]) -> None:
+        self.hub.deliver(user_id, seq, origin)
+        self._observe(user_id, seq)
+
+    def _observe(self, user_id: str, seq: int) -> None:
+        for observer in self.observers:
+            observer(user_id, seq)
+
+    async def stop(self) -> None:
+        self._loop = None
+        await asyncio.gather(*self._publishing, return_exceptions=True)
+        if self._backend is not None:
+            await self._backend.stop()
+            self._backend = None
+
+    async def _publish_all(self, heads: dict[str, tuple[int, Optional[str]]]) -> None:
+        backend = self._backend
+        if backend is None:
+            return
+        results = await asyncio.gather(
+            *(backend.publish(user_id, seq, origin) for user_id, (seq, origin) in heads.items()),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning("Failed to publish change notification: %s", result)
+
+    def publish_threadsafe(self, heads: dict[str, tuple[int, Optional[str]]]) -> None:
+        for user_id, (seq, _) in heads.items():
+            self._observe(user_id, seq)
+
+        loop = self._loop
+        if loop is None or not heads or loop.is_closed():
+            return
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is loop:
+            self._spawn_publish(heads)
+        else:
+            loop.call_soon_threadsafe(self._spawn_publish, heads)
+
+    def _spawn_publish(self, heads: dict[str, tuple[int, Optional[str]]]) -> None:
+        task = asyncio.get_running_loop().create_task(self._publish_all(heads))
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+
+notifier = ChangeNotifier(lambda: create_backend(settings.BROADCAST_URL))
+
+
+@event.listens_for(SyncSession, "after_commit")
+def _publish_committed_changes(session: Session) -> None:
+    notifier.publish_threadsafe(pop_change_heads(session))
@@ -0,0 +1,102 @@
+"""
+Single-use tokens for email links (verification, password reset).
+
+Only the sha256 of a token is stored, under a unique index, so following
+a link is a point lookup and a leaked table gives away no usable links.
+Issuing a token replaces the user's outstanding ones of that purpose.
+Consuming is one UPDATE ... RETURNING that only matches an unused,
+unexpired token, so two clicks on the same link cannot both succeed.
+Expired tokens are deleted in chunks by the maintenance runner.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.models import OneTimeToken
+from app.services.email_service import generate_verification_token
+
+VERIFY_EMAIL = "verify_email"
+RESET_PASSWORD = "reset_password"
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def issue_token(db: AsyncSession, user_id: str, purpose: str) -> str:
+    """Create a token in the caller's transaction, returns it in clear for the email"""
+    await db.execute(delete(OneTimeToken).where(
+        OneTimeToken.user_id == user_id,
+        OneTimeToken.purpose == purpose,
+        OneTimeToken.used_at.is_(None)
+    ))
+    token = generate_verification_token()
+    db.add(OneTimeToken(
+        token_hash=token_hash(token),
+        user_id=user_id,
+        purpose=purpose,
+        expires_at=datetime.utcnow() + timedelta(hours=settings.EMAIL_VERIFICATION_TOKEN_EXPIRE_HOURS)
+    ))
+    return token
+
+
+async def peek_token(db: AsyncSession, token: str, purpose: str) -> Optional[OneTimeToken]:
+    """The token's row if it is still usable, without using it"""
+    return await db.scalar(select(OneTimeToken).where(
+        OneTimeToken.token_hash == token_hash(token),
+        OneTimeToken.purpose == purpose,
+        OneTimeToken.used_at.is_(None),
+        OneTimeToken.expires_at > datetime.utcnow()
+    ))
+
+
+async def consume_token(db: AsyncSession, token: str, purpose: str) -> Optional[str]:
+    """Mark the token used in the caller's transaction, returns its user id or None if not usable"""
+    now = datetime.utcnow()
+    return await db.scalar(
+        update(OneTimeToken)
+        .where(
+            OneTimeToken.token_hash == token_hash(token),
+            OneTimeToken.purpose == purpose,
+            OneTimeToken.used_at.is_(None),
+            OneTimeToken.expires_at > now
+        )
+        .values(used_at=now)
+        .returning(OneTimeToken.user_id)
+    )
+
+
+async def token_expired(db: AsyncSession, token: str, purpose: str) -> bool:
+    """Whether the token exists but ran out, for the error message of a failed consume"""
+    expires_at = await db.scalar(select(OneTimeToken.expires_at).where(
+        OneTimeToken.token_hash == token_hash(token),
+        OneTimeToken.purpose == purpose
+    ))
+    return expires_at is not None and expires_at <= datetime.utcnow()
+
+
+async def sweep_expired_tokens() -> int:
+    """Delete expired tokens (used or not) chunk by chunk, returns how many"""
+    removed = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            ids = (await db.scalars(
+                select(OneTimeToken.id)
+                .where(OneTimeToken.expires_at < datetime.utcnow())
+                .order_by(OneTimeToken.expires_at)
+                .limit(settings.MAINTENANCE_CHUNK_SIZE)
+            )).all()
+            if not ids:
+                break
+            await db.execute(delete(OneTimeToken).where(OneTimeToken.id.in_(ids)))
+            await db.commit()
+
+        removed += len(ids)
+        if len(ids) < settings.MAINTENANCE_CHUNK_SIZE:
+            break
+    return removed
@@ -0,0 +1,92 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram
+from app.core.security import verify_password, get_password_hash
+
+
+queue_seconds = Histogram(
+    "password_hash_queue_seconds", "Time a bcrypt operation waited for a pool thread", ("op",)
+)
+run_seconds = Histogram(
+    "password_hash_seconds", "Time a bcrypt operation ran on a pool thread", ("op",)
+)
+rejected = Counter(
+    "password_hash_rejected_total", "bcrypt operations refused with 503 because the queue was full", ("op",)
+)
+
+
+class PasswordHasher:
+    """
+    bcrypt on a dedicated pool of PASSWORD_HASH_WORKERS threads (bcrypt
+    releases the GIL, so they run in parallel with the event loop). At most
+    PASSWORD_HASH_MAX_QUEUE operations wait for a thread, beyond that
+    requests get 503 right away instead of piling up, so a login burst
+    costs at most the pool's cores and never the other endpoints' threads.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, op: str, fn: Callable, *args):
+        if self.pending >= self.workers + self.max_queue:
+            rejected.inc(op=op)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many password operations in progress, please retry shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            queue_seconds.observe(started - submitted, op=op)
+            try:
+                return fn(*args)
+            finally:
+                run_seconds.observe(time.perf_counter() - started, op=op)
+
+        #pending is only touched on the event loop thread. It drops when the
+        #pool's future is done rather than when the caller stops waiting: a
+        #cancelled request leaves bcrypt running on its thread
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        future = self._pool().submit(timed)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        return await asyncio.wrap_future(future)
+
+    def _release(self) -> None:
+        self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", verify_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_QUEUE)
+
+Gauge(
+    "password_hash_pending", "bcrypt operations running or waiting for a pool thread",
+    collect=lambda: {(): float(password_hasher.pending)}
+)
@@ -0,0 +1,230 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.core.metrics import Counter
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # only needed for the redis:// rate limit store
+    redis = None
+
+
+limited = Counter(
+    "rate_limit_rejected_total", "Requests refused with 429 by a rate limit", ("limit",)
+)
+
+
+def _estimate(previous: int, current: int, elapsed: float, window: float) -> float:
+    """
+    Sliding window counter: the previous fixed window's count weighted by how
+    much of it still overlaps the sliding window, plus the current count.
+    """
+    return previous * (1 - elapsed / window) + current
+
+
+def _retry_after(previous: int, current: int, elapsed: float, window: float, limit: int) -> float:
+    """Seconds until one more hit fits under `limit` (at least 1)"""
+    if limit <= 0:
+        #nothing ever fits, look again in a window
+        return max(1.0, window)
+    if current >= limit:
+        #the current window must become the previous one and decay below the limit
+        wait = window - elapsed + window * (1 - (limit - 1) / current)
+    elif previous:
+        wait = window * (1 - (limit - 1 - current) / previous) - elapsed
+    else:
+        wait = 0.0
+    return max(1.0, wait)
+
+
+class RateLimitStore:
+    """
+    Counts hits per key in sliding windows. hit() counts the hit and returns
+    0 when it is within the limit, otherwise it counts nothing and returns
+    the seconds until a hit would be allowed. check() answers the same
+    without counting.
+    """
+
+    async def check(self, key: str, limit: int, window: float) -> float:
+        raise NotImplementedError
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        raise NotImplementedError
+
+    async def reset(self, key: str, window: float) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """
+    Per-worker store: three numbers per key, in least recently hit order.
+    A key is evicted once it is the oldest and either idle for two windows
+    (it can no longer limit anything) or past max_keys.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        #key -> (window index, previous window count, current window count, window)
+        self._counters: OrderedDict[str, tuple[int, int, int, float]] = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        while self._counters:
+            index, _, _, window = next(iter(self._counters.values()))
+            if len(self._counters) <= self.max_keys and (index + 2) * window > now:
+                break
+            self._counters.popitem(last=False)
+
+    def _counts(self, key: str, window: float, now: float) -> tuple[int, int, int]:
+        """(window index, previous count, current count) of a key at `now`"""
+        self._evict(now)
+        index = int(now // window)
+        stored_index, previous, current, _ = self._counters.get(key, (index, 0, 0, window))
+        if stored_index == index - 1:
+            previous, current = current, 0
+        elif stored_index != index:
+            previous, current = 0, 0
+        return index, previous, current
+
+    async def check(self, key: str, limit: int, window: float) -> float:
+        now = time.time()
+        index, previous, current = self._counts(key, window, now)
+        elapsed = now - index * window
+        if _estimate(previous, current, elapsed, window) + 1 > limit:
+            return _retry_after(previous, current, elapsed, window, limit)
+        return 0.0
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        now = time.time()
+        index, previous, current = self._counts(key, window, now)
+
+        elapsed = now - index * window
+        if _estimate(previous, current, elapsed, window) + 1 > limit:
+            self._counters[key] = (index, previous, current, window)
+            self._counters.move_to_end(key)
+            return _retry_after(previous, current, elapsed, window, limit)
+
+        self._counters[key] = (index, previous, current + 1, window)
+        self._counters.move_to_end(key)
+        return 0.0
+
+    async def reset(self, key: str, window: float) -> None:
+        self._counters.pop(key, None)
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """
+    Store shared by every worker: one counter per key and fixed window,
+    expiring after two windows. Check and count are two round trips, so
+    concurrent hits on several workers can overshoot the limit by a few.
+    """
+
+    prefix = "flashcards:ratelimit:"
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_URL uses redis:// but the redis package is not installed")
+        self._client = redis.from_url(url)
+
+    async def check(self, key: str, limit: int, window: float) -> float:
+        now = time.time()
+        index = int(now // window)
+        previous, current = await self._client.mget(f"{self.prefix}{key}:{index - 1}", f"{self.prefix}{key}:{index}")
+        previous, current = int(previous or 0), int(current or 0)
+
+        elapsed = now - index * window
+        if _estimate(previous, current, elapsed, window) + 1 > limit:
+            return _retry_after(previous, current, elapsed, window, limit)
+        return 0.0
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        retry_after = await self.check(key, limit, window)
+        if retry_after:
+            return retry_after
+
+        current_key = f"{self.prefix}{key}:{int(time.time() // window)}"
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.incr(current_key)
+            pipe.expire(current_key, math.ceil(2 * window))
+            await pipe.execute()
+        return 0.0
+
+    async def reset(self, key: str, window: float) -> None:
+        index = int(time.time() // window)
+        await self._client.delete(f"{self.prefix}{key}:{index - 1}", f"{self.prefix}{key}:{index}")
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def create_store(url: str) -> RateLimitStore:
+    """Rate limit store for RATE_LIMIT_URL: memory:// or redis://host:port/db"""
+    if url.startswith("memory://"):
+        return InMemoryRateLimitStore(settings.RATE_LIMIT_MAX_KEYS)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisRateLimitStore(url)
+    raise ValueError(f"Unsupported RATE_LIMIT_URL: {url}")
+
+
+class LoginLimiter:
+    """
+    Login attempts per email (MAX_LOGIN_ATTEMPTS) and per client IP
+    (LOGIN_IP_MAX_ATTEMPTS) within LOGIN_ATTEMPT_WINDOW_MINUTES. Checked
+    before the users lookup and bcrypt, so a flood of guesses costs a
+    dictionary lookup per request once limited. An attempt refused by one
+    limit counts against none of them. A successful login clears its
+    email's count.
+    """
+
+    def __init__(self, store: Optional[RateLimitStore] = None):
+        self._store = store
+
+    @property
+    def store(self) -> RateLimitStore:
+        if self._store is None:
+            self._store = create_store(settings.RATE_LIMIT_URL)
+        return self._store
+
+    @property
+    def window(self) -> float:
+        return settings.LOGIN_ATTEMPT_WINDOW_MINUTES * 60
+
+    async def check(self, email: str, client_ip: Optional[str]) -> None:
+        window = self.window
+        limits = [("login_email", f"login:email:{email.strip().lower()}", settings.MAX_LOGIN_ATTEMPTS)]
+        if client_ip:
+            limits.append(("login_ip", f"login:ip:{client_ip}", settings.LOGIN_IP_MAX_ATTEMPTS))
+
+        #check every limit before counting the attempt against any
+        for name, key, limit in limits:
+            self._refuse(name, await self.store.check(key, limit, window))
+        for name, key, limit in limits:
+            self._refuse(name, await self.store.hit(key, limit, window))
+
+    @staticmethod
+    def _refuse(name: str, retry_after: float) -> None:
+        if retry_after:
+            limited.inc(limit=name)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, please try again later",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+    async def succeeded(self, email: str) -> None:
+        await self.store.reset(f"login:email:{email.strip().lower()}", self.window)
+
+    async def close(self) -> None:
+        if self._store is not None:
+            await self._store.close()
+            self._store = None
+
+
+login_limiter = LoginLimiter()
@@ -0,0 +1,269 @@
+"""
+Read replicas per shard, configured as REPLICA_DATABASE_URLS, e.g.
+REPLICA_DATABASE_URLS='{"0": ["postgresql://replica-a/flashcards"]}'.
+A replica is anything holding a consistent copy of its primary, the
+router only reads its change feed head. For local tests a file copy of a
+SQLite primary works (`sqlite3 flashcards.db ".backup replica.db"`),
+copying again later plays replication catching up.
+"""
+import asyncio
+import itertools
+from collections import deque
+import logging
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import SyncSession, async_database_url
+from app.core.engine_profiles import build_async_engine
+from app.core.metrics import Counter, Gauge
+from app.core.sharding import shard_map, session_shard
+from app.models.models import ChangeLog, User
+from app.services.notifications import notifier
+
+
+logger = logging.getLogger(__name__)
+
+#primary heads remembered per shard, a replica further behind is long past REPLICA_MAX_LAG_SECONDS
+HEAD_HISTORY = 10000
+
+read_routing = Counter(
+    "db_read_routing_total",
+    "Read-only handler sessions by routing decision",
+    ("shard", "decision")
+)
+
+
+class Replica:
+    """
+    A read replica of one shard. `head` is the highest change feed sequence
+    number it had applied at the last poll: every change up to it is visible.
+    """
+
+    def __init__(self, shard: int, index: int, url: str):
+        self.shard = shard
+        self.index = index
+        self.engine = build_async_engine(async_database_url(url))
+        self.sessions = async_sessionmaker(
+            self.engine,
+            sync_session_class=SyncSession,
+            autoflush=False,
+            expire_on_commit=False,
+            info={"shard": shard, "replica": index}
+        )
+        self.head = 0
+        self.primary_head = 0
+        self.healthy = False
+        #age of the oldest primary change it has not applied, as of the last poll
+        self.lag_seconds = 0.0
+
+
+class ReplicaRouter:
+    """
+    Sends read-only handlers to the replicas of the user's shard and keeps
+    read-your-writes per user: after a user's commit, their reads go to a
+    replica only once it has applied that commit, checked on the user's own
+    change feed head there (one index probe). A user's sequence numbers are
+    committed in order (change_feed.lock_change_feed) while the global head
+    is not, so a replica may show a higher seq of another user and still
+    miss this one. A sync cursor is checked the same way.
+    Commits of this worker are noted as they happen, those of other workers
+    arrive through the change notification broadcast: until it arrives (a
+    few milliseconds) a plain read on this worker may be served by a replica
+    without the other worker's commit. Reads with a cursor are not affected.
+    Replicas lagging more than REPLICA_MAX_LAG_SECONDS or failing their poll
+    get no reads.
+    """
+
+    def __init__(self, replica_urls: dict[int, list[str]]):
+        self.replicas = {
+            shard: [Replica(shard, index, url) for index, url in enumerate(urls)]
+            for shard, urls in replica_urls.items() if urls
+        }
+        self._turn = itertools.count()
+        #(head, when the poll first saw it) per shard, heads every replica has applied are dropped
+        self._primary_heads: dict[int, deque[tuple[int, float]]] = {shard: deque(maxlen=HEAD_HISTORY) for shard in self.replicas}
+        self._last_writes: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._poller: Optional[asyncio.Task] = None
+
+    def note_write(self, user_id: str, seq: int) -> None:
+        with self._lock:
+            if seq > self._last_writes.get(user_id, 0):
+                self._last_writes[user_id] = seq
+
+    async def read_sessions(self, user: User, min_seq: int = 0) -> Optional[async_sessionmaker]:
+        """
+        Replica session factory for a read of the user's data, None for the
+        primary. A replica must also have applied `min_seq` (a sync cursor).
+        """
+        shard = shard_map.shard_of(user)
+        replicas = [r for r in self.replicas.get(shard, ()) if r.healthy]
+        if not replicas:
+            read_routing.inc(shard=shard, decision="primary_no_replica")
+            return None
+
+        turn = next(self._turn)
+        replicas = replicas[turn % len(replicas):] + replicas[:turn % len(replicas)]
+        written = max(self._last_writes.get(user.id, 0), min_seq)
+        for replica in replicas:
+            if not written or await self._user_head(replica, user.id) >= written:
+                read_routing.inc(shard=shard, decision="replica")
+                return replica.sessions
+
+        read_routing.inc(shard=shard, decision="primary_read_your_writes")
+        return None
+
+    @staticmethod
+    async def _user_head(replica: Replica, user_id: str) -> int:
+        try:
+            async with replica.sessions() as db:
+                return await db.scalar(select(func.max(ChangeLog.seq)).where(ChangeLog.user_id == user_id)) or 0
+        except Exception as e:
+            logger.warning("Replica %d of shard %d is unreachable: %s", replica.index, replica.shard, e)
+            return 0
+
+    def factory_of(self, db) -> async_sessionmaker:
+        """Session factory of the primary or replica an open session reads from, for streamed reads"""
+        shard = session_shard(db)
+        if "replica" in db.info:
+            return self.replicas[shard][db.info["replica"]].sessions
+        return shard_map.async_sessions(shard)
+
+    async def start(self) -> None:
+        if self.replicas and self._poller is None:
+            await self.poll()
+            self._poller = asyncio.create_task(self._poll_forever())
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        for replicas in self.replicas.values():
+            for replica in replicas:
+                await replica.engine.dispose()
+
+    async def _poll_forever(self) -> None:
+        while True:
+            await asyncio.sleep(settings.REPLICA_POLL_SECONDS)
+            await self.poll()
+
+    async def poll(self) -> None:
+        """Read the change feed head of every primary and replica"""
+        for shard, replicas in self.replicas.items():
+            try:
+                async with shard_map.async_sessions(shard)() as db:
+                    primary_head = await db.scalar(select(func.max(ChangeLog.seq))) or 0
+            except Exception as e:
+                logger.warning("Replica poll could not read shard %d: %s", shard, e)
+                continue
+
+            now = time.monotonic()
+            heads = self._primary_heads[shard]
+            if not heads or primary_head > heads[-1][0]:
+                heads.append((primary_head, now))
+
+            for replica in replicas:
+                try:
+                    async with replica.sessions() as db:
+                        replica.head = await db.scalar(select(func.max(ChangeLog.seq))) or 0
+                except Exception as e:
+                    logger.warning("Replica %d of shard %d is unreachable: %s", replica.index, shard, e)
+                    replica.healthy = False
+                    continue
+
+                replica.lag_seconds = self._lag(heads, replica.head, now)
+                replica.healthy = replica.lag_seconds <= settings.REPLICA_MAX_LAG_SECONDS
+                replica.primary_head = primary_head
+
+            applied = min(r.head for r in replicas)
+            while len(heads) > 1 and heads[0][0] <= applied:
+                heads.popleft()
+
+        await self._forget_applied()
+
+    @staticmethod
+    def _lag(heads: deque, replica_head: int, now: float) -> float:
+        """
+        Time since the primary first showed a change the replica lacks: the
+        earliest poll that saw a head above the replica's. A replica a few
+        changes behind under steady writes lags by about a poll interval.
+        """
+        for head, seen_at in heads:
+            if head > replica_head:
+                return now - seen_at
+        return 0.0
+
+    @staticmethod
+    async def _user_heads(sessions: async_sessionmaker, user_ids: list[str]) -> dict[str, int]:
+        async with sessions() as db:
+            rows = await db.execute(
+                select(ChangeLog.user_id, func.max(ChangeLog.seq))
+                .where(ChangeLog.user_id.in_(user_ids))
+                .group_by(ChangeLog.user_id)
+            )
+            return dict(rows.all())
+
+    async def _forget_applied(self) -> None:
+        """
+        Drop the users whose last write every replica has applied. A shard
+        only holds a user's rows if it is theirs (or was, before a move), so
+        a replica must have the user's head on its primary up to the write.
+        """
+        with self._lock:
+            pending = dict(self._last_writes)
+        if not pending:
+            return
+
+        user_ids = list(pending)
+        applied = set(user_ids)
+        for shard, replicas in self.replicas.items():
+            try:
+                primary = await self._user_heads(shard_map.async_sessions(shard), user_ids)
+                for replica in replicas:
+                    have = await self._user_heads(replica.sessions, user_ids)
+                    applied -= {u for u in user_ids if have.get(u, 0) < min(pending[u], primary.get(u, 0))}
+            except Exception as e:
+                logger.warning("Replica poll could not check the writes of shard %d: %s", shard, e)
+                applied.clear()
+
+        with self._lock:
+            for user_id in applied:
+                if self._last_writes.get(user_id) == pending[user_id]:
+                    del self._last_writes[user_id]
+
+    def lag(self) -> dict:
+        return {
+            (r.shard, r.index): float(max(0, r.primary_head - r.head))
+            for replicas in self.replicas.values() for r in replicas
+        }
+
+
+replica_router = ReplicaRouter(settings.REPLICA_DATABASE_URLS)
+if replica_router.replicas:
+    notifier.observers.append(replica_router.note_write)
+
+Gauge(
+    "db_replica_lag_seconds", "Age of the oldest primary change a replica has not applied",
+    ("shard", "replica"),
+    collect=lambda: {(r.shard, r.index): r.lag_seconds for rs in replica_router.replicas.values() for r in rs}
+)
+Gauge(
+    "db_replica_lag_changes", "Change feed rows the primary has and the replica has not applied",
+    ("shard", "replica"),
+    collect=replica_router.lag
+)
+Gauge(
+    "db_replica_healthy", "Whether a replica gets reads (reachable and within REPLICA_MAX_LAG_SECONDS)",
+    ("shard", "replica"),
+    collect=lambda: {(r.shard, r.index): float(r.healthy) for rs in replica_router.replicas.values() for r in rs}
+)
+Gauge(
+    "db_read_your_writes_users", "Users whose reads stick to the primary until replicas apply their writes",
+    collect=lambda: {(): float(len(replica_router._last_writes))}
+)
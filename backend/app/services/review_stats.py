@@ -0,0 +1,229 @@
+"""
+Study statistics from hourly rollups of the review logs.
+
+review_stats counts, per user, collection and UTC hour, the reviews and
+how many got each quality; collection_id "" (ACCOUNT_TOTAL) holds the
+user's totals. record_reviews adds to it in the transaction inserting
+the logs (review log create and sync push), so a statistics range reads
+at most 24 rows per day however many reviews it covers. Hours rather
+than days let a range start at the client's midnight and give the
+time-of-day heat map.
+
+    python -m app.services.review_stats backfill [--user USER_ID]
+
+rebuilds the rollups of every user with review logs (or one) from the
+logs, for history written before the rollups existed. Each user is
+rebuilt in one transaction under a lock that orders it with the
+transactions adding reviews, so it can run while the app serves requests.
+"""
+import argparse
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import select, insert, update, delete, text, bindparam, DateTime
+from sqlalchemy.orm import Session
+
+from app.core.database import on_conflict_insert
+from app.core.sharding import shard_map, DIRECTORY_SHARD
+from app.models.models import User, Card, ReviewLog, ReviewStats
+
+
+logger = logging.getLogger(__name__)
+
+QUALITIES = ("wrong", "hard", "good", "easy", "perfect")
+COUNTS = ("reviews",) + QUALITIES
+ACCOUNT_TOTAL = ""
+FETCH_SIZE = 10000
+
+#compiled once like the digest upsert; hour is typed so SQLite stores it as the ORM does
+_STATS_UPSERT = text(
+    "INSERT INTO review_stats (user_id, collection_id, hour, " + ", ".join(COUNTS) + ") "
+    "VALUES (:user_id, :collection_id, :hour, " + ", ".join(f":{c}" for c in COUNTS) + ") "
+    "ON CONFLICT (user_id, collection_id, hour) DO UPDATE SET "
+    + ", ".join(f"{c} = review_stats.{c} + excluded.{c}" for c in COUNTS)
+).bindparams(bindparam("hour", type_=DateTime))
+
+
+def hour_of(reviewed_at: datetime) -> datetime:
+    """Start of the hour of a review time (naive UTC, as ReviewLogCreate stores it)"""
+    return reviewed_at.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup(user_id: str, reviews: Iterable[tuple]) -> list[dict]:
+    """Rollup rows of reviews given as (collection id, quality, reviewed_at), in key order"""
+    buckets: dict[tuple, dict] = {}
+    for collection_id, quality, reviewed_at in reviews:
+        hour = hour_of(reviewed_at)
+        for key in ((collection_id, hour), (ACCOUNT_TOTAL, hour)):
+            row = buckets.get(key)
+            if row is None:
+                row = buckets[key] = {"user_id": user_id, "collection_id": key[0], "hour": hour, **dict.fromkeys(COUNTS, 0)}
+            row["reviews"] += 1
+            if quality in QUALITIES:
+                row[quality] += 1
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def add_rows(db: Session, rows: list[dict]) -> None:
+    """Add rollup rows to the stored counts"""
+    conn = db.connection()
+    if on_conflict_insert(conn) is not None:
+        conn.execute(_STATS_UPSERT, rows)
+        return
+
+    table = ReviewStats.__table__
+    for row in rows:
+        added = conn.execute(
+            update(table)
+            .where(table.c.user_id == row["user_id"], table.c.collection_id == row["collection_id"], table.c.hour == row["hour"])
+            .values(**{c: table.c[c] + row[c] for c in COUNTS})
+        )
+        if added.rowcount == 0:
+            conn.execute(insert(table).values(**row))
+
+
+def lock_rollups(db: Session, user_id: str, exclusive: bool = False) -> None:
+    """
+    Lock the user's row of this shard (a placeholder off the directory):
+    shared by writers counting reviews, exclusive for a rebuild, so a
+    rebuild never overlaps a transaction adding reviews. No-op on SQLite,
+    where writers are serialized anyway.
+    """
+    lock = select(User.id).where(User.id == user_id)
+    #FOR KEY SHARE does not block other writers nor updates of the user row, FOR UPDATE blocks it
+    db.execute(lock.with_for_update() if exclusive else lock.with_for_update(read=True, key_share=True))
+
+
+def record_reviews(db: Session, user_id: str, reviews: Iterable[tuple]) -> None:
+    """Count inserted reviews ((collection id, quality, reviewed_at)) in the user's rollups, in the caller's transaction"""
+    rows = rollup(user_id, reviews)
+    if rows:
+        lock_rollups(db, user_id)
+        add_rows(db, rows)
+
+
+# ==========================================
+# QUERIES
+# ==========================================
+@dataclass
+class Stats:
+    """Statistics of a range of local days"""
+    totals: dict[str, int]
+    days: dict[date, dict[str, int]]  #days with reviews
+    hours: list[int]  #reviews by local hour of day
+    current_streak: int
+    longest_streak: int
+
+
+def _streaks(studied: set[date], start: date, end: date) -> tuple[int, int]:
+    """(current, longest) runs of days with reviews in the range; the current one may stop the day before `end`"""
+    longest = run = 0
+    day = start
+    while day <= end:
+        run = run + 1 if day in studied else 0
+        longest = max(longest, run)
+        day += timedelta(days=1)
+
+    current = 0
+    day = end if end in studied else end - timedelta(days=1)
+    while day >= start and day in studied:
+        current += 1
+        day -= timedelta(days=1)
+    return current, longest
+
+
+def range_stats(db: Session, user_id: str, collection_id: Optional[str], start: date, end: date, utc_offset_hours: int = 0) -> Stats:
+    """Statistics of the local days start..end (inclusive), local time being UTC + utc_offset_hours"""
+    offset = timedelta(hours=utc_offset_hours)
+    rows = db.execute(
+        select(ReviewStats.hour, *(ReviewStats.__table__.c[c] for c in COUNTS))
+        .where(
+            ReviewStats.user_id == user_id,
+            ReviewStats.collection_id == (collection_id or ACCOUNT_TOTAL),
+            ReviewStats.hour >= datetime.combine(start, datetime.min.time()) - offset,
+            ReviewStats.hour < datetime.combine(end + timedelta(days=1), datetime.min.time()) - offset
+        )
+        .order_by(ReviewStats.hour)
+    ).all()
+
+    totals = dict.fromkeys(COUNTS, 0)
+    days: dict[date, dict[str, int]] = {}
+    hours = [0] * 24
+    for row in rows:
+        local = row.hour + offset
+        day = days.setdefault(local.date(), dict.fromkeys(COUNTS, 0))
+        for c in COUNTS:
+            day[c] += getattr(row, c)
+            totals[c] += getattr(row, c)
+        hours[local.hour] += row.reviews
+
+    current, longest = _streaks({d for d, counts in days.items() if counts["reviews"]}, start, end)
+    return Stats(totals, days, hours, current, longest)
+
+
+# ==========================================
+# BACKFILL
+# ==========================================
+def rebuild_user(db: Session, user_id: str) -> int:
+    """
+    Recount a user's rollups from their review logs (not committed here),
+    returns the number of reviews. The exclusive lock waits for the
+    transactions adding reviews and holds new ones until the rebuild
+    commits, their counts then go on top of it: each review is counted once
+    on any isolation level.
+    """
+    lock_rollups(db, user_id, exclusive=True)
+    db.execute(delete(ReviewStats).where(ReviewStats.user_id == user_id))
+    logs = db.execute(
+        select(Card.collection_id, ReviewLog.quality, ReviewLog.reviewed_at)
+        .join(Card, Card.id == ReviewLog.card_id)
+        .where(ReviewLog.user_id == user_id)
+        .execution_options(yield_per=FETCH_SIZE)
+    )
+    rows = rollup(user_id, (tuple(log) for log in logs))
+    if rows:
+        add_rows(db, rows)
+    return sum(r["reviews"] for r in rows if r["collection_id"] == ACCOUNT_TOTAL)
+
+
+def backfill(shard: int, user_id: Optional[str] = None) -> tuple[int, int]:
+    """Rebuild the rollups of the users with review logs on a shard, returns (users, reviews)"""
+    users = reviews = 0
+    with shard_map.sessions(shard)() as db:
+        ids = [user_id] if user_id else db.scalars(select(ReviewLog.user_id).distinct()).all()
+        for i in ids:
+            reviews += rebuild_user(db, i)
+            db.commit()
+            users += 1
+            if users % 100 == 0:
+                logger.info("shard %d: %d/%d users", shard, users, len(ids))
+    return users, reviews
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Study statistics rollups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("backfill", help="rebuild rollups from the review logs")
+    rebuild.add_argument("--user", help="only this user")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    shards = range(len(shard_map))
+    if args.user:
+        with shard_map.sessions(DIRECTORY_SHARD)() as db:
+            user = db.get(User, args.user)
+        if user is None:
+            parser.error(f"Unknown user {args.user}")
+        shards = [shard_map.shard_of(user)]
+
+    for shard in shards:
+        started = time.perf_counter()
+        users, reviews = backfill(shard, args.user)
+        print(f"shard {shard}: {reviews} reviews of {users} users counted in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
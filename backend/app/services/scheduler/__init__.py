@@ -0,0 +1,18 @@
+"""
+Server-side FSRS scheduling: app.services.scheduler.fsrs computes the
+app's schedule on NumPy arrays of card states, app.services.scheduler.batch
+applies it to stored cards in chunks and app.services.scheduler.optimizer
+fits per-user weights to review logs.
+"""
+from app.services.scheduler.fsrs import (
+    DEFAULT_WEIGHTS,
+    REQUEST_RETENTION,
+    QUALITY_CODES,
+    CardStates,
+    quality_codes,
+    review,
+    review_with_retrievability,
+    reschedule,
+    shift,
+    replay
+)
@@ -0,0 +1,218 @@
+"""
+Bulk rescheduling of stored cards with app.services.scheduler.fsrs.
+
+Cards are read in chunks of SCHEDULER_CHUNK_SIZE live cards (keyset on
+the card id), turned into arrays, transformed in one vectorized pass and
+written back in the same transaction, one per chunk. Only cards whose
+state changed are written: their version is bumped and a change row is
+recorded, so clients pull the new schedule on their next sync. A card
+edited since it was read (its version moved) is left as the edit made it.
+
+    python -m app.services.scheduler.batch retention 0.85 [--user USER_ID]
+    python -m app.services.scheduler.batch shift 3 [--due-before 2026-11-01] [--user USER_ID]
+    python -m app.services.scheduler.batch replay [--user USER_ID]
+
+`retention` moves reviews to a new retention target, `shift` moves
+scheduled reviews by a number of days (negative brings them forward),
+`replay` recomputes every reviewed card from its review logs with the
+current weights. Without --user every user on every shard is processed.
+"""
+import argparse
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+import numpy as np
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+from app.core.sharding import shard_map, DIRECTORY_SHARD
+from app.models.models import User, Card, ReviewLog
+from app.services.change_feed import lock_change_feed, record_changes
+from app.services.scheduler.fsrs import CardStates, quality_codes, reschedule, shift, replay
+from app.services.sync_engine import chunked
+
+
+logger = logging.getLogger(__name__)
+
+#maps the states of a chunk (and its card ids) to their new states
+Transform = Callable[[Session, list[str], CardStates], CardStates]
+
+_COLUMNS = (Card.id, Card.user_id, Card.collection_id, Card.version,
+            Card.ease_factor, Card.interval, Card.repetitions, Card.next_review_date)
+
+_WRITE_BACK = (
+    update(Card.__table__)
+    .where(Card.__table__.c.id == bindparam("_id"), Card.__table__.c.version == bindparam("_version"))
+    .values(
+        ease_factor=bindparam("_ease_factor"),
+        interval=bindparam("_interval"),
+        repetitions=bindparam("_repetitions"),
+        next_review_date=bindparam("_next_review_date"),
+        version=Card.__table__.c.version + 1,
+        updated_at=bindparam("_updated_at")
+    )
+)
+
+
+def to_datetime64(values: list[Optional[datetime]]) -> np.ndarray:
+    return np.array([v if v is not None else np.datetime64("NaT") for v in values], dtype="datetime64[us]")
+
+
+def states_of(rows: list) -> CardStates:
+    return CardStates(
+        ease_factor=np.fromiter((r.ease_factor for r in rows), dtype=np.float64, count=len(rows)),
+        interval=np.fromiter((r.interval for r in rows), dtype=np.int64, count=len(rows)),
+        repetitions=np.fromiter((r.repetitions for r in rows), dtype=np.int64, count=len(rows)),
+        next_review=to_datetime64([r.next_review_date for r in rows])
+    )
+
+
+def card_chunks(db: Session, user_id: Optional[str], size: int):
+    """Live cards (of one user or all) in chunks ordered by id"""
+    after = ""
+    while True:
+        query = select(*_COLUMNS).where(Card.is_deleted == False, Card.id > after)
+        if user_id:
+            query = query.where(Card.user_id == user_id)
+        rows = db.execute(query.order_by(Card.id).limit(size)).all()
+        if not rows:
+            return
+        yield rows
+        after = rows[-1].id
+
+
+def write_back(db: Session, rows: list, before: CardStates, after: CardStates) -> int:
+    """Write the changed states of a chunk and record them in the change feed, returns how many"""
+    changed = np.flatnonzero(before.changed(after))
+    if not len(changed):
+        return 0
+
+    now = datetime.utcnow()
+    next_reviews = after.next_review[changed].astype(object)
+    params = [
+        {
+            "_id": rows[i].id,
+            "_version": rows[i].version,
+            "_ease_factor": float(after.ease_factor[i]),
+            "_interval": int(after.interval[i]),
+            "_repetitions": int(after.repetitions[i]),
+            "_next_review_date": next_review,
+            "_updated_at": now,
+        }
+        for i, next_review in zip(changed.tolist(), next_reviews)
+    ]
+    by_user: dict[str, dict[str, str]] = {}
+    for i in changed.tolist():
+        by_user.setdefault(rows[i].user_id, {})[rows[i].id] = rows[i].collection_id
+    #the users' change feed locks before their cards, in the order sync pushes take them
+    for user_id in sorted(by_user):
+        lock_change_feed(db, user_id)
+
+    for chunk in chunked(params):
+        db.execute(_WRITE_BACK, chunk)
+    for user_id, changes in by_user.items():
+        record_changes(db, user_id, "card", changes)
+    return len(changed)
+
+
+def apply(sessions: sessionmaker, transform: Transform, user_id: Optional[str] = None, size: Optional[int] = None) -> tuple[int, int]:
+    """Run a transform over the live cards of one shard, returns (cards read, cards written)"""
+    size = size or settings.SCHEDULER_CHUNK_SIZE
+    read = written = 0
+    with sessions() as db:
+        for rows in card_chunks(db, user_id, size):
+            before = states_of(rows)
+            after = transform(db, [r.id for r in rows], before)
+            written += write_back(db, rows, before, after)
+            db.commit()
+            read += len(rows)
+    return read, written
+
+
+def retention_transform(retention: float) -> Transform:
+    return lambda db, card_ids, states: reschedule(states, retention)
+
+
+def shift_transform(days: float, due_before: Optional[datetime] = None) -> Transform:
+    limit = np.datetime64(due_before, "us") if due_before else None
+    return lambda db, card_ids, states: shift(states, days, limit)
+
+
+def replay_transform(weights: Optional[np.ndarray] = None, retention: Optional[float] = None) -> Transform:
+    """Recompute reviewed cards from their logs, cards without logs are kept"""
+    extra = {}
+    if weights is not None:
+        extra["weights"] = weights
+    if retention is not None:
+        extra["retention"] = retention
+
+    def transform(db: Session, card_ids: list[str], states: CardStates) -> CardStates:
+        positions = {card_id: i for i, card_id in enumerate(card_ids)}
+        logs = []
+        for ids in chunked(card_ids, 500):
+            logs += db.execute(
+                select(ReviewLog.card_id, ReviewLog.quality, ReviewLog.reviewed_at)
+                .where(ReviewLog.card_id.in_(ids))
+            ).all()
+        if not logs:
+            return states
+
+        card_index = np.fromiter((positions[log.card_id] for log in logs), dtype=np.int64, count=len(logs))
+        replayed, _ = replay(
+            card_index,
+            quality_codes([log.quality for log in logs]),
+            to_datetime64([log.reviewed_at for log in logs]),
+            len(card_ids),
+            **extra
+        )
+        reviewed = np.zeros(len(card_ids), dtype=bool)
+        reviewed[card_index] = True
+        result = states.take(np.arange(len(states)))
+        result.put(np.flatnonzero(reviewed), replayed.take(np.flatnonzero(reviewed)))
+        return result
+
+    return transform
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reschedule stored cards in bulk")
+    parser.add_argument("--user", help="only this user's cards")
+    parser.add_argument("--chunk-size", type=int, default=0, help=f"cards per transaction (default {settings.SCHEDULER_CHUNK_SIZE})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    retention = commands.add_parser("retention", help="move reviews to a new retention target")
+    retention.add_argument("target", type=float)
+    shifted = commands.add_parser("shift", help="move scheduled reviews by a number of days")
+    shifted.add_argument("days", type=float)
+    shifted.add_argument("--due-before", type=datetime.fromisoformat, help="only reviews due before this time")
+    commands.add_parser("replay", help="recompute reviewed cards from their review logs")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "retention":
+        if not 0 < args.target < 1:
+            parser.error("the retention target is a probability between 0 and 1")
+        transform = retention_transform(args.target)
+    elif args.command == "shift":
+        transform = shift_transform(args.days, args.due_before)
+    else:
+        transform = replay_transform()
+
+    shards = range(len(shard_map))
+    if args.user:
+        with shard_map.sessions(DIRECTORY_SHARD)() as db:
+            user = db.get(User, args.user)
+        if user is None:
+            parser.error(f"Unknown user {args.user}")
+        shards = [shard_map.shard_of(user)]
+
+    for shard in shards:
+        started = time.perf_counter()
+        read, written = apply(shard_map.sessions(shard), transform, args.user, args.chunk_size)
+        print(f"shard {shard}: {read} cards read, {written} rescheduled in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+FSRS scheduling on NumPy arrays, ported from the app's
+lib/services/spaced_repetition_service.dart so the server computes the
+same schedule the app does, for any number of cards in one pass.
+
+The app keeps the FSRS state in the SM-2 columns: `interval` is the
+stability in days (at the 0.9 retention target both are equal) and
+`ease_factor` maps to the difficulty. The port keeps the app's choices,
+including measuring elapsed time from the due date rather than from the
+last review, so a card rescheduled here matches one reviewed in the app.
+
+Every function also takes a batch of weight sets (shape (k, 19)), the
+card arrays then get a leading axis of k. States created with exact=True
+keep the stability unrounded in a float interval, which makes the
+schedule a smooth function of the weights for fitting them
+(app.services.scheduler.optimizer).
+"""
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+
+
+DEFAULT_WEIGHTS = np.array([
+    0.4072, 1.1829, 3.1262, 15.4722, 7.2102,
+    0.5316, 1.0651, 0.0234, 1.616, 0.1544,
+    1.0824, 1.9813, 0.0953, 0.2975, 2.2042,
+    0.2407, 2.9466, 0.5034, 0.6567
+])
+
+REQUEST_RETENTION = 0.9
+MAXIMUM_INTERVAL = 36500.0
+MINIMUM_INTERVAL = 1.0
+
+#review qualities as stored in review_logs.quality, by code
+WRONG, HARD, GOOD, EASY = range(4)
+QUALITY_CODES = {"wrong": WRONG, "hard": HARD, "good": GOOD, "easy": EASY, "perfect": EASY}
+
+DAY = np.timedelta64(86400 * 10**6, "us")
+#a new card answered wrong comes back within the session
+RELEARN_DELAY = np.timedelta64(600 * 10**6, "us")
+
+Timestamps = Union[np.datetime64, np.ndarray]
+
+
+@dataclass
+class CardStates:
+    """Scheduling columns of n cards (last axis), one array each"""
+    ease_factor: np.ndarray  #float64
+    interval: np.ndarray  #int64 days, float64 when exact
+    repetitions: np.ndarray  #int64
+    next_review: np.ndarray  #datetime64[us], NaT for new cards
+
+    @classmethod
+    def new(cls, n: int, batch: Optional[int] = None, exact: bool = False) -> "CardStates":
+        shape = (n,) if batch is None else (batch, n)
+        return cls(
+            ease_factor=np.full(shape, 2.5),
+            interval=np.zeros(shape, dtype=np.float64 if exact else np.int64),
+            repetitions=np.zeros(shape, dtype=np.int64),
+            next_review=np.full(shape, np.datetime64("NaT"), dtype="datetime64[us]")
+        )
+
+    @property
+    def exact(self) -> bool:
+        return self.interval.dtype.kind == "f"
+
+    def __len__(self) -> int:
+        return self.interval.shape[-1]
+
+    def take(self, index: np.ndarray) -> "CardStates":
+        return CardStates(
+            self.ease_factor[..., index], self.interval[..., index],
+            self.repetitions[..., index], self.next_review[..., index]
+        )
+
+    def put(self, index: np.ndarray, states: "CardStates") -> None:
+        self.ease_factor[..., index] = states.ease_factor
+        self.interval[..., index] = states.interval
+        self.repetitions[..., index] = states.repetitions
+        self.next_review[..., index] = states.next_review
+
+    def changed(self, other: "CardStates") -> np.ndarray:
+        """Mask of the cards whose state differs from `other`'s"""
+        same_review = (self.next_review == other.next_review) | (np.isnat(self.next_review) & np.isnat(other.next_review))
+        return (
+            (self.ease_factor != other.ease_factor)
+            | (self.interval != other.interval)
+            | (self.repetitions != other.repetitions)
+            | ~same_review
+        )
+
+
+def quality_codes(qualities) -> np.ndarray:
+    return np.fromiter((QUALITY_CODES[q] for q in qualities), dtype=np.int64, count=len(qualities))
+
+
+def ease_to_difficulty(ease_factor: np.ndarray) -> np.ndarray:
+    return np.clip(11 - ease_factor * 3, 1.0, 10.0)
+
+
+def difficulty_to_ease(difficulty: np.ndarray) -> np.ndarray:
+    return np.clip((11 - difficulty) / 3, 1.3, 3.0)
+
+
+def retrievability(stability: np.ndarray, elapsed_days: np.ndarray) -> np.ndarray:
+    return 1 / (1 + elapsed_days / (9 * stability))
+
+
+def stability_to_interval(stability: np.ndarray, retention: float = REQUEST_RETENTION) -> np.ndarray:
+    return np.clip(stability * 9 * (1 / retention - 1), MINIMUM_INTERVAL, MAXIMUM_INTERVAL)
+
+
+def _round(days: np.ndarray) -> np.ndarray:
+    #Dart rounds halves away from zero, np.round to even
+    return np.floor(days + 0.5).astype(np.int64)
+
+
+def _duration(days: np.ndarray) -> np.ndarray:
+    return (np.asarray(days) * DAY.astype(np.int64)).astype(np.int64).astype("timedelta64[us]")
+
+
+def _weights(weights: np.ndarray) -> np.ndarray:
+    #w[i] is a scalar-like (1,) for one weight set, a column (k, 1) for a batch of them
+    return np.asarray(weights, dtype=np.float64).T[..., None]
+
+
+def review_with_retrievability(
+    states: CardStates,
+    quality: np.ndarray,
+    now: Timestamps,
+    weights: np.ndarray = DEFAULT_WEIGHTS,
+    retention: float = REQUEST_RETENTION
+) -> tuple[CardStates, np.ndarray]:
+    """
+    States after reviewing every card at `now` with `quality` (codes), and
+    the recall probability the model gave each card before the review
+    (NaN for new cards).
+    """
+    w = _weights(weights)
+    now = np.broadcast_to(np.asarray(now, dtype="datetime64[us]"), quality.shape)
+    new = np.isnat(states.next_review) | (states.repetitions == 0)
+    wrong = quality == WRONG
+
+    #an interval of 0 only comes with repetitions 0 from the app, any other is treated as a day
+    stability = np.maximum(states.interval.astype(np.float64), MINIMUM_INTERVAL)
+    difficulty = ease_to_difficulty(states.ease_factor)
+    due = np.where(new, now, states.next_review)
+    if states.exact:
+        elapsed = np.maximum((now - due) / DAY, 0)
+    else:
+        elapsed = np.maximum((now - due) // DAY, 0).astype(np.float64)
+    recall = retrievability(stability, elapsed)
+
+    hard_penalty = np.where(quality == HARD, w[15], 1.0)
+    easy_bonus = np.where(quality == EASY, w[16], 1.0)
+    stability_success = stability * (
+        1 + np.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+        * (np.exp((1 - recall) * w[10]) - 1) * hard_penalty * easy_bonus
+    )
+    stability_lapse = np.maximum(
+        MINIMUM_INTERVAL,
+        w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1)
+    )
+    difficulty_success = np.clip(difficulty - w[6] * (quality + 1 - 3), 1.0, 10.0)
+    difficulty_lapse = np.clip(difficulty + w[7], 1.0, 10.0)
+
+    #new cards start from the weight of their first answer (hard, good, easy: w1..w3)
+    new_stability = np.where(quality == HARD, w[1], np.where(quality == GOOD, w[2], w[3]))
+    new_difficulty = (7 - quality).astype(np.float64)
+
+    stability = np.where(new, new_stability, np.where(wrong, stability_lapse, stability_success))
+    difficulty = np.where(new, new_difficulty, np.where(wrong, difficulty_lapse, difficulty_success))
+    interval = stability_to_interval(stability, retention)
+    if not states.exact:
+        interval = _round(interval)
+
+    relearn = new & wrong
+    interval = np.where(relearn, 0, interval).astype(states.interval.dtype)
+    result = CardStates(
+        ease_factor=np.where(relearn, 2.5, difficulty_to_ease(difficulty)),
+        interval=interval,
+        repetitions=np.where(relearn, 0, np.where(new, 1, np.where(wrong, 0, states.repetitions + 1))),
+        next_review=np.where(relearn, now + RELEARN_DELAY, now + _duration(interval))
+    )
+    return result, np.where(new, np.nan, recall)
+
+
+def review(
+    states: CardStates,
+    quality: np.ndarray,
+    now: Timestamps,
+    weights: np.ndarray = DEFAULT_WEIGHTS,
+    retention: float = REQUEST_RETENTION
+) -> CardStates:
+    """States after reviewing every card at `now` with `quality` (codes), as calculateNextReview"""
+    return review_with_retrievability(states, quality, now, weights, retention)[0]
+
+
+def reschedule(states: CardStates, retention: float) -> CardStates:
+    """
+    Move scheduled reviews to where a different retention target puts
+    them, counted from the review that scheduled them. Intervals keep
+    holding the stability, so the app's next review is unaffected.
+    """
+    scheduled = ~np.isnat(states.next_review) & (states.interval > 0)
+    last_review = states.next_review - _duration(states.interval)
+    interval = stability_to_interval(states.interval.astype(np.float64), retention)
+    if not states.exact:
+        interval = _round(interval)
+    next_review = np.where(scheduled, last_review + _duration(interval), states.next_review)
+    return CardStates(states.ease_factor.copy(), states.interval.copy(), states.repetitions.copy(), next_review)
+
+
+def shift(states: CardStates, days: float, due_before: Optional[np.datetime64] = None) -> CardStates:
+    """Move scheduled reviews (only those due before `due_before` if given) by `days`"""
+    moved = ~np.isnat(states.next_review)
+    if due_before is not None:
+        moved &= states.next_review < due_before
+    offset = np.timedelta64(int(round(days * 86400 * 10**6)), "us")
+    next_review = np.where(moved, states.next_review + offset, states.next_review)
+    return CardStates(states.ease_factor.copy(), states.interval.copy(), states.repetitions.copy(), next_review)
+
+
+def replay(
+    card_index: np.ndarray,
+    quality: np.ndarray,
+    reviewed_at: np.ndarray,
+    n_cards: int,
+    weights: np.ndarray = DEFAULT_WEIGHTS,
+    retention: float = REQUEST_RETENTION,
+    exact: bool = False
+) -> tuple[CardStates, np.ndarray]:
+    """
+    Rebuild the states of n_cards from their review history (one entry per
+    review: card index, quality code, time), e.g. after a weights change.
+    One vectorized step per review depth: step k applies every card's k-th
+    review. Also returns, in input order, the forgetting curve's recall
+    probability at each review given the stability and time since the
+    card's previous review (NaN where there is none).
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    batch = weights.shape[0] if weights.ndim == 2 else None
+    order = np.lexsort((reviewed_at, card_index))
+    counts = np.bincount(card_index, minlength=n_cards)
+    starts = np.cumsum(counts) - counts
+
+    states = CardStates.new(n_cards, batch, exact)
+    last_review = np.full(n_cards, np.datetime64("NaT"), dtype="datetime64[us]")
+    recall = np.full(weights.shape[:-1] + (len(card_index),), np.nan)
+    for depth in range(int(counts.max(initial=0))):
+        cards = np.flatnonzero(counts > depth)
+        rows = order[starts[cards] + depth]
+        before = states.take(cards)
+        if depth:
+            stability = before.interval.astype(np.float64)
+            elapsed = np.maximum((reviewed_at[rows] - last_review[cards]) / DAY, 0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                recall[..., rows] = np.where(stability > 0, retrievability(stability, elapsed), np.nan)
+        states.put(cards, review(before, quality[rows], reviewed_at[rows], weights, retention))
+        last_review[cards] = reviewed_at[rows]
+    return states, recall
@@ -0,0 +1,245 @@
+"""
+Per-user FSRS weights fitted to the user's review logs.
+
+A user's logs are streamed from their shard into arrays and replayed with
+app.services.scheduler.fsrs in exact mode; the loss is the log loss of the
+forgetting curve's recall probability at each review against whether the
+answer was right. Only the weights the replay depends on are fitted, as
+w0 * exp(theta) so they keep their sign. Each step evaluates the loss of
+every central finite-difference pair in one batched replay over a
+mini-batch of cards (about SCHEDULER_FIT_BATCH_REVIEWS reviews) and takes
+an Adam step; the weights are kept only if they beat the defaults on the
+whole history.
+
+    python -m app.services.scheduler.optimizer [--user USER_ID] [--workers N] [--min-reviews N] [--force]
+
+Users are fitted in a process pool, results are stored in the directory
+(scheduler_parameters) as they come in. Users whose review count has not
+changed since their last fit are skipped unless --force is given.
+"""
+import argparse
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.sharding import shard_map, DIRECTORY_SHARD
+from app.models.models import User, ReviewLog, SchedulerParameters
+from app.services.scheduler.fsrs import DEFAULT_WEIGHTS, REQUEST_RETENTION, QUALITY_CODES, WRONG, replay
+
+
+logger = logging.getLogger(__name__)
+
+#weights the replay reads: first-answer stabilities, difficulty steps, recall and lapse stability, hard/easy factors
+FITTED = np.array([1, 2, 3, 6, 7, 8, 9, 10, 11, 12, 13, 15, 16])
+STEP = 1e-3  #finite difference, in theta
+THETA_LIMIT = 3.0
+LEARNING_RATE = 0.05
+FETCH_SIZE = 10000
+
+
+@dataclass
+class History:
+    """A user's review logs as arrays, cards numbered from 0"""
+    card_index: np.ndarray
+    quality: np.ndarray
+    reviewed_at: np.ndarray
+    n_cards: int
+
+    def __len__(self) -> int:
+        return len(self.card_index)
+
+    def cards(self, selected: np.ndarray) -> "History":
+        """The reviews of the selected cards (indices), renumbered"""
+        numbering = np.full(self.n_cards, -1)
+        numbering[selected] = np.arange(len(selected))
+        rows = np.flatnonzero(numbering[self.card_index] >= 0)
+        return History(numbering[self.card_index[rows]], self.quality[rows], self.reviewed_at[rows], len(selected))
+
+
+@dataclass
+class Fit:
+    weights: list[float]
+    log_loss: float
+    default_log_loss: float
+    review_count: int
+    steps: int
+    seconds: float
+
+
+def load_history(db: Session, user_id: str) -> History:
+    """Stream a user's review logs, reviews with an unknown quality are left out"""
+    positions: dict[str, int] = {}
+    card_index, quality, reviewed_at = [], [], []
+    result = db.execute(
+        select(ReviewLog.card_id, ReviewLog.quality, ReviewLog.reviewed_at)
+        .where(ReviewLog.user_id == user_id)
+        .execution_options(yield_per=FETCH_SIZE)
+    )
+    for rows in result.partitions():
+        rows = [r for r in rows if r.quality in QUALITY_CODES]
+        card_index.append(np.fromiter((positions.setdefault(r.card_id, len(positions)) for r in rows), dtype=np.int64, count=len(rows)))
+        quality.append(np.fromiter((QUALITY_CODES[r.quality] for r in rows), dtype=np.int64, count=len(rows)))
+        reviewed_at.append(np.array([r.reviewed_at for r in rows], dtype="datetime64[us]"))
+    if not card_index:
+        return History(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype="datetime64[us]"), 0)
+    return History(np.concatenate(card_index), np.concatenate(quality), np.concatenate(reviewed_at), len(positions))
+
+
+def log_loss(history: History, weights: np.ndarray) -> np.ndarray:
+    """Log loss of each weight set (rows of a (k, 19) batch) over the reviews with a prediction"""
+    _, recall = replay(history.card_index, history.quality, history.reviewed_at, history.n_cards, weights, exact=True)
+    predicted = ~np.isnan(recall[0])
+    if not predicted.any():
+        return np.zeros(len(weights))
+    recall = np.clip(recall[:, predicted], 1e-6, 1 - 1e-6)
+    right = history.quality[predicted] != WRONG
+    return -np.where(right, np.log(recall), np.log(1 - recall)).mean(axis=1)
+
+
+def _weights_of(theta: np.ndarray) -> np.ndarray:
+    """Weight sets for thetas (k, len(FITTED))"""
+    weights = np.tile(DEFAULT_WEIGHTS, (len(theta), 1))
+    weights[:, FITTED] *= np.exp(theta)
+    return weights
+
+
+def _batches(history: History, size: int, rng: np.random.Generator) -> list[np.ndarray]:
+    """Cards in random order, split into groups of about `size` reviews"""
+    order = rng.permutation(history.n_cards)
+    reviews = np.bincount(history.card_index, minlength=history.n_cards)[order]
+    group = np.cumsum(reviews) // max(size, 1)
+    return [order[group == g] for g in np.unique(group)]
+
+
+def fit(history: History, steps: Optional[int] = None, batch_reviews: Optional[int] = None, seed: int = 0) -> Fit:
+    """Fit the weights to a history, starting from the defaults"""
+    started = time.perf_counter()
+    steps = steps or settings.SCHEDULER_FIT_STEPS
+    rng = np.random.default_rng(seed)
+    batches = _batches(history, batch_reviews or settings.SCHEDULER_FIT_BATCH_REVIEWS, rng)
+    subsets = [history.cards(cards) for cards in batches] if len(batches) > 1 else [history]
+
+    #the centre and a +/- pair per fitted weight, one batched replay
+    offsets = np.vstack([np.zeros(len(FITTED)), np.eye(len(FITTED)) * STEP, -np.eye(len(FITTED)) * STEP])
+    theta = np.zeros(len(FITTED))
+    first, second = np.zeros_like(theta), np.zeros_like(theta)
+    beta1, beta2 = 0.9, 0.999
+    for step in range(1, steps + 1):
+        losses = log_loss(subsets[(step - 1) % len(subsets)], _weights_of(theta + offsets))
+        gradient = (losses[1:len(FITTED) + 1] - losses[len(FITTED) + 1:]) / (2 * STEP)
+        first = beta1 * first + (1 - beta1) * gradient
+        second = beta2 * second + (1 - beta2) * gradient ** 2
+        update = LEARNING_RATE * (first / (1 - beta1 ** step)) / (np.sqrt(second / (1 - beta2 ** step)) + 1e-8)
+        theta = np.clip(theta - update, -THETA_LIMIT, THETA_LIMIT)
+
+    default_loss, fitted_loss = log_loss(history, _weights_of(np.vstack([np.zeros_like(theta), theta])))
+    weights = _weights_of(theta[None])[0] if fitted_loss < default_loss else DEFAULT_WEIGHTS
+    return Fit(
+        weights=[round(float(w), 4) for w in weights],
+        log_loss=float(min(fitted_loss, default_loss)),
+        default_log_loss=float(default_loss),
+        review_count=len(history),
+        steps=steps,
+        seconds=time.perf_counter() - started
+    )
+
+
+def fit_user(user_id: str, shard: int, min_reviews: int) -> Optional[dict]:
+    """Fit one user from their shard, None below min_reviews. Runs in a worker process."""
+    with shard_map.sessions(shard)() as db:
+        history = load_history(db, user_id)
+    if len(history) < min_reviews:
+        return None
+    return asdict(fit(history))
+
+
+def save_fit(db: Session, user_id: str, result: dict) -> None:
+    parameters = db.get(SchedulerParameters, user_id) or SchedulerParameters(user_id=user_id)
+    parameters.weights = result["weights"]
+    parameters.request_retention = REQUEST_RETENTION
+    parameters.review_count = result["review_count"]
+    parameters.log_loss = result["log_loss"]
+    parameters.default_log_loss = result["default_log_loss"]
+    parameters.fitted_at = datetime.utcnow()
+    db.add(parameters)
+    db.commit()
+
+
+def candidates(user_id: Optional[str], min_reviews: int, force: bool) -> list[tuple[str, int]]:
+    """(user id, shard) of the users to fit: enough reviews, and new ones since their last fit unless forced"""
+    with shard_map.sessions(DIRECTORY_SHARD)() as db:
+        query = select(User.id, User.shard).where(User.is_deleted == False)
+        if user_id:
+            query = query.where(User.id == user_id)
+        users = db.execute(query).all()
+        fitted = dict(db.execute(select(SchedulerParameters.user_id, SchedulerParameters.review_count)).all())
+
+    shards: dict[int, list[str]] = {}
+    for user in users:
+        shards.setdefault(user.shard if user.shard is not None else DIRECTORY_SHARD, []).append(user.id)
+
+    selected = []
+    for shard, ids in shards.items():
+        with shard_map.sessions(shard)() as db:
+            query = select(ReviewLog.user_id, func.count()).where(ReviewLog.quality.in_(QUALITY_CODES)).group_by(ReviewLog.user_id).having(func.count() >= min_reviews)
+            if user_id:
+                query = query.where(ReviewLog.user_id == user_id)
+            counts = dict(db.execute(query).all())
+        selected += [(i, shard) for i in ids if i in counts and (force or fitted.get(i) != counts[i])]
+    return selected
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fit per-user FSRS weights to review logs")
+    parser.add_argument("--user", help="only this user")
+    parser.add_argument("--workers", type=int, default=settings.SCHEDULER_FIT_WORKERS, help="worker processes (default: CPU count)")
+    parser.add_argument("--min-reviews", type=int, default=settings.SCHEDULER_FIT_MIN_REVIEWS)
+    parser.add_argument("--force", action="store_true", help="refit users without new reviews")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    users = candidates(args.user, args.min_reviews, args.force)
+    if not users:
+        print("no users to fit")
+        return
+
+    started = time.perf_counter()
+    improved = 0
+    #spawn: workers open their own engines rather than inheriting the parent's connections
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers or None, mp_context=context) as pool, \
+            shard_map.sessions(DIRECTORY_SHARD)() as db:
+        futures = {pool.submit(fit_user, user_id, shard, args.min_reviews): user_id for user_id, shard in users}
+        for done, future in enumerate(as_completed(futures), 1):
+            user_id = futures[future]
+            elapsed = time.perf_counter() - started
+            eta = elapsed / done * (len(users) - done)
+            try:
+                result = future.result()
+            except Exception:
+                logger.exception(f"[{done}/{len(users)}] {user_id} failed")
+                continue
+            if result is None:
+                logger.info(f"[{done}/{len(users)}] {user_id} skipped, under {args.min_reviews} reviews")
+                continue
+            save_fit(db, user_id, result)
+            improved += result["log_loss"] < result["default_log_loss"]
+            logger.info(
+                f"[{done}/{len(users)}] {user_id}: {result['review_count']} reviews, "
+                f"log loss {result['default_log_loss']:.4f} -> {result['log_loss']:.4f} "
+                f"in {result['seconds']:.1f}s, eta {eta:.0f}s"
+            )
+    print(f"{len(users)} users fitted in {time.perf_counter() - started:.1f}s, {improved} improved on the default weights")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Move users between shards while the app keeps serving them.
+
+A move copies the user's rows to the target shard while writes continue
+on the source, then copies whatever the change feed reports as changed
+since, until a pass copies few rows. Only then is the user frozen
+(users.shard_moving: their data requests get 503 with Retry-After), the
+last changes are copied, the directory is pointed at the target and the
+source rows are deleted. The freeze lasts about `grace` seconds.
+
+Workers cache users rows (app.services.auth_cache), shard placement
+included. The tool invalidates them over BROADCAST_URL at the freeze and
+after the switch; with memory:// it cannot reach the workers, so the
+freeze lasts at least AUTH_USER_CACHE_TTL_SECONDS for every cached row
+to be reloaded (a row cached during the freeze only returns 503 longer).
+
+Change feed sequence numbers are per database, so the target's change
+feed is rebuilt with numbers above anything a client of the source can
+hold in a cursor: a client's next sync pulls from the target, and the
+copied digests let it skip every collection it already has.
+
+    python -m app.services.shard_rebalance [--dry-run] [--limit N] [--grace SECONDS]
+    python -m app.services.shard_rebalance --user USER_ID --to SHARD
+
+Without --user, every user whose shard differs from the placement for the
+current SHARD_DATABASE_URLS is moved (after adding a shard: the users
+that now belong on it). Run `alembic -x database_url=<url> upgrade head`
+on a new shard first.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from sqlalchemy import select, insert, delete, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import on_conflict_insert
+from app.core.sharding import shard_map, ensure_shard_user, DIRECTORY_SHARD
+from app.models.models import User, ChangeLog, SyncDigest, ReviewStats, Collection, Card, ReviewLog
+from app.services.auth_cache import broadcast_reaches_workers, publish_invalidation
+from app.services.change_feed import ENTITY_TYPES, head_seq, changed_ids
+from app.services.sync_engine import chunked
+
+
+logger = logging.getLogger(__name__)
+
+#copy order follows the foreign keys, deletes go the other way
+COPY_ORDER = ("collection", "card", "review_log")
+
+
+def _replace(db: Session, table, rows: list[dict]) -> None:
+    """Write rows as they are on the source, overwriting earlier copies"""
+    dialect_insert = on_conflict_insert(db.get_bind())
+    if dialect_insert is not None:
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={c.name: stmt.excluded[c.name] for c in table.columns if c.name != "id"}
+        )
+        db.execute(stmt, rows)
+        return
+
+    db.execute(delete(table).where(table.c.id.in_([row["id"] for row in rows])))
+    db.execute(insert(table), rows)
+
+
+def copy_rows(src: Session, dst: Session, user_id: str, after_seq: int) -> int:
+    """Copy a user's entities changed after `after_seq` (all of them for 0), returns the row count"""
+    copied = 0
+    for entity_type in COPY_ORDER:
+        table = ENTITY_TYPES[entity_type].__table__
+        stmt = select(table).where(table.c.user_id == user_id)
+        if after_seq:
+            stmt = stmt.where(table.c.id.in_(changed_ids(user_id, entity_type, after_seq)))
+        rows = [dict(row) for row in src.execute(stmt).mappings()]
+        for chunk in chunked(rows):
+            _replace(dst, table, chunk)
+        copied += len(rows)
+    return copied
+
+
+def _advance_change_seq(db: Session, floor: int) -> None:
+    """Make the next change feed sequence numbers of a shard larger than `floor`"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        db.execute(
+            text("UPDATE sqlite_sequence SET seq = :floor WHERE name = 'change_log' AND seq < :floor"),
+            {"floor": floor}
+        )
+        db.execute(
+            text(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT 'change_log', :floor "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'change_log')"
+            ),
+            {"floor": floor}
+        )
+    elif dialect == "postgresql":
+        db.execute(
+            text(
+                "SELECT setval(pg_get_serial_sequence('change_log', 'seq'), "
+                "GREATEST(:floor, nextval(pg_get_serial_sequence('change_log', 'seq'))))"
+            ),
+            {"floor": floor}
+        )
+    else:
+        raise NotImplementedError(f"Cannot move change feeds on {dialect}")
+
+
+def rebuild_change_feed(src: Session, dst: Session, user_id: str) -> None:
+    """One change row per entity on the target, numbered above the source's head, and the source digests"""
+    _advance_change_seq(dst, head_seq(src, user_id))
+    dst.execute(delete(ChangeLog).where(ChangeLog.user_id == user_id))
+    for entity_type in COPY_ORDER:
+        table = ENTITY_TYPES[entity_type].__table__
+        ids = dst.scalars(select(table.c.id).where(table.c.user_id == user_id)).all()
+        for chunk in chunked(ids):
+            dst.execute(insert(ChangeLog), [
+                {"user_id": user_id, "entity_type": entity_type, "entity_id": entity_id}
+                for entity_id in chunk
+            ])
+
+    digests = [dict(row) for row in src.execute(select(SyncDigest.__table__).where(SyncDigest.user_id == user_id)).mappings()]
+    dst.execute(delete(SyncDigest).where(SyncDigest.user_id == user_id))
+    if digests:
+        dst.execute(insert(SyncDigest), digests)
+
+
+def copy_review_stats(src: Session, dst: Session, user_id: str) -> None:
+    """Statistics rollups are not in the change feed, they are copied whole once the user is frozen"""
+    rows = [dict(row) for row in src.execute(select(ReviewStats.__table__).where(ReviewStats.user_id == user_id)).mappings()]
+    dst.execute(delete(ReviewStats).where(ReviewStats.user_id == user_id))
+    for chunk in chunked(rows):
+        dst.execute(insert(ReviewStats), chunk)
+
+
+def purge_users(db: Session, user_ids: list[str], shard: int) -> None:
+    """Delete users' data from a shard (the directory keeps the accounts)"""
+    for model in (ChangeLog, SyncDigest, ReviewStats, ReviewLog, Card, Collection):
+        db.execute(delete(model).where(model.user_id.in_(user_ids)))
+    if shard != DIRECTORY_SHARD:
+        db.execute(delete(User).where(User.id.in_(user_ids)))
+
+
+def purge_user(db: Session, user_id: str, shard: int) -> None:
+    """Delete a user's data from a shard it moved away from"""
+    purge_users(db, [user_id], shard)
+
+
+def _invalidate_cached_user(user_id: str) -> float:
+    """Drop the user from the workers' auth caches, returns how long stale copies may still be used"""
+    if broadcast_reaches_workers():
+        asyncio.run(publish_invalidation(user_id))
+        return 0.0
+    return settings.AUTH_USER_CACHE_TTL_SECONDS
+
+
+def move_user(user_id: str, target: int, grace: float = 5.0, max_passes: int = 5, settle_rows: int = 100) -> None:
+    """Move one user's data to `target`, see the module docstring for the protocol"""
+    with shard_map.sessions(DIRECTORY_SHARD)() as directory:
+        user = directory.get(User, user_id)
+        if user is None:
+            raise ValueError(f"Unknown user {user_id}")
+        source = shard_map.shard_of(user)
+        if source == target:
+            return
+
+        with shard_map.sessions(source)() as src, shard_map.sessions(target)() as dst:
+            if target != DIRECTORY_SHARD:
+                ensure_shard_user(dst, user_id)
+
+            #online passes, the user keeps writing to the source
+            after_seq = 0
+            for _ in range(max_passes):
+                head = head_seq(src, user_id)
+                copied = copy_rows(src, dst, user_id, after_seq)
+                dst.commit()
+                src.rollback()
+                after_seq = head
+                if copied <= settle_rows:
+                    break
+
+            user.shard_moving = True
+            directory.commit()
+            try:
+                #requests that got past the check before the freeze finish their writes
+                time.sleep(max(grace, _invalidate_cached_user(user_id)))
+                copy_rows(src, dst, user_id, after_seq)
+                rebuild_change_feed(src, dst, user_id)
+                copy_review_stats(src, dst, user_id)
+                dst.commit()
+                user.shard = target
+            finally:
+                user.shard_moving = False
+                directory.commit()
+                _invalidate_cached_user(user_id)
+
+            purge_user(src, user_id, source)
+            src.commit()
+    logger.info("Moved user %s from shard %d to shard %d", user_id, source, target)
+
+
+def misplaced_users(limit: int = 0) -> list[tuple[str, int, int]]:
+    """(user id, current shard, placement) of users not on the shard they hash to"""
+    moves = []
+    with shard_map.sessions(DIRECTORY_SHARD)() as directory:
+        for user_id, shard in directory.execute(select(User.id, User.shard)):
+            current = shard if shard is not None else DIRECTORY_SHARD
+            placement = shard_map.placement(user_id)
+            if current != placement:
+                moves.append((user_id, current, placement))
+                if limit and len(moves) >= limit:
+                    break
+    return moves
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move users between shards")
+    parser.add_argument("--user", help="move one user (with --to)")
+    parser.add_argument("--to", type=int, help="target shard for --user")
+    parser.add_argument("--dry-run", action="store_true", help="list the moves without running them")
+    parser.add_argument("--limit", type=int, default=0, help="move at most this many users")
+    parser.add_argument("--grace", type=float, default=5.0, help="seconds a user is frozen for the last copy")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.user:
+        if args.to is None:
+            parser.error("--user needs --to")
+        moves = [(args.user, None, args.to)]
+    else:
+        moves = misplaced_users(args.limit)
+
+    print(f"{len(shard_map)} shards, {len(moves)} users to move")
+    for user_id, source, target in moves:
+        if args.dry_run:
+            print(f"  {user_id}: {source} -> {target}")
+            continue
+        move_user(user_id, target, grace=args.grace)
+
+
+if __name__ == "__main__":
+    main()
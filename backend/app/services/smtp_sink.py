@@ -0,0 +1,125 @@
+"""
+Local SMTP stand-in for development and tests: accepts every message,
+keeps it in memory and logs its recipient and subject. Optionally refuses
+a share of the messages with a temporary error to exercise the outbox's
+retries. Connections stay open across messages like a real server's.
+
+    python -m app.services.smtp_sink [--port 1025] [--fail-rate 0.2]
+
+Tests can run it in-process: `sink = SmtpSink(); await sink.start()`,
+then read `sink.messages` and `sink.connections`.
+"""
+import argparse
+import asyncio
+import logging
+import random
+from email import message_from_bytes
+from email.message import Message
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class SmtpSink:
+    def __init__(self, host: str = "127.0.0.1", port: int = 1025, fail_rate: float = 0.0):
+        self.host = host
+        self.port = port
+        self.fail_rate = fail_rate
+        self.messages: list[Message] = []
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._session, self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+
+        async def reply(line: str) -> None:
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        await reply("220 smtp-sink ready")
+        try:
+            while line := await reader.readline():
+                command = line.decode(errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    await reply("250-smtp-sink")
+                    await reply("250-AUTH PLAIN LOGIN")
+                    await reply("250 8BITMIME")
+                elif verb == "HELO":
+                    await reply("250 smtp-sink")
+                elif verb == "AUTH":
+                    await self._auth(command, reader, reply)
+                elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    await self._data(reader, reply)
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _auth(self, command: str, reader: asyncio.StreamReader, reply) -> None:
+        #any credentials are accepted
+        parts = command.split()
+        if len(parts) > 1 and parts[1].upper() == "LOGIN":
+            for prompt in ("VXNlcm5hbWU6", "UGFzc3dvcmQ6"):
+                await reply(f"334 {prompt}")
+                await reader.readline()
+        elif len(parts) == 2:
+            await reply("334 ")
+            await reader.readline()
+        await reply("235 Authentication successful")
+
+    async def _data(self, reader: asyncio.StreamReader, reply) -> None:
+        lines = []
+        while (line := await reader.readline()) not in (b".\r\n", b".\n", b""):
+            lines.append(line[1:] if line.startswith(b"..") else line)
+
+        if random.random() < self.fail_rate:
+            await reply("451 Temporary failure, try again later")
+            return
+
+        message = message_from_bytes(b"".join(lines))
+        self.messages.append(message)
+        logger.info("Received %r for %s", message["Subject"], message["To"])
+        await reply("250 OK: queued")
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    sink = SmtpSink(args.host, args.port, args.fail_rate)
+    await sink.start()
+    print(f"SMTP sink listening on {args.host}:{args.port}")
+    await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local SMTP stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of messages refused with 451")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+from typing import AsyncIterator, Callable, Optional
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from pydantic_core import to_json
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def wants_ndjson(request: Request) -> bool:
+    """Whether the client opted into a streamed NDJSON body via the Accept header"""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_line(data) -> str:
+    return to_json(data).decode() + "\n"
+
+
+def ndjson_response(lines: AsyncIterator[str], headers: Optional[dict] = None) -> StreamingResponse:
+    return StreamingResponse(lines, media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+
+async def with_session(
+    produce: Callable[[AsyncSession], AsyncIterator[str]],
+    sessions: async_sessionmaker = AsyncSessionLocal
+) -> AsyncIterator[str]:
+    """
+    Run a line producer on its own session (from `sessions`, the user's shard).
+    The request's session is closed before a streamed body is sent, so the
+    producer gets one that lives exactly as long as the stream.
+    """
+    async with sessions() as db:
+        async for line in produce(db):
+            yield line
+
+
+def stream_rows(
+    stmt: Select,
+    schema: type[BaseModel],
+    sessions: async_sessionmaker = AsyncSessionLocal
+) -> AsyncIterator[str]:
+    """Encode each ORM row of `stmt` as one NDJSON line as it is read from a server-side cursor"""
+    async def produce(db: AsyncSession) -> AsyncIterator[str]:
+        result = await db.stream_scalars(stmt.execution_options(yield_per=settings.SYNC_BATCH_SIZE))
+        async for row in result:
+            yield schema.model_validate(row).model_dump_json() + "\n"
+
+    return with_session(produce, sessions)
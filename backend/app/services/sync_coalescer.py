@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+#runs one database pass for a user's batched requests, returns one result (or exception) per request
+RunBatch = Callable[[str, list], Awaitable[list]]
+
+
+@dataclass
+class _Batch:
+    requests: list = field(default_factory=list)
+    results: list[asyncio.Future] = field(default_factory=list)
+    urgent: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class SyncCoalescer:
+    """
+    Per-user coalescing of sync requests.
+    A user's first sync runs right away. Syncs arriving while it runs, or
+    within `window_seconds` of its start, join one pending batch that runs
+    as a single database pass once the window has passed, and every caller
+    gets its own result from that pass. A user therefore costs at most one
+    pass per window however chatty their devices are. An urgent request
+    (a client paging through a pull) ends the wait early.
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._pending: dict[str, _Batch] = {}
+        self._running: dict[str, asyncio.Task] = {}
+        self._last_start: dict[str, float] = {}
+        self.requests = 0
+        self.passes = 0
+
+    @property
+    def coalesced(self) -> int:
+        """Requests served by a pass started for another request"""
+        return self.requests - self.passes
+
+    async def submit(self, user_id: str, request: Any, run_batch: RunBatch, urgent: bool = False) -> tuple[Any, int]:
+        """Return (result, number of requests in the pass that produced it)"""
+        self.requests += 1
+        batch = self._pending.get(user_id)
+        if batch is None:
+            batch = _Batch()
+            self._pending[user_id] = batch
+            previous = self._running.get(user_id)
+            self._running[user_id] = asyncio.create_task(self._drain(user_id, batch, previous, run_batch))
+
+        result = asyncio.get_running_loop().create_future()
+        batch.requests.append(request)
+        batch.results.append(result)
+        if urgent:
+            batch.urgent.set()
+        return await asyncio.shield(result), len(batch.requests)
+
+    async def _drain(self, user_id: str, batch: _Batch, previous, run_batch: RunBatch) -> None:
+        try:
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            delay = self._last_start.get(user_id, float("-inf")) + self.window_seconds - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(batch.urgent.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            #the batch is closed from here, later requests start the next one
+            del self._pending[user_id]
+            self._last_start[user_id] = time.monotonic()
+            self.passes += 1
+            if len(batch.requests) > 1:
+                logger.debug("Coalesced %d syncs of user %s into one pass", len(batch.requests), user_id)
+
+            try:
+                outcomes = await run_batch(user_id, batch.requests)
+            except Exception as e:
+                outcomes = [e] * len(batch.requests)
+
+            for future, outcome in zip(batch.results, outcomes):
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                    #mark retrieved, the caller re-raises it itself
+                    future.exception()
+                else:
+                    future.set_result(outcome)
+        finally:
+            if self._pending.get(user_id) is batch:
+                del self._pending[user_id]
+            for future in batch.results:
+                if not future.done():
+                    future.cancel()
+            if self._running.get(user_id) is asyncio.current_task():
+                del self._running[user_id]
+                asyncio.get_running_loop().call_later(self.window_seconds, self._forget, user_id)
+
+    def _forget(self, user_id: str) -> None:
+        if user_id in self._running or user_id in self._pending:
+            return
+        if time.monotonic() - self._last_start.get(user_id, float("-inf")) >= self.window_seconds:
+            self._last_start.pop(user_id, None)
+
+
+sync_coalescer = SyncCoalescer(window_seconds=settings.SYNC_DEBOUNCE_SECONDS)
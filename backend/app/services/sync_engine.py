@@ -0,0 +1,410 @@
+import base64
+import json
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Iterator, Optional
+from uuid import uuid4
+
+from sqlalchemy import select, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import on_conflict_insert
+from app.models.models import Collection, Card, ReviewLog
+from app.schemas.schemas import SyncRequest, CollectionUpdate, CardUpdate, ReviewLogCreate
+from app.services.change_feed import (
+    ENTITY_TYPES,
+    ACCOUNT_DIGEST,
+    lock_change_feed,
+    record_changes,
+    changes_after,
+    stream_changes_after,
+    seq_at,
+    get_digests
+)
+from app.services.review_stats import record_reviews
+
+
+#the push/pull steps take a blocking Session, async callers run them through AsyncSession.run_sync
+COLLECTION_FIELDS = ("name", "description", "color", "is_deleted")
+CARD_FIELDS = (
+    "front", "back", "collection_id", "ease_factor", "interval", "repetitions",
+    "next_review_date", "last_review_date", "is_deleted",
+)
+
+
+def chunked(items: list, size: Optional[int] = None) -> Iterator[list]:
+    """Split a list into chunks of at most SYNC_BATCH_SIZE items"""
+    size = max(1, size or settings.SYNC_BATCH_SIZE)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def count_sync_items(sync_data: SyncRequest) -> int:
+    """Total number of pushed items in a sync request"""
+    return (
+        len(sync_data.collections or [])
+        + len(sync_data.cards or [])
+        + len(sync_data.review_logs or [])
+    )
+
+
+def _fetch_rows(db: Session, model, ids: Iterable[str], user_id: Optional[str] = None) -> dict:
+    """Load rows by id with chunked IN (...) lookups, keyed by id"""
+    table = model.__table__
+    rows = {}
+    for chunk in chunked(list(set(ids))):
+        stmt = select(table).where(table.c.id.in_(chunk))
+        if user_id is not None:
+            stmt = stmt.where(table.c.user_id == user_id)
+        for row in db.execute(stmt).mappings():
+            rows[row["id"]] = dict(row)
+    return rows
+
+
+def _upsert(db: Session, model, rows: list[dict], existing_ids: set) -> set:
+    """
+    Write merged rows with INSERT ... ON CONFLICT on SQLite/Postgres.
+    The conflict branch only overwrites rows owned by the same user with a
+    version that is not newer (last write wins), so concurrent syncs cannot
+    clobber each other. Other dialects fall back to bulk UPDATE + bulk INSERT.
+    Returns the ids actually written: rows skipped by the conflict guard
+    (another user's id, a newer version) get no change feed entry.
+    """
+    if not rows:
+        return set()
+
+    table = model.__table__
+    dialect_insert = on_conflict_insert(db.get_bind())
+
+    if dialect_insert is not None:
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={c.name: stmt.excluded[c.name] for c in table.columns if c.name not in ("id", "user_id", "created_at")},
+            where=(table.c.user_id == stmt.excluded.user_id) & (table.c.version <= stmt.excluded.version),
+        ).returning(table.c.id)
+        written = set()
+        for chunk in chunked(rows):
+            written.update(db.scalars(stmt, chunk).all())
+        return written
+
+    updates = [r for r in rows if r["id"] in existing_ids]
+    inserts = [r for r in rows if r["id"] not in existing_ids]
+    for chunk in chunked(updates):
+        db.execute(update(model), chunk)
+    for chunk in chunked(inserts):
+        db.execute(insert(table), chunk)
+    return {r["id"] for r in rows}
+
+
+def _merge_collection(existing: Optional[dict], item: CollectionUpdate, user_id: str, now: datetime) -> Optional[dict]:
+    if existing is None:
+        if not item.name:
+            return None
+        row = {
+            "id": item.id,
+            "user_id": user_id,
+            "name": item.name,
+            "description": None,
+            "tags": None,
+            "color": None,
+            "created_at": now,
+            "updated_at": now,
+            "is_deleted": False,
+            "version": item.version,
+        }
+    else:
+        #last write wins
+        if existing["version"] > item.version:
+            return None
+        row = dict(existing)
+
+    for field in COLLECTION_FIELDS:
+        value = getattr(item, field)
+        if value is not None:
+            row[field] = value
+    if item.tags is not None:
+        row["tags"] = ','.join(item.tags) if item.tags else None
+
+    row["version"] = item.version
+    row["updated_at"] = now
+    return row
+
+
+def _merge_card(existing: Optional[dict], item: CardUpdate, user_id: str, now: datetime) -> Optional[dict]:
+    if existing is None:
+        if not (item.front and item.back and item.collection_id):
+            return None
+        row = {
+            "id": item.id,
+            "user_id": user_id,
+            "collection_id": item.collection_id,
+            "front": item.front,
+            "back": item.back,
+            "ease_factor": 2.5,
+            "interval": 0,
+            "repetitions": 0,
+            "next_review_date": None,
+            "last_review_date": None,
+            "created_at": now,
+            "updated_at": now,
+            "is_deleted": False,
+            "version": item.version,
+        }
+    else:
+        #last write wins
+        if existing["version"] > item.version:
+            return None
+        row = dict(existing)
+
+    for field in CARD_FIELDS:
+        value = getattr(item, field)
+        if value is not None:
+            row[field] = value
+
+    row["version"] = item.version
+    row["updated_at"] = now
+    return row
+
+
+def push_collections(db: Session, user_id: str, items: list[CollectionUpdate], now: datetime) -> dict:
+    """Apply pushed collections in bulk, returns the written ids mapped to their collection id"""
+    items = [i for i in items if i.id]
+    existing = _fetch_rows(db, Collection, (i.id for i in items), user_id)
+
+    merged = {}
+    for item in items:
+        row = _merge_collection(merged.get(item.id) or existing.get(item.id), item, user_id, now)
+        if row is not None:
+            merged[item.id] = row
+
+    written = _upsert(db, Collection, list(merged.values()), set(existing))
+    return {collection_id: collection_id for collection_id in merged if collection_id in written}
+
+
+def push_cards(db: Session, user_id: str, items: list[CardUpdate], now: datetime) -> dict:
+    """Apply pushed cards in bulk, returns the written ids mapped to their collection id"""
+    items = [i for i in items if i.id]
+    existing = _fetch_rows(db, Card, (i.id for i in items), user_id)
+
+    #cards may only point at collections owned by the user
+    collection_ids = {i.collection_id for i in items if i.collection_id}
+    owned_collections = set(_fetch_rows(db, Collection, collection_ids, user_id))
+
+    merged = {}
+    for item in items:
+        if item.collection_id and item.collection_id not in owned_collections:
+            continue
+        row = _merge_card(merged.get(item.id) or existing.get(item.id), item, user_id, now)
+        if row is not None:
+            merged[item.id] = row
+
+    written = _upsert(db, Card, list(merged.values()), set(existing))
+    return {card_id: row["collection_id"] for card_id, row in merged.items() if card_id in written}
+
+
+def push_review_logs(db: Session, user_id: str, items: list[ReviewLogCreate], now: datetime) -> dict:
+    """
+    Insert pushed review logs in bulk, existing logs are left untouched.
+    The inserted ones are counted in the study statistics rollups.
+    Returns the inserted ids mapped to their card's collection id.
+    """
+    owned_cards = _fetch_rows(db, Card, {i.card_id for i in items}, user_id)
+
+    rows = {}
+    for item in items:
+        if item.card_id not in owned_cards:
+            continue
+        log_id = item.id or str(uuid4())
+        rows[log_id] = {
+            "id": log_id,
+            "user_id": user_id,
+            "card_id": item.card_id,
+            "quality": item.quality,
+            "reviewed_at": item.reviewed_at or now,
+            "interval_before": item.interval_before,
+            "interval_after": item.interval_after,
+            "ease_factor_before": item.ease_factor_before,
+            "ease_factor_after": item.ease_factor_after,
+            "created_at": now,
+        }
+    if not rows:
+        return {}
+
+    #logs are immutable, only ids the server has never seen are inserted
+    existing = _fetch_rows(db, ReviewLog, rows)
+    new_rows = [r for r in rows.values() if r["id"] not in existing]
+
+    table = ReviewLog.__table__
+    dialect_insert = on_conflict_insert(db.get_bind())
+
+    if dialect_insert is not None:
+        stmt = dialect_insert(table).on_conflict_do_nothing(index_elements=[table.c.id])
+    else:
+        stmt = insert(table)
+
+    for chunk in chunked(new_rows):
+        db.execute(stmt, chunk)
+    record_reviews(db, user_id, (
+        (owned_cards[r["card_id"]]["collection_id"], r["quality"], r["reviewed_at"]) for r in new_rows
+    ))
+    return {r["id"]: owned_cards[r["card_id"]]["collection_id"] for r in new_rows}
+
+
+def apply_push(db: Session, user_id: str, sync_data: SyncRequest) -> None:
+    """Apply the push half of a sync request in one transaction (not committed here)"""
+    now = datetime.utcnow()
+    #before any row is written: taken between the upserts it would wait on rows another push holds
+    lock_change_feed(db, user_id)
+
+    if sync_data.collections:
+        record_changes(db, user_id, "collection", push_collections(db, user_id, sync_data.collections, now))
+    if sync_data.cards:
+        record_changes(db, user_id, "card", push_cards(db, user_id, sync_data.cards, now))
+    if sync_data.review_logs:
+        record_changes(db, user_id, "review_log", push_review_logs(db, user_id, sync_data.review_logs, now))
+
+
+# ==========================================
+# PULL
+# ==========================================
+#page key per change feed entity type
+PULL_ENTITIES = (
+    ("collections", "collection"),
+    ("cards", "card"),
+    ("review_logs", "review_log"),
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(seq: int, more: bool = False) -> str:
+    """Opaque continuation cursor wrapping a change feed position (and whether more pages follow it)"""
+    data = {"seq": seq, "more": 1} if more else {"seq": seq}
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _cursor_data(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        data["seq"] = int(data["seq"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Invalid sync cursor") from e
+
+    if data["seq"] < 0:
+        raise InvalidCursor("Invalid sync cursor")
+    return data
+
+
+def decode_cursor(cursor: str) -> int:
+    return _cursor_data(cursor)["seq"]
+
+
+def is_continuation(cursor: Optional[str]) -> bool:
+    """Whether a cursor points into the middle of a paged pull"""
+    if not cursor:
+        return False
+    try:
+        return bool(_cursor_data(cursor).get("more"))
+    except InvalidCursor:
+        return False
+
+
+def start_seq(db: Session, user_id: str, since: Optional[datetime], cursor: Optional[str]) -> int:
+    """Change feed position a pull starts after"""
+    if cursor:
+        return decode_cursor(cursor)
+    if since:
+        return seq_at(db, user_id, since)
+    return 0
+
+
+def unchanged_collections(client_digests: Optional[dict], server_digests: dict) -> set:
+    """Collections whose digest the client already holds, their changes are not sent again"""
+    if not client_digests:
+        return set()
+    return {
+        collection_id
+        for collection_id, digest in client_digests.items()
+        if collection_id != ACCOUNT_DIGEST and server_digests.get(collection_id) == digest
+    }
+
+
+def sync_digests(db: Session, user_id: str) -> tuple[str, dict]:
+    """Account digest and per-collection digests of a user"""
+    digests = get_digests(db, user_id)
+    return digests.pop(ACCOUNT_DIGEST, "0"), digests
+
+
+def _skip_filter(model, user_id: str, skip_collections: set):
+    if model is Collection:
+        return Collection.id.notin_(skip_collections)
+    if model is Card:
+        return Card.collection_id.notin_(skip_collections)
+    return ReviewLog.card_id.notin_(
+        select(Card.id).where(Card.user_id == user_id, Card.collection_id.in_(skip_collections))
+    )
+
+
+def load_changed(db: Session, user_id: str, changes: list, skip_collections: set = frozenset()) -> dict:
+    """
+    Load the current state of the entities referenced by a run of change rows, keyed by entity type.
+    Entities in `skip_collections` are left out.
+    """
+    ids = {entity_type: [] for _, entity_type in PULL_ENTITIES}
+    for change in changes:
+        ids[change.entity_type].append(change.entity_id)
+
+    page = {}
+    for name, entity_type in PULL_ENTITIES:
+        model = ENTITY_TYPES[entity_type]
+        rows = []
+        for chunk in chunked(list(dict.fromkeys(ids[entity_type]))):
+            query = db.query(model).filter(model.user_id == user_id, model.id.in_(chunk))
+            if skip_collections:
+                query = query.filter(_skip_filter(model, user_id, skip_collections))
+            rows.extend(query.all())
+        page[name] = rows
+    return page
+
+
+def pull_page(
+    db: Session,
+    user_id: str,
+    after_seq: int,
+    limit: int,
+    skip_collections: set = frozenset()
+) -> tuple[dict, str, bool]:
+    """
+    Load one bounded page of server changes from the change feed.
+    At most `limit` change rows are read (one range scan on (user_id, seq))
+    and the entities they point at are loaded in chunked IN (...) lookups.
+    Returns the page keyed by entity type, the cursor to send next time and
+    whether more changes are waiting.
+    """
+    changes = changes_after(db, user_id, after_seq, limit + 1)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    next_seq = changes[-1].seq if changes else after_seq
+    return load_changed(db, user_id, changes, skip_collections), encode_cursor(next_seq, has_more), has_more
+
+
+async def iter_pull_pages(
+    db: AsyncSession,
+    user_id: str,
+    after_seq: int,
+    skip_collections: set = frozenset()
+) -> AsyncIterator[tuple[dict, str]]:
+    """
+    Walk the whole change feed after `after_seq` with a server-side cursor,
+    yielding SYNC_BATCH_SIZE changes at a time with the cursor that follows them.
+    """
+    async for changes in stream_changes_after(db, user_id, after_seq, settings.SYNC_BATCH_SIZE):
+        page = await db.run_sync(load_changed, user_id, changes, skip_collections)
+        yield page, encode_cursor(changes[-1].seq)
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+from operator import attrgetter
+from typing import Any, Iterable
+
+import msgpack
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/msgpack", "application/vnd.msgpack")
+
+
+def wants_msgpack(request: Request) -> bool:
+    """Whether the client asked for the MessagePack encoding via the Accept header"""
+    accept = request.headers.get("accept", "")
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _pack_default(obj: Any) -> Any:
+    #datetimes use the msgpack timestamp extension (naive values are UTC in this database)
+    if isinstance(obj, datetime):
+        if obj.tzinfo is not None:
+            obj = obj.astimezone(timezone.utc).replace(tzinfo=None)
+        return msgpack.Timestamp.from_unix_nano((obj - _EPOCH) // _MICROSECOND * 1000)
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def columnar(records: Iterable[BaseModel]) -> dict:
+    """
+    Field-name dictionary layout for a list of records:
+    {"fields": [name, ...], "rows": [[value, ...], ...]}.
+    Field names come from the schema, so each key is sent once instead of once per row.
+    """
+    records = list(records)
+    if not records:
+        return {"fields": [], "rows": []}
+    fields = list(type(records[0]).model_fields)
+    get_row = attrgetter(*fields)
+    return {
+        "fields": fields,
+        "rows": [get_row(record) for record in records],
+    }
+
+
+def packb(data: Any) -> bytes:
+    return msgpack.packb(data, default=_pack_default, use_bin_type=True)
+
+
+def unpackb(data: bytes) -> Any:
+    """Decode a MessagePack body, timestamps come back as aware datetimes"""
+    return msgpack.unpackb(data, raw=False, timestamp=3)
+
+
+def rows_from_columnar(table: dict) -> list[dict]:
+    fields = table["fields"]
+    return [dict(zip(fields, row)) for row in table["rows"]]
+
+
+def msgpack_list_response(records: Iterable[BaseModel], headers: dict = None) -> Response:
+    """MessagePack response for a list endpoint, records laid out columnar"""
+    return Response(packb(columnar(records)), media_type=MSGPACK_MEDIA_TYPE, headers=headers)
+
+
+def msgpack_model_response(model: BaseModel, columnar_fields: Iterable[str] = (), headers: dict = None) -> Response:
+    """MessagePack response for a schema instance, the named list fields laid out columnar"""
+    columnar_fields = set(columnar_fields)
+    data = {}
+    for name in type(model).model_fields:
+        value = getattr(model, name)
+        if name in columnar_fields:
+            data[name] = columnar(value)
+        elif isinstance(value, BaseModel):
+            data[name] = value.model_dump()
+        else:
+            data[name] = value
+    return Response(packb(data), media_type=MSGPACK_MEDIA_TYPE, headers=headers)
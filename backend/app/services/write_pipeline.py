@@ -0,0 +1,186 @@
+import asyncio
+import contextvars
+import copy
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+from app.core.database import SyncSession
+from app.core.engine_profiles import build_engine
+from app.core.sharding import shard_map, session_shard
+
+
+logger = logging.getLogger(__name__)
+
+#a write is a function of a blocking Session that changes rows without committing
+Write = Callable[..., Any]
+
+#change feed bookkeeping a failed write must not leave behind in the shared transaction
+_SESSION_STATE = ("change_heads", "pending_changes")
+
+
+def _build_writer_engine(url: str):
+    """
+    Engine of the writer thread. pysqlite's implicit transactions break
+    SAVEPOINT, so BEGIN is issued explicitly, as IMMEDIATE: the write lock
+    is taken once per batch instead of being upgraded mid-transaction.
+    """
+    if make_url(url).get_backend_name() != "sqlite":
+        raise RuntimeError("SQLITE_WRITE_PIPELINE requires a SQLite database_url")
+    engine = build_engine(url)
+
+    @event.listens_for(engine, "connect")
+    def _disable_implicit_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
+
+
+class WritePipeline:
+    """
+    Single writer with group commit for SQLite. Requests queue their writes,
+    one thread runs everything queued so far in one transaction, each write
+    inside its own SAVEPOINT, and commits once: one fsync for the batch.
+    A write that raises is rolled back alone and its request gets the
+    error; the others get their result once the shared commit is durable.
+    While a batch commits the next one queues up, so batches grow with load.
+    """
+
+    def __init__(self, url: str, max_batch: int):
+        self._url = url
+        self._max_batch = max_batch
+        self._engine = None
+        self._sessions: Optional[sessionmaker] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.writes = 0
+        self.batches = 0
+
+    async def start(self) -> None:
+        """Start the writer on the running loop (a loop started without the app lifespan binds on first use)"""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._loop is loop:
+            return
+        if self._engine is None:
+            self._engine = _build_writer_engine(self._url)
+            self._sessions = sessionmaker(class_=SyncSession, bind=self._engine, autoflush=False, expire_on_commit=False)
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Finish the queued writes, then stop the writer"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._executor.shutdown()
+        self._engine.dispose()
+        self._engine = self._task = self._loop = None
+
+    async def submit(self, write: Write, *args) -> Any:
+        """Run write(session, *args) in the next batch, returns its result once committed"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            await self.start()
+        future = loop.create_future()
+        #the request's context (origin device) travels with its write
+        self._queue.put_nowait((write, args, contextvars.copy_context(), future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self._max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                outcomes = await loop.run_in_executor(self._executor, self._commit_batch, batch)
+            except Exception as e:
+                outcomes = [e] * len(batch)
+
+            self.writes += len(batch)
+            self.batches += 1
+            for (_, _, _, future), outcome in zip(batch, outcomes):
+                self._queue.task_done()
+                if future.done():
+                    #the request went away, its write is committed regardless
+                    continue
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+    def _commit_batch(self, batch: list) -> list:
+        outcomes = []
+        with self._sessions() as db:
+            try:
+                db.begin()
+                for write, args, context, _ in batch:
+                    outcomes.append(context.run(self._apply, db, write, args))
+                db.commit()
+            except Exception as e:
+                logger.exception("Group commit of %d writes failed", len(batch))
+                db.rollback()
+                return [e] * len(batch)
+        return outcomes
+
+    @staticmethod
+    def _apply(db: Session, write: Write, args: tuple) -> Any:
+        saved = {key: copy.copy(db.info[key]) for key in _SESSION_STATE if key in db.info}
+        try:
+            with db.begin_nested():
+                return write(db, *args)
+        except Exception as e:
+            for key in _SESSION_STATE:
+                db.info.pop(key, None)
+            db.info.update(saved)
+            return e
+
+
+#one writer per shard database
+_pipelines: dict[int, WritePipeline] = {}
+
+
+def pipeline_for(shard: int) -> WritePipeline:
+    if shard not in _pipelines:
+        _pipelines[shard] = WritePipeline(shard_map.urls[shard], settings.WRITE_PIPELINE_MAX_BATCH)
+    return _pipelines[shard]
+
+
+async def start_pipelines() -> None:
+    for shard in range(len(shard_map)):
+        await pipeline_for(shard).start()
+
+
+async def stop_pipelines() -> None:
+    for pipeline in _pipelines.values():
+        await pipeline.stop()
+
+
+async def run_write(db: AsyncSession, write: Write, *args) -> Any:
+    """
+    Run write(session, *args) and commit it: through the write pipeline of
+    the session's shard when SQLITE_WRITE_PIPELINE is on, otherwise on the
+    request's own session.
+    """
+    if settings.SQLITE_WRITE_PIPELINE:
+        return await pipeline_for(session_shard(db)).submit(write, *args)
+    result = await db.run_sync(write, *args)
+    await db.commit()
+    return result
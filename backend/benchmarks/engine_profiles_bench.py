@@ -0,0 +1,145 @@
+"""
+Compare mixed read/write throughput of the database engine profiles.
+
+Each profile gets a fresh database with a few users and cards. Then
+`concurrency` tasks run for `seconds`, each operation on its own
+AsyncSession the way a request does. 70% of operations list a
+collection's cards; 30% edit a card and commit, which also writes the
+change feed and digests. Lock errors ("database is locked") are counted,
+not retried.
+
+SQLite always runs with the default and sqlite_wal profiles. Set
+BENCH_POSTGRES_URL (postgresql://...) to also compare default against
+postgres on a scratch Postgres database. The tables there are dropped
+afterwards.
+
+    python -m benchmarks.engine_profiles_bench [concurrency] [seconds]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError, DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.database import Base, SyncSession, async_database_url
+from app.core.engine_profiles import build_engine, build_async_engine
+from app.models.models import User, Collection, Card
+import app.services.change_feed  # noqa: F401  registers the change feed listeners
+
+USERS = 8
+CARDS_PER_USER = 500
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def seed(url: str, profile: str) -> list[tuple[str, str, list[str]]]:
+    engine = build_engine(url, profile)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    now = datetime.utcnow()
+    users = []
+    with engine.begin() as conn:
+        for n in range(USERS):
+            user_id, collection_id = str(uuid4()), str(uuid4())
+            card_ids = [str(uuid4()) for _ in range(CARDS_PER_USER)]
+            conn.execute(insert(User), [{
+                "id": user_id, "email": f"bench{n}@example.com", "hashed_password": "x",
+                "created_at": now, "updated_at": now, "is_deleted": False, "version": 1,
+                "is_email_verified": True,
+            }])
+            conn.execute(insert(Collection), [{
+                "id": collection_id, "user_id": user_id, "name": "Bench",
+                "created_at": now, "updated_at": now, "is_deleted": False, "version": 1,
+            }])
+            conn.execute(insert(Card), [{
+                "id": card_id, "user_id": user_id, "collection_id": collection_id,
+                "front": "front", "back": "back", "ease_factor": 2.5, "interval": 0, "repetitions": 0,
+                "created_at": now, "updated_at": now, "is_deleted": False, "version": 1,
+            } for card_id in card_ids])
+            users.append((user_id, collection_id, card_ids))
+    engine.dispose()
+    return users
+
+
+async def run_profile(url: str, profile: str, concurrency: int, seconds: float) -> dict:
+    users = seed(url, profile)
+    engine = build_async_engine(async_database_url(url), profile)
+    sessions = async_sessionmaker(engine, sync_session_class=SyncSession, autoflush=False, expire_on_commit=False)
+
+    reads, writes, errors, latencies = 0, 0, 0, []
+    deadline = time.monotonic() + seconds
+
+    async def worker() -> None:
+        nonlocal reads, writes, errors
+        while time.monotonic() < deadline:
+            user_id, collection_id, card_ids = random.choice(users)
+            start = time.perf_counter()
+            try:
+                async with sessions() as db:
+                    if random.random() < 0.7:
+                        await db.scalars(select(Card).where(Card.user_id == user_id, Card.collection_id == collection_id))
+                        reads += 1
+                    else:
+                        card = await db.get(Card, random.choice(card_ids))
+                        card.front = f"edit {time.perf_counter()}"
+                        card.version += 1
+                        await db.commit()
+                        writes += 1
+            except (OperationalError, DBAPIError):
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+
+    return {
+        "ops": (reads + writes) / elapsed,
+        "reads": reads / elapsed,
+        "writes": writes / elapsed,
+        "errors": errors,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+def report(label: str, result: dict) -> None:
+    print(
+        f"{label:<22} {result['ops']:>8.0f} ops/s  ({result['reads']:.0f} reads/s, {result['writes']:.0f} writes/s)"
+        f"  p50 {result['p50'] * 1000:6.1f} ms  p99 {result['p99'] * 1000:7.1f} ms  errors {result['errors']}"
+    )
+
+
+def main() -> None:
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"concurrency {concurrency}, {seconds:.0f}s per profile")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ("default", "sqlite_wal"):
+            url = f"sqlite:///{tmp}/{profile}.db"
+            report(f"sqlite / {profile}", asyncio.run(run_profile(url, profile, concurrency, seconds)))
+
+    postgres_url = os.environ.get("BENCH_POSTGRES_URL")
+    if postgres_url:
+        for profile in ("default", "postgres"):
+            report(f"postgres / {profile}", asyncio.run(run_profile(postgres_url, profile, concurrency, seconds)))
+        Base.metadata.drop_all(build_engine(postgres_url, "default"))
+
+
+if __name__ == "__main__":
+    main()
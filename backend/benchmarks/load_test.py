@@ -0,0 +1,158 @@
+"""
+Concurrent-request load test against a real uvicorn worker.
+
+Starts the app on a scratch SQLite database, seeds a few users and runs
+`concurrency` clients issuing a read/write mix (list cards, list
+collections, update a card, sync) for `seconds`. Meanwhile a probe hits
+/api/health every 20 ms: the probe does no database work, so its latency
+is the time requests wait for the event loop and shows any stall.
+
+    python -m benchmarks.load_test [concurrency] [seconds]
+"""
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PORT = 8799
+USERS = 8
+CARDS_PER_USER = 200
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def start_server(database_url: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "ENABLE_EMAIL_VERIFICATION": "false",
+        "SYNC_DEBOUNCE_SECONDS": "0",
+    }
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"],
+        cwd=BACKEND_DIR, env=env, check=True, capture_output=True
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient) -> None:
+    for _ in range(100):
+        try:
+            await client.get("/api/health")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def seed_user(client: httpx.AsyncClient, n: int) -> dict:
+    r = await client.post("/api/auth/register", json={"email": f"load{n}@example.com", "password": "load-test-1"})
+    r.raise_for_status()
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    collection_id = f"load-collection-{n}"
+    card_ids = [f"load-card-{n}-{i}" for i in range(CARDS_PER_USER)]
+    r = await client.post("/api/sync", headers=headers, json={
+        "collections": [{"id": collection_id, "name": "Load", "version": 1}],
+        "cards": [
+            {"id": card_id, "collection_id": collection_id, "front": "front", "back": "back", "version": 1}
+            for card_id in card_ids
+        ],
+    })
+    r.raise_for_status()
+    return {"headers": headers, "collection_id": collection_id, "card_ids": card_ids, "version": 1}
+
+
+async def worker(client: httpx.AsyncClient, user: dict, deadline: float, latencies: list, errors: list) -> None:
+    while time.monotonic() < deadline:
+        roll = random.random()
+        start = time.perf_counter()
+        try:
+            if roll < 0.5:
+                r = await client.get("/api/cards", params={"collection_id": user["collection_id"]}, headers=user["headers"])
+            elif roll < 0.65:
+                r = await client.get("/api/collections", headers=user["headers"])
+            elif roll < 0.9:
+                user["version"] += 1
+                r = await client.put(
+                    f"/api/cards/{random.choice(user['card_ids'])}",
+                    json={"front": f"edit {user['version']}", "version": user["version"]},
+                    headers=user["headers"]
+                )
+            else:
+                r = await client.post("/api/sync", json={"limit": 100}, headers=user["headers"])
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+        if r.status_code >= 400:
+            errors.append(r.status_code)
+
+
+async def probe(client: httpx.AsyncClient, deadline: float, latencies: list) -> None:
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        await client.get("/api/health")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.02)
+
+
+async def run(concurrency: int, seconds: float) -> None:
+    limits = httpx.Limits(max_connections=concurrency + 1)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=60, limits=limits) as client:
+        await wait_ready(client)
+        users = [await seed_user(client, n) for n in range(USERS)]
+
+        latencies, errors, probe_latencies = [], [], []
+        deadline = time.monotonic() + seconds
+        started = time.perf_counter()
+        await asyncio.gather(
+            probe(client, deadline, probe_latencies),
+            *(worker(client, users[i % USERS], deadline, latencies, errors) for i in range(concurrency))
+        )
+        elapsed = time.perf_counter() - started
+
+    print(f"concurrency {concurrency}, {seconds:.0f}s")
+    print(f"  requests      {len(latencies)} ({len(latencies) / elapsed:.0f} req/s), errors {len(errors)}")
+    print(
+        f"  latency       p50 {percentile(latencies, 0.5) * 1000:.1f} ms"
+        f"  p95 {percentile(latencies, 0.95) * 1000:.1f} ms"
+        f"  p99 {percentile(latencies, 0.99) * 1000:.1f} ms"
+    )
+    print(
+        f"  health probe  p50 {statistics.median(probe_latencies) * 1000:.1f} ms"
+        f"  p99 {percentile(probe_latencies, 0.99) * 1000:.1f} ms"
+        f"  max {max(probe_latencies) * 1000:.1f} ms"
+    )
+
+
+def main() -> None:
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 15
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = start_server(f"sqlite:///{tmp}/load_test.db")
+        try:
+            asyncio.run(run(concurrency, seconds))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
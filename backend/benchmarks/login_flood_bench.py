@@ -0,0 +1,114 @@
+"""
+Server CPU under a login flood, with and without the login rate limits.
+
+Starts the app on a scratch SQLite database, registers a few victims and
+runs `concurrency` attackers posting wrong passwords for them from one
+address for `seconds`, the way credential stuffing does. The server's CPU
+use is sampled every second from /proc (Linux only). Without limits every
+attempt costs a users lookup and a bcrypt verification. With them
+(MAX_LOGIN_ATTEMPTS per email, LOGIN_IP_MAX_ATTEMPTS per address) attempts
+past the limits get 429 before either, so the CPU cost per attempt drops
+to that of an HTTP round trip and stays flat however long the flood lasts.
+Run the client on another machine (or core) to read absolute CPU use.
+
+    python -m benchmarks.login_flood_bench [concurrency] [seconds]
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.load_test import BACKEND_DIR, PORT, wait_ready
+
+VICTIMS = 4
+
+
+def start_server(database_url: str, limited: bool) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "ENABLE_EMAIL_VERIFICATION": "false",
+    }
+    if not limited:
+        env["MAX_LOGIN_ATTEMPTS"] = env["LOGIN_IP_MAX_ATTEMPTS"] = str(10**9)
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"],
+        cwd=BACKEND_DIR, env=env, check=True, capture_output=True
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+
+
+def cpu_seconds(pid: int) -> float:
+    """User plus system CPU time of a process, all threads"""
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def attacker(client: httpx.AsyncClient, n: int, deadline: float, statuses: dict) -> None:
+    attempt = 0
+    while time.monotonic() < deadline:
+        attempt += 1
+        r = await client.post("/api/auth/login", json={
+            "email": f"victim{(n + attempt) % VICTIMS}@example.com",
+            "password": f"guess-{n}-{attempt}",
+        })
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+
+async def sample_cpu(pid: int, deadline: float, samples: list) -> None:
+    last, last_at = cpu_seconds(pid), time.monotonic()
+    while time.monotonic() < deadline:
+        await asyncio.sleep(1)
+        now, now_at = cpu_seconds(pid), time.monotonic()
+        samples.append((now - last) / (now_at - last_at))
+        last, last_at = now, now_at
+
+
+async def run_mode(limited: bool, concurrency: int, seconds: float) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        server = start_server(f"sqlite:///{tmp}/flood.db", limited)
+        try:
+            limits = httpx.Limits(max_connections=concurrency + 1)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=60, limits=limits) as client:
+                await wait_ready(client)
+                for n in range(VICTIMS):
+                    r = await client.post("/api/auth/register", json={"email": f"victim{n}@example.com", "password": "victim-password"})
+                    r.raise_for_status()
+
+                statuses, samples = {}, []
+                deadline = time.monotonic() + seconds
+                started = time.perf_counter()
+                await asyncio.gather(
+                    sample_cpu(server.pid, deadline, samples),
+                    *(attacker(client, n, deadline, statuses) for n in range(concurrency))
+                )
+                elapsed = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait()
+
+    attempts = sum(statuses.values())
+    print(f"{'limited' if limited else 'unlimited'}")
+    print(f"  attempts  {attempts} ({attempts / elapsed:.0f}/s)  statuses {dict(sorted(statuses.items()))}")
+    print(f"  cpu       {' '.join(f'{s * 100:3.0f}%' for s in samples)}")
+    print(f"  cpu per attempt {sum(samples) / attempts * 1000:.1f} ms")
+
+
+def main() -> None:
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"concurrency {concurrency}, {seconds:.0f}s per mode, server cpu per second")
+    for limited in (False, True):
+        asyncio.run(run_mode(limited, concurrency, seconds))
+
+
+if __name__ == "__main__":
+    main()
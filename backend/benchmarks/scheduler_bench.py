@@ -0,0 +1,171 @@
+"""
+Throughput of the vectorized FSRS scheduler against a per-card loop.
+
+Compute: `cards` random card states (new, relearning and scheduled) are
+reviewed with random answers, moved to another retention target and
+shifted, with app.services.scheduler.fsrs, and reviewed with a plain
+Python port of the app's calculateNextReview on a sample, which also
+checks both give the same schedule. Replay rebuilds the states from a
+history of several reviews per card.
+
+Write-back: the same number of cards is stored in a scratch SQLite
+database (sqlite_wal profile, 100 users) and rescheduled in place by
+app.services.scheduler.batch, chunk by chunk, change feed included.
+
+    python -m benchmarks.scheduler_bench [cards] [--no-db]
+"""
+import math
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, SyncSession
+from app.core.engine_profiles import build_engine
+from app.models.models import User, Collection, Card
+from app.services.scheduler import fsrs
+from app.services.scheduler.batch import apply, retention_transform, shift_transform
+
+USERS = 100
+SAMPLE = 50_000
+
+
+def random_states(n: int, rng: np.random.Generator, now: np.datetime64) -> fsrs.CardStates:
+    states = fsrs.CardStates(
+        ease_factor=rng.uniform(1.3, 3.0, n),
+        interval=rng.integers(0, 400, n),
+        repetitions=rng.integers(0, 12, n),
+        next_review=now + rng.integers(-60 * 86400, 60 * 86400, n).astype("timedelta64[s]")
+    )
+    states.next_review[rng.random(n) < 0.1] = np.datetime64("NaT")
+    return states
+
+
+def review_one(ease: float, interval: int, repetitions: int, next_review, quality: int, now: datetime):
+    """calculateNextReview of lib/services/spaced_repetition_service.dart, one card at a time"""
+    w = fsrs.DEFAULT_WEIGHTS.tolist()
+    to_interval = lambda s: max(1.0, min(36500.0, s * 9 * (1 / 0.9 - 1)))
+    to_ease = lambda d: max(1.3, min(3.0, (11 - d) / 3))
+    if next_review is None or repetitions == 0:
+        if quality == fsrs.WRONG:
+            return 2.5, 0, 0, now + timedelta(minutes=10)
+        days = math.floor(to_interval(w[quality]) + 0.5)
+        return to_ease(7 - quality), days, 1, now + timedelta(days=days)
+
+    stability = max(float(interval), 1.0)
+    difficulty = max(1.0, min(10.0, 11 - ease * 3))
+    elapsed = max(0, (now - next_review) // timedelta(days=1))
+    recall = 1 / (1 + elapsed / (9 * stability))
+    if quality == fsrs.WRONG:
+        stability = max(1.0, w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1))
+        difficulty = max(1.0, min(10.0, difficulty + w[7]))
+        repetitions = 0
+    else:
+        penalty = w[15] if quality == fsrs.HARD else 1.0
+        bonus = w[16] if quality == fsrs.EASY else 1.0
+        stability = stability * (1 + math.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+                                 * (math.exp((1 - recall) * w[10]) - 1) * penalty * bonus)
+        difficulty = max(1.0, min(10.0, difficulty - w[6] * (quality + 1 - 3)))
+        repetitions += 1
+    days = math.floor(to_interval(stability) + 0.5)
+    return to_ease(difficulty), days, repetitions, now + timedelta(days=days)
+
+
+def timed(label: str, n: int, fn):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<28} {elapsed * 1000:9.1f} ms  {n / elapsed:12,.0f} cards/s")
+    return result, elapsed
+
+
+def bench_compute(n: int) -> None:
+    rng = np.random.default_rng(7)
+    now = np.datetime64(datetime.utcnow().replace(microsecond=0), "us")
+    states = random_states(n, rng, now)
+    quality = rng.integers(0, 4, n)
+
+    print(f"compute, {n} cards")
+    reviewed, vectorized = timed("review (vectorized)", n, lambda: fsrs.review(states, quality, now))
+    timed("reschedule to 0.85", n, lambda: fsrs.reschedule(states, 0.85))
+    timed("shift by 3 days", n, lambda: fsrs.shift(states, 3))
+
+    sample = min(n, SAMPLE)
+    now_dt = now.astype(datetime)
+    next_reviews = states.next_review[:sample].astype(object)
+    args = [
+        (float(states.ease_factor[i]), int(states.interval[i]), int(states.repetitions[i]), next_reviews[i], int(quality[i]))
+        for i in range(sample)
+    ]
+    expected, loop = timed(f"review (loop, {sample})", sample, lambda: [review_one(*a, now_dt) for a in args])
+    print(f"  vectorized speedup x{loop / sample / (vectorized / n):.0f}")
+
+    mismatches = sum(
+        1 for i, (ease, interval, repetitions, next_review) in enumerate(expected)
+        if interval != reviewed.interval[i] or repetitions != reviewed.repetitions[i]
+        or abs(ease - reviewed.ease_factor[i]) > 1e-9 or np.datetime64(next_review, "us") != reviewed.next_review[i]
+    )
+    print(f"  loop and vectorized disagree on {mismatches} of {sample} cards")
+
+    reviews = 5 * n
+    card_index = rng.integers(0, n, reviews)
+    times = now - rng.integers(0, 365 * 86400, reviews).astype("timedelta64[s]")
+    answers = rng.choice(4, reviews, p=[0.15, 0.15, 0.55, 0.15])
+    timed(f"replay ({reviews} reviews)", n, lambda: fsrs.replay(card_index, answers, times, n))
+
+
+def seed(url: str, n: int) -> None:
+    engine = build_engine(url, "sqlite_wal")
+    Base.metadata.create_all(engine)
+    rng = np.random.default_rng(7)
+    now = datetime.utcnow()
+    per_user = n // USERS
+    with engine.begin() as conn:
+        for u in range(USERS):
+            user_id, collection_id = str(uuid4()), str(uuid4())
+            conn.execute(insert(User), [{
+                "id": user_id, "email": f"bench{u}@example.com", "hashed_password": "x",
+                "created_at": now, "updated_at": now, "is_deleted": False, "version": 1, "is_email_verified": True,
+            }])
+            conn.execute(insert(Collection), [{
+                "id": collection_id, "user_id": user_id, "name": "Bench",
+                "created_at": now, "updated_at": now, "is_deleted": False, "version": 1,
+            }])
+            intervals = rng.integers(1, 400, per_user).tolist()
+            offsets = rng.integers(-60 * 86400, 60 * 86400, per_user).tolist()
+            conn.execute(insert(Card), [{
+                "id": str(uuid4()), "user_id": user_id, "collection_id": collection_id,
+                "front": "front", "back": "back", "ease_factor": 2.5, "interval": interval, "repetitions": 3,
+                "next_review_date": now + timedelta(seconds=offset),
+                "created_at": now, "updated_at": now, "is_deleted": False, "version": 1,
+            } for interval, offset in zip(intervals, offsets)])
+    engine.dispose()
+
+
+def bench_write_back(n: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{tmp}/scheduler.db"
+        print(f"write-back, {n} cards on SQLite")
+        timed("seed", n, lambda: seed(url, n))
+        engine = build_engine(url, "sqlite_wal")
+        sessions = sessionmaker(class_=SyncSession, autoflush=False, bind=engine)
+        for label, transform in (("reschedule to 0.85", retention_transform(0.85)), ("shift by 3 days", shift_transform(3))):
+            (read, written), _ = timed(label, n, lambda: apply(sessions, transform))
+            print(f"    {read} read, {written} written")
+        engine.dispose()
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 1_000_000
+    bench_compute(n)
+    if "--no-db" not in sys.argv:
+        bench_write_back(n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark sync payload encodings: bytes on the wire and encode/decode time
+of the JSON body versus columnar MessagePack, each raw, gzip and zstd.
+
+    python -m benchmarks.wire_format_bench [number_of_cards]
+"""
+import gzip
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from pydantic import TypeAdapter
+
+from app.schemas.schemas import CardResponse
+from app.services.wire_format import columnar, packb, unpackb
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def make_cards(n: int) -> list[CardResponse]:
+    user_id = str(uuid4())
+    collection_ids = [str(uuid4()) for _ in range(20)]
+    now = datetime.utcnow()
+    return [
+        CardResponse(
+            id=str(uuid4()),
+            user_id=user_id,
+            collection_id=collection_ids[i % len(collection_ids)],
+            front=f"Question number {i}",
+            back=f"Answer number {i}",
+            ease_factor=2.5 + (i % 7) / 10,
+            interval=i % 30,
+            repetitions=i % 5,
+            next_review_date=now + timedelta(days=i % 30),
+            last_review_date=now - timedelta(days=i % 11),
+            created_at=now - timedelta(days=90),
+            updated_at=now,
+            is_deleted=False,
+            version=1 + i % 3,
+        )
+        for i in range(n)
+    ]
+
+
+def timed(fn, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    cards = make_cards(n)
+    adapter = TypeAdapter(list[CardResponse])
+
+    encoders = {
+        "json": (lambda: adapter.dump_json(cards), lambda body: json.loads(body)),
+        "msgpack": (lambda: packb(columnar(cards)), lambda body: unpackb(body)),
+    }
+    compressors = {"raw": (lambda b: b, lambda b: b)}
+    compressors["gzip"] = (lambda b: gzip.compress(b, 6), gzip.decompress)
+    if zstandard is not None:
+        compressors["zstd"] = (
+            lambda b: zstandard.ZstdCompressor(level=3).compress(b),
+            lambda b: zstandard.ZstdDecompressor().decompress(b),
+        )
+
+    print(f"{n} cards")
+    print(f"{'format':<16}{'bytes':>12}{'encode ms':>12}{'decode ms':>12}")
+    for enc_name, (encode, decode) in encoders.items():
+        for comp_name, (compress, decompress) in compressors.items():
+            body, encode_ms = timed(lambda: compress(encode()))
+            _, decode_ms = timed(lambda: decode(decompress(body)))
+            print(f"{enc_name + '+' + comp_name:<16}{len(body):>12}{encode_ms:>12.1f}{decode_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Concurrent write throughput on SQLite with and without the write pipeline.
+
+Each write edits one card the way PUT /api/cards/{id} does, so it also
+writes the change feed and digests. "direct" commits every write on its
+own AsyncSession, "pipeline" hands it to the single writer, which commits
+whatever has queued up as one transaction. Both use the sqlite_wal
+profile, and both run with SQLITE_SYNCHRONOUS=NORMAL (the default: in WAL
+mode a commit is not fsynced, only checkpoints are) and FULL (every commit
+is fsynced, the cost group commit shares across a batch). Lock errors
+("database is locked") are counted, not retried. The gap FULL opens
+between the modes depends on the disk's fsync latency, printed first.
+
+    python -m benchmarks.write_pipeline_bench [concurrency] [seconds] [directory]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError, DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SyncSession, async_database_url
+from app.core.engine_profiles import build_async_engine
+from app.models.models import Card
+from app.services.write_pipeline import WritePipeline
+from benchmarks.engine_profiles_bench import seed, percentile
+
+
+def edit_card(db: Session, card_id: str) -> None:
+    card = db.scalar(select(Card).where(Card.id == card_id))
+    card.front = f"edit {time.perf_counter()}"
+    card.version += 1
+
+
+def fsync_seconds(directory: str, rounds: int = 200) -> float:
+    """Average time of a 4 KiB write + fsync in `directory`"""
+    path = os.path.join(directory, "fsync-probe")
+    with open(path, "wb") as f:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            f.write(b"\0" * 4096)
+            f.flush()
+            os.fsync(f.fileno())
+        elapsed = time.perf_counter() - started
+    os.unlink(path)
+    return elapsed / rounds
+
+
+async def run_mode(url: str, mode: str, concurrency: int, seconds: float) -> dict:
+    users = seed(url, "sqlite_wal")
+    engine = build_async_engine(async_database_url(url), "sqlite_wal")
+    sessions = async_sessionmaker(engine, sync_session_class=SyncSession, autoflush=False, expire_on_commit=False)
+    pipeline = WritePipeline(url, max_batch=256)
+    if mode == "pipeline":
+        await pipeline.start()
+
+    writes, errors, latencies = 0, 0, []
+    deadline = time.monotonic() + seconds
+
+    async def worker() -> None:
+        nonlocal writes, errors
+        while time.monotonic() < deadline:
+            _, _, card_ids = random.choice(users)
+            card_id = random.choice(card_ids)
+            start = time.perf_counter()
+            try:
+                if mode == "pipeline":
+                    await pipeline.submit(edit_card, card_id)
+                else:
+                    async with sessions() as db:
+                        await db.run_sync(edit_card, card_id)
+                        await db.commit()
+            except (OperationalError, DBAPIError):
+                errors += 1
+                continue
+            writes += 1
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await pipeline.stop()
+    await engine.dispose()
+
+    return {
+        "writes": writes / elapsed,
+        "errors": errors,
+        "batch": pipeline.writes / pipeline.batches if pipeline.batches else 1,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+def main() -> None:
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    directory = sys.argv[3] if len(sys.argv) > 3 else None
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        print(f"concurrency {concurrency}, {seconds:.0f}s per mode, fsync {fsync_seconds(tmp) * 1000:.2f} ms")
+        for synchronous in ("NORMAL", "FULL"):
+            #read by the engines' connect hook, so it applies to every engine built below
+            settings.SQLITE_SYNCHRONOUS = synchronous
+            results = {}
+            for mode in ("direct", "pipeline"):
+                result = results[mode] = asyncio.run(
+                    run_mode(f"sqlite:///{tmp}/{mode}-{synchronous.lower()}.db", mode, concurrency, seconds)
+                )
+                print(
+                    f"{synchronous:<6} {mode:<10} {result['writes']:>8.0f} writes/s  avg batch {result['batch']:6.1f}"
+                    f"  p50 {result['p50'] * 1000:6.1f} ms  p99 {result['p99'] * 1000:7.1f} ms  errors {result['errors']}"
+                )
+            print(f"{synchronous:<6} pipeline / direct: {results['pipeline']['writes'] / results['direct']['writes']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
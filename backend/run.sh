@@ -1,3 +1,4 @@
 #!/bin/bash
 cd "$(dirname "$0")"
+venv/bin/alembic upgrade head
 venv/bin/python -m uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
@@ -0,0 +1,32 @@
+"""
+Tests run against a scratch SQLite database: the settings are pointed at
+it before the app is imported, and every test starts from an empty schema.
+Async tests use anyio's pytest plugin (@pytest.mark.anyio).
+"""
+import os
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="flashcards-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_scratch}/test.db"
+os.environ["ENVIRONMENT"] = "test"
+os.environ["ENABLE_EMAIL_VERIFICATION"] = "false"
+os.environ["MAINTENANCE_INTERVAL_SECONDS"] = "0"
+os.environ["SHARD_DATABASE_URLS"] = "[]"
+os.environ["REPLICA_DATABASE_URLS"] = "{}"
+
+import pytest
+
+from app.core.database import Base, engine
+import app.models.models  # noqa: F401  (registers the tables)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield
@@ -0,0 +1,97 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import event, insert
+from sqlalchemy.dialects import postgresql
+
+from app.core.database import SessionLocal, engine, async_engine
+from app.main import app
+from app.models.models import User
+from app.services.change_feed import lock_change_feed, record_changes, changes_after
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def statements():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(" ".join(statement.split()))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    yield statements
+    event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+
+
+def lock_index(statements: list[str]) -> int:
+    return statements.index("SELECT users.id FROM users WHERE users.id = ?")
+
+
+def first_index(statements: list[str], prefix: str) -> int:
+    return next(i for i, s in enumerate(statements) if s.startswith(prefix))
+
+
+def test_lock_is_a_no_key_update_of_the_user_row():
+    executed = []
+    lock_change_feed(SimpleNamespace(connection=lambda: SimpleNamespace(execute=executed.append)), "u")
+
+    [stmt] = executed
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert "FROM users" in sql and sql.endswith("FOR NO KEY UPDATE")
+
+
+async def test_user_row_is_locked_before_any_change_row(statements):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/api/auth/register", json={"email": "feed@example.com", "password": "password123"})
+        client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+        statements.clear()
+        collection = (await client.post("/api/collections", json={"name": "c"})).json()
+        assert lock_index(statements) < first_index(statements, "INSERT INTO change_log")
+
+        statements.clear()
+        await client.post("/api/sync", json={"cards": [
+            {"id": "k1", "front": "f", "back": "b", "collection_id": collection["id"], "version": 1}
+        ]})
+        #a push locks before its upserts, not between them
+        assert lock_index(statements) < first_index(statements, "INSERT INTO cards")
+        assert lock_index(statements) < first_index(statements, "INSERT INTO change_log")
+
+
+def test_interleaved_writers_commit_in_seq_order():
+    with engine.begin() as conn:
+        conn.execute(insert(User).values(id="u", email="u@example.com", hashed_password="x"))
+    first_written, release_first = threading.Event(), threading.Event()
+    second_done = threading.Event()
+
+    def first():
+        with SessionLocal() as db:
+            record_changes(db, "u", "card", {"c1": None})
+            first_written.set()
+            release_first.wait(5)
+            db.commit()
+
+    def second():
+        first_written.wait(5)
+        with SessionLocal() as db:
+            record_changes(db, "u", "card", {"c2": None})
+            db.commit()
+        second_done.set()
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    first_written.wait(5)
+    #the second writer cannot write its change row while the first one's transaction is open
+    assert not second_done.wait(0.3)
+    release_first.set()
+    for thread in threads:
+        thread.join(10)
+
+    with SessionLocal() as db:
+        changes = changes_after(db, "u", 0)
+    assert [c.entity_id for c in changes] == ["c1", "c2"]
+    assert changes[0].seq < changes[1].seq
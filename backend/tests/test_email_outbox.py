@@ -0,0 +1,143 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import EmailOutbox
+from app.services import email_outbox
+from app.services.email_outbox import EmailDispatcher
+from app.services.email_service import queue_email
+from app.services.smtp_sink import SmtpSink
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def sink(monkeypatch):
+    sink = SmtpSink(port=0)
+    await sink.start()
+    #restarts keep the port picked now
+    sink.port = sink._server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(settings, "MAIL_SERVER", sink.host)
+    monkeypatch.setattr(settings, "MAIL_PORT", sink.port)
+    monkeypatch.setattr(settings, "MAIL_STARTTLS", False)
+    monkeypatch.setattr(settings, "MAIL_SSL_TLS", False)
+    monkeypatch.setattr(settings, "EMAIL_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "EMAIL_RETRY_BASE_SECONDS", 30.0)
+    yield sink
+    await sink.stop()
+
+
+@pytest.fixture
+async def dispatcher(monkeypatch):
+    dispatcher = EmailDispatcher()
+    #the one commits wake
+    monkeypatch.setattr(email_outbox, "email_dispatcher", dispatcher)
+    yield dispatcher
+    await dispatcher.stop()
+
+
+def queue(recipient: str = "someone@example.com") -> None:
+    with SessionLocal() as db:
+        queue_email(db, "verification", recipient, {"user_name": "Someone", "url": "http://test/verify"})
+        db.commit()
+
+
+def outbox() -> list[EmailOutbox]:
+    with SessionLocal() as db:
+        return list(db.scalars(select(EmailOutbox).order_by(EmailOutbox.id)).all())
+
+
+def make_due() -> None:
+    """Skip the backoff, as if its time had come"""
+    with SessionLocal() as db:
+        db.execute(update(EmailOutbox).where(EmailOutbox.status == "pending").values(next_attempt_at=datetime.utcnow()))
+        db.commit()
+
+
+async def test_message_is_delivered_once(sink, dispatcher):
+    queue()
+
+    assert await dispatcher.dispatch_batch() == 1
+    assert await dispatcher.dispatch_batch() == 0
+
+    assert [m["To"] for m in sink.messages] == ["someone@example.com"]
+    assert sink.messages[0]["Subject"] == "Verify your email address"
+    [row] = outbox()
+    assert (row.status, row.attempts, row.context) == ("sent", 1, {})
+
+
+async def test_commit_wakes_the_dispatcher(sink, dispatcher, monkeypatch):
+    monkeypatch.setattr(settings, "EMAIL_OUTBOX_POLL_SECONDS", 60.0)
+    await dispatcher.start()
+    await asyncio.sleep(0.1)
+
+    queue()
+    for _ in range(100):
+        if sink.messages:
+            break
+        await asyncio.sleep(0.02)
+    assert len(sink.messages) == 1
+
+
+async def test_failed_sends_back_off_then_fail_after_max_attempts(sink, dispatcher):
+    sink.fail_rate = 1.0
+    queue()
+
+    for attempt in (1, 2):
+        before = datetime.utcnow()
+        assert await dispatcher.dispatch_batch() == 1
+        [row] = outbox()
+        assert (row.status, row.attempts) == ("pending", attempt)
+        assert "451" in row.last_error
+        #half to all of the base delay doubled per attempt
+        backoff = row.next_attempt_at - before
+        assert timedelta(seconds=15 * 2 ** (attempt - 1)) <= backoff <= timedelta(seconds=30 * 2 ** (attempt - 1) + 1)
+        #not due again until the backoff has passed
+        assert await dispatcher.dispatch_batch() == 0
+        make_due()
+
+    assert await dispatcher.dispatch_batch() == 1
+    [row] = outbox()
+    assert (row.status, row.attempts) == ("failed", 3)
+    make_due()
+    assert await dispatcher.dispatch_batch() == 0
+    assert sink.messages == []
+
+
+async def test_unreachable_server_retries_every_message_of_the_batch(sink, dispatcher):
+    await sink.stop()
+    queue("a@example.com")
+    queue("b@example.com")
+
+    assert await dispatcher.dispatch_batch() == 2
+    assert [(row.status, row.attempts) for row in outbox()] == [("pending", 1)] * 2
+
+    await sink.start()
+    make_due()
+    assert await dispatcher.dispatch_batch() == 2
+    assert sorted(m["To"] for m in sink.messages) == ["a@example.com", "b@example.com"]
+    assert [row.status for row in outbox()] == ["sent"] * 2
+
+
+async def test_a_message_that_fails_to_build_does_not_hold_up_the_batch(sink, dispatcher):
+    with SessionLocal() as db:
+        db.add(EmailOutbox(template="no_such_template", recipient="broken@example.com", context={}))
+        db.commit()
+    queue("a@example.com")
+
+    for attempt, claimed in ((1, 2), (2, 1)):
+        assert await dispatcher.dispatch_batch() == claimed
+        broken, sent = outbox()
+        assert (broken.status, broken.attempts) == ("pending", attempt)
+        assert "KeyError" in broken.last_error
+        assert sent.status == "sent"
+        make_due()
+
+    assert await dispatcher.dispatch_batch() == 1
+    broken, _ = outbox()
+    assert (broken.status, broken.attempts) == ("failed", 3)
+    assert [m["To"] for m in sink.messages] == ["a@example.com"]
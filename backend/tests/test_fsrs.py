@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+from app.services.scheduler.fsrs import (
+    DAY, RELEARN_DELAY, WRONG, HARD, GOOD, EASY, DEFAULT_WEIGHTS, CardStates, review, replay
+)
+
+NOW = np.datetime64("2026-03-01T12:00:00", "us")
+
+#worked by hand from lib/services/spaced_repetition_service.dart (calculateNextReview)
+#(interval, ease factor, repetitions, days past due, quality) -> (stability, difficulty, interval, repetitions)
+REVIEWS = [
+    ((10, 2.5, 3, 5, GOOD), (25.507599991624602, 3.5, 26, 4)),
+    ((10, 2.5, 3, 0, HARD), (10.0, 4.5651, 10, 4)),
+    ((10, 2.5, 3, 20, EASY), (179.5362695507998, 2.4349, 180, 4)),
+    ((30, 1.8, 5, 10, WRONG), (2.988809350821065, 5.6234, 3, 0)),
+    ((3, 2.0, 1, 2, GOOD), (8.925911281637298, 5.0, 9, 2)),
+    ((4, 1.3, 2, 0, WRONG), (1.0094828598302765, 7.1234, 1, 0)),
+]
+
+#_handleNewCard: quality -> (interval, ease factor)
+NEW_CARDS = [
+    (HARD, (1, 5 / 3)),
+    (GOOD, (3, 2.0)),
+    (EASY, (15, 7 / 3)),
+]
+
+
+def app_ease(difficulty: float) -> float:
+    #_difficultyToEase, the app only keeps the difficulty as an ease factor
+    return max(1.3, min(3.0, (11 - difficulty) / 3))
+
+
+def states(vectors, exact=False) -> CardStates:
+    interval, ease, repetitions, elapsed, _ = (np.array(column) for column in zip(*vectors))
+    return CardStates(
+        ease_factor=ease.astype(np.float64),
+        interval=interval.astype(np.float64 if exact else np.int64),
+        repetitions=repetitions.astype(np.int64),
+        next_review=NOW - elapsed.astype(np.int64) * DAY
+    )
+
+
+def qualities(vectors) -> np.ndarray:
+    return np.array([v[-1] for v in vectors], dtype=np.int64)
+
+
+@pytest.mark.parametrize("vector, expected", REVIEWS)
+def test_review_matches_the_app(vector, expected):
+    stability, difficulty, interval, repetitions = expected
+
+    rounded = review(states([vector]), qualities([vector]), NOW)
+    exact = review(states([vector], exact=True), qualities([vector]), NOW)
+
+    #the app stores the rounded interval, the exact states keep the stability itself
+    assert rounded.interval.tolist() == [interval]
+    assert rounded.repetitions.tolist() == [repetitions]
+    assert rounded.next_review.tolist() == [(NOW + interval * DAY).tolist()]
+    assert rounded.ease_factor == pytest.approx([app_ease(difficulty)])
+    assert exact.interval == pytest.approx([stability])
+
+
+@pytest.mark.parametrize("quality, expected", NEW_CARDS)
+def test_new_cards_start_from_the_initial_weights(quality, expected):
+    interval, ease_factor = expected
+
+    result = review(CardStates.new(1), np.array([quality]), NOW)
+
+    assert result.interval.tolist() == [interval]
+    assert result.ease_factor == pytest.approx([ease_factor])
+    assert result.repetitions.tolist() == [1]
+    assert result.next_review.tolist() == [(NOW + interval * DAY).tolist()]
+
+
+def test_new_card_answered_wrong_is_relearned_in_ten_minutes():
+    result = review(CardStates.new(1), np.array([WRONG]), NOW)
+
+    assert result.interval.tolist() == [0]
+    assert result.ease_factor.tolist() == [2.5]
+    assert result.repetitions.tolist() == [0]
+    assert result.next_review.tolist() == [(NOW + RELEARN_DELAY).tolist()]
+
+
+@pytest.mark.parametrize("exact", [False, True])
+def test_batch_matches_one_card_at_a_time(exact):
+    vectors = [v for v, _ in REVIEWS]
+    everything = CardStates(*(
+        np.concatenate([new, old]) for new, old in zip(
+            vars(CardStates.new(len(NEW_CARDS) + 1, exact=exact)).values(),
+            vars(states(vectors, exact)).values()
+        )
+    ))
+    quality = np.concatenate([[q for q, _ in NEW_CARDS] + [WRONG], qualities(vectors)])
+
+    batch = review(everything, quality, NOW)
+    for i in range(len(everything)):
+        one = review(everything.take([i]), quality[[i]], NOW)
+        assert not batch.take([i]).changed(one).any()
+
+
+def test_weight_batch_matches_one_weight_set_at_a_time():
+    vectors = [v for v, _ in REVIEWS]
+    weights = np.stack([DEFAULT_WEIGHTS, DEFAULT_WEIGHTS * 1.1, DEFAULT_WEIGHTS * 0.9])
+    single = states(vectors, exact=True)
+    batched = CardStates(*(np.broadcast_to(a, (len(weights),) + a.shape).copy() for a in vars(single).values()))
+
+    batch = review(batched, np.broadcast_to(qualities(vectors), batched.interval.shape), NOW, weights)
+    for k, w in enumerate(weights):
+        one = review(single, qualities(vectors), NOW, w)
+        assert batch.interval[k] == pytest.approx(one.interval)
+        assert batch.ease_factor[k] == pytest.approx(one.ease_factor)
+        assert batch.repetitions[k].tolist() == one.repetitions.tolist()
+        assert batch.next_review[k].tolist() == one.next_review.tolist()
+
+
+def test_replay_matches_reviewing_each_log_in_turn():
+    #three cards, reviews given out of order as they come from review_logs
+    card_index = np.array([1, 0, 2, 1, 0, 1, 2])
+    quality = np.array([GOOD, HARD, EASY, WRONG, GOOD, GOOD, GOOD])
+    days = np.array([0, 0, 1, 4, 3, 6, 20])
+    reviewed_at = NOW + days * DAY
+
+    replayed, _ = replay(card_index, quality, reviewed_at, 3)
+    for card in range(3):
+        one = CardStates.new(1)
+        for row in sorted(np.flatnonzero(card_index == card), key=lambda row: days[row]):
+            one = review(one, quality[[row]], reviewed_at[row])
+        assert not replayed.take([card]).changed(one).any()
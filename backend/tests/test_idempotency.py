@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.services.idempotency import IdempotencyStore
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_duplicates_in_flight_share_one_run():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+    runs = []
+
+    async def produce():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(*(store.run("u", "k", "f", produce) for _ in range(3)))
+    assert results == [("result", False), ("result", True), ("result", True)]
+    assert len(runs) == 1
+
+
+async def test_waiters_rerun_when_the_first_request_is_cancelled():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+    started = asyncio.Event()
+    runs = []
+
+    async def produce():
+        runs.append(1)
+        if len(runs) == 1:
+            started.set()
+            await asyncio.sleep(10)
+        return "result"
+
+    first = asyncio.create_task(store.run("u", "k", "f", produce))
+    await started.wait()
+    waiters = [asyncio.create_task(store.run("u", "k", "f", produce)) for _ in range(2)]
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert sorted(await asyncio.gather(*waiters)) == [("result", False), ("result", True)]
+    assert first.cancelled()
+    assert len(runs) == 2
+    assert await store.run("u", "k", "f", produce) == ("result", True)
+
+
+async def test_cancelled_waiter_does_not_cancel_the_run():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+    release = asyncio.Event()
+
+    async def produce():
+        await release.wait()
+        return "result"
+
+    first = asyncio.create_task(store.run("u", "k", "f", produce))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(store.run("u", "k", "f", produce))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    release.set()
+    assert await first == ("result", False)
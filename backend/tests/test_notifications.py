@@ -0,0 +1,130 @@
+import asyncio
+import gc
+import json
+
+import pytest
+
+from app.services import notifications
+from app.services.notifications import RedisBroadcast
+
+pytestmark = pytest.mark.anyio
+
+
+class FakePubSub:
+    """Subscription of FakeRedis, the connection drops after its messages when `drop` is set"""
+
+    def __init__(self, client):
+        self.client = client
+        self.channels = set()
+
+    @property
+    def subscribed(self) -> bool:
+        return bool(self.channels)
+
+    async def subscribe(self, channel: str) -> None:
+        if self.client.down:
+            raise ConnectionRefusedError("connection refused")
+        self.channels.add(channel)
+        self.client.subscriptions += 1
+
+    async def listen(self):
+        messages, drop = self.client.sessions.pop(0) if self.client.sessions else ([], False)
+        for message in messages:
+            yield {"type": "message", "data": json.dumps(message)}
+        if drop:
+            raise ConnectionResetError("connection lost")
+        await asyncio.Event().wait()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.channels.clear()
+
+
+class FakeRedis:
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.down = False
+        self.subscriptions = 0
+
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> FakePubSub:
+        return FakePubSub(self)
+
+    async def aclose(self) -> None:
+        pass
+
+
+async def test_listener_resubscribes_after_the_connection_drops(monkeypatch):
+    monkeypatch.setattr(notifications, "RECONNECT_MIN_SECONDS", 0.01)
+    received = []
+    client = FakeRedis([
+        ([{"user_id": "u", "seq": 1}], True),
+        ([], True),
+        ([{"user_id": "u", "seq": 2}], False),
+    ])
+    broadcast = RedisBroadcast("redis://localhost", client=client)
+
+    await broadcast.start(lambda user_id, seq, origin: received.append(seq))
+    for _ in range(100):
+        if received == [1, 2]:
+            break
+        await asyncio.sleep(0.01)
+    await broadcast.stop()
+
+    assert received == [1, 2]
+    assert client.subscriptions == 3
+
+
+async def test_listener_keeps_retrying_while_redis_is_down(monkeypatch):
+    monkeypatch.setattr(notifications, "RECONNECT_MIN_SECONDS", 0.01)
+    received = []
+    client = FakeRedis([([], True), ([{"user_id": "u", "seq": 5}], False)])
+    broadcast = RedisBroadcast("redis://localhost", client=client)
+
+    await broadcast.start(lambda user_id, seq, origin: received.append(seq))
+    client.down = True
+    await asyncio.sleep(0.1)
+    assert not broadcast._listener.done()
+    assert client.subscriptions == 1
+
+    client.down = False
+    for _ in range(100):
+        if received:
+            break
+        await asyncio.sleep(0.01)
+    await broadcast.stop()
+
+    assert received == [5]
+
+
+class BlockingBroadcast(notifications.BroadcastBackend):
+    """Delivers locally once `release` is set"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.published = []
+
+    async def start(self, deliver) -> None:
+        pass
+
+    async def publish(self, user_id: str, seq: int, origin) -> None:
+        await self.release.wait()
+        self.published.append((user_id, seq))
+
+
+async def test_publishes_in_flight_are_kept_until_done():
+    backend = BlockingBroadcast()
+    notifier = notifications.ChangeNotifier(lambda: backend)
+    await notifier.start()
+
+    await asyncio.to_thread(notifier.publish_threadsafe, {"u": (1, None)})
+    notifier.publish_threadsafe({"v": (2, None)})
+    await asyncio.sleep(0)
+    gc.collect()
+    assert len(notifier._publishing) == 2
+
+    backend.release.set()
+    await notifier.stop()
+    assert sorted(backend.published) == [("u", 1), ("v", 2)]
+    assert not notifier._publishing
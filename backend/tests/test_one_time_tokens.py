@@ -0,0 +1,105 @@
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.core.database import AsyncSessionLocal
+from app.models.models import User, OneTimeToken
+from app.services.one_time_tokens import (
+    VERIFY_EMAIL,
+    RESET_PASSWORD,
+    issue_token,
+    peek_token,
+    consume_token,
+    token_expired,
+    sweep_expired_tokens
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def user_id():
+    async with AsyncSessionLocal() as db:
+        db.add(User(id="u1", email="u1@example.com", hashed_password=""))
+        await db.commit()
+    return "u1"
+
+
+async def issue(user_id: str, purpose: str = VERIFY_EMAIL) -> str:
+    async with AsyncSessionLocal() as db:
+        token = await issue_token(db, user_id, purpose)
+        await db.commit()
+    return token
+
+
+async def consume(token: str, purpose: str = VERIFY_EMAIL):
+    async with AsyncSessionLocal() as db:
+        result = await consume_token(db, token, purpose)
+        await db.commit()
+    return result
+
+
+async def expire(token: str) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(OneTimeToken)
+            .where(OneTimeToken.token_hash == hashlib.sha256(token.encode()).hexdigest())
+            .values(expires_at=datetime.utcnow() - timedelta(seconds=1))
+        )
+        await db.commit()
+
+
+async def test_a_token_is_consumed_once(user_id):
+    token = await issue(user_id)
+
+    assert await consume(token) == user_id
+    assert await consume(token) is None
+    async with AsyncSessionLocal() as db:
+        assert await peek_token(db, token, VERIFY_EMAIL) is None
+
+
+async def test_an_expired_token_is_not_consumed(user_id):
+    token = await issue(user_id)
+    await expire(token)
+
+    assert await consume(token) is None
+    async with AsyncSessionLocal() as db:
+        assert await token_expired(db, token, VERIFY_EMAIL)
+        assert (await db.scalar(select(OneTimeToken))).used_at is None
+
+
+async def test_only_the_hash_is_stored(user_id):
+    token = await issue(user_id)
+
+    async with AsyncSessionLocal() as db:
+        rows = [dict(row) for row in (await db.execute(select(OneTimeToken.__table__))).mappings()]
+    assert len(rows) == 1
+    assert rows[0]["token_hash"] == hashlib.sha256(token.encode()).hexdigest()
+    assert not any(token in str(value) for row in rows for value in row.values())
+
+
+async def test_a_token_only_works_for_its_purpose(user_id):
+    token = await issue(user_id, RESET_PASSWORD)
+
+    assert await consume(token, VERIFY_EMAIL) is None
+    assert await consume(token, RESET_PASSWORD) == user_id
+
+
+async def test_issuing_replaces_outstanding_tokens(user_id):
+    first = await issue(user_id)
+    second = await issue(user_id)
+
+    assert await consume(first) is None
+    async with AsyncSessionLocal() as db:
+        assert not await token_expired(db, first, VERIFY_EMAIL)
+    assert await consume(second) == user_id
+
+
+async def test_sweep_removes_expired_tokens_only(user_id):
+    expired, live = await issue(user_id, VERIFY_EMAIL), await issue(user_id, RESET_PASSWORD)
+    await expire(expired)
+
+    assert await sweep_expired_tokens() == 1
+    assert await consume(live, RESET_PASSWORD) == user_id
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.password_hasher import PasswordHasher
+
+pytestmark = pytest.mark.anyio
+
+
+async def wait_for(condition) -> None:
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+async def test_cancelled_operation_keeps_its_slot_until_bcrypt_returns():
+    hasher = PasswordHasher(workers=1, max_queue=0)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "hashed"
+
+    try:
+        task = asyncio.create_task(hasher._run("hash", slow))
+        await wait_for(started.is_set)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        #the thread is still busy, so the pool is still full
+        assert hasher.pending == 1
+        with pytest.raises(HTTPException) as refused:
+            await hasher._run("hash", slow)
+        assert refused.value.status_code == 503
+
+        release.set()
+        await wait_for(lambda: hasher.pending == 0)
+        assert await hasher._run("hash", lambda: "done") == "done"
+    finally:
+        release.set()
+        hasher.shutdown()
+
+
+async def test_cancelled_queued_operation_frees_its_slot():
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    try:
+        running = asyncio.create_task(hasher._run("hash", slow))
+        await wait_for(started.is_set)
+        queued = asyncio.create_task(hasher._run("hash", lambda: "never"))
+        await wait_for(lambda: hasher.pending == 2)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        await wait_for(lambda: hasher.pending == 1)
+
+        release.set()
+        await running
+        await wait_for(lambda: hasher.pending == 0)
+    finally:
+        release.set()
+        hasher.shutdown()
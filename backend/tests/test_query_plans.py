@@ -0,0 +1,170 @@
+"""
+The hot per-user queries must be served by the indexes the migrations
+create. Each test runs the app's query (or the one its router builds)
+on a database migrated to head, seeded with a few users' worth of rows
+and ANALYZEd so the planner weighs the indexes as it would in use, and
+checks SQLite's EXPLAIN QUERY PLAN.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from argparse import Namespace
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import SyncSession
+from app.models.models import User, Collection, Card, ReviewLog, ChangeLog, OneTimeToken
+from app.services.change_feed import changes_after, head_seq, changed_ids
+from app.services.due_queue import due_page, due_counts
+from app.services.maintenance import expired_registrations
+from app.services.review_stats import range_stats
+
+NOW = datetime(2026, 10, 18, 12, 0)
+USERS = 20
+COLLECTIONS = 10
+CARDS = 200  #per collection
+
+
+def seed(engine) -> None:
+    with engine.begin() as conn:
+        for u in range(USERS):
+            user_id = f"u{u}" if u else "u"
+            conn.execute(insert(User).values(
+                id=user_id, email=f"{user_id}@example.com", hashed_password="x", is_email_verified=u % 2 == 0
+            ))
+            for c in range(COLLECTIONS):
+                collection_id = f"{user_id}-c{c}"
+                conn.execute(insert(Collection).values(id=collection_id, user_id=user_id, name="c"))
+                cards = [
+                    {
+                        "id": f"{collection_id}-{i}", "user_id": user_id, "collection_id": collection_id,
+                        "front": "f", "back": "b", "is_deleted": i % 50 == 0,
+                        "next_review_date": None if i % 10 == 0 else NOW + timedelta(hours=i - CARDS // 2),
+                        "updated_at": NOW - timedelta(minutes=i),
+                    }
+                    for i in range(CARDS)
+                ]
+                conn.execute(insert(Card), cards)
+                conn.execute(insert(ReviewLog), [
+                    {
+                        "id": f"{card['id']}-r", "card_id": card["id"], "user_id": user_id, "quality": "good",
+                        "reviewed_at": card["updated_at"], "interval_before": 0, "interval_after": 1,
+                        "ease_factor_before": 2.5, "ease_factor_after": 2.5,
+                    }
+                    for card in cards
+                ])
+                conn.execute(insert(ChangeLog), [
+                    {"user_id": user_id, "entity_type": "card", "entity_id": card["id"]} for card in cards
+                ])
+        conn.exec_driver_sql("ANALYZE")
+
+
+@pytest.fixture(scope="module")
+def migrated(tmp_path_factory):
+    url = f"sqlite:///{tmp_path_factory.mktemp('plans') / 'migrated.db'}"
+    config = Config("alembic.ini")
+    config.cmd_opts = Namespace(x=[f"database_url={url}"])
+    command.upgrade(config, "head")
+    engine = create_engine(url)
+    seed(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def plans(migrated):
+    """plans(fn) runs fn(session) and returns the query plan of every SELECT it issued"""
+    def run(fn):
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                statements.append((statement, parameters))
+
+        event.listen(migrated, "before_cursor_execute", capture)
+        try:
+            with sessionmaker(class_=SyncSession, bind=migrated)() as db:
+                fn(db)
+        finally:
+            event.remove(migrated, "before_cursor_execute", capture)
+
+        assert statements
+        with migrated.connect() as conn:
+            return [
+                " | ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+                for statement, parameters in statements
+            ]
+    return run
+
+
+def assert_uses(plan: str, index: str) -> None:
+    assert f"USING INDEX {index}" in plan or f"USING COVERING INDEX {index}" in plan, plan
+
+
+def test_change_feed_pages_use_user_seq_index(plans):
+    for plan in plans(lambda db: (changes_after(db, "u", 10, 100), head_seq(db, "u"))):
+        assert_uses(plan, "ix_change_log_user_seq")
+
+
+def test_changed_since_lists_use_user_seq_index(plans):
+    [plan] = plans(lambda db: db.execute(
+        select(Card).where(Card.user_id == "u", Card.id.in_(changed_ids("u", "card", 10)))
+    ).all())
+    assert_uses(plan, "ix_change_log_user_seq")
+
+
+def test_updated_since_uses_user_updated_indexes(plans):
+    since = NOW - timedelta(days=1)
+    [cards] = plans(lambda db: db.execute(
+        select(Card).where(Card.user_id == "u", Card.updated_at > since).order_by(Card.updated_at)
+    ).all())
+    [collections] = plans(lambda db: db.execute(
+        select(Collection).where(Collection.user_id == "u", Collection.updated_at > since)
+    ).all())
+    assert_uses(cards, "ix_cards_user_updated")
+    assert_uses(collections, "ix_collections_user_updated")
+
+
+def test_collection_cards_use_user_collection_index(plans):
+    [plan] = plans(lambda db: db.execute(
+        select(Card).where(Card.user_id == "u", Card.collection_id == "c")
+    ).all())
+    assert_uses(plan, "ix_cards_user_collection")
+
+
+def test_review_log_ranges_use_user_time_indexes(plans):
+    since = NOW - timedelta(days=1)
+    [reviewed] = plans(lambda db: db.execute(
+        select(ReviewLog).where(ReviewLog.user_id == "u", ReviewLog.reviewed_at > since).order_by(ReviewLog.reviewed_at.desc())
+    ).all())
+    [created] = plans(lambda db: db.execute(
+        select(ReviewLog).where(ReviewLog.user_id == "u", ReviewLog.created_at > since)
+    ).all())
+    assert_uses(reviewed, "ix_review_logs_user_reviewed")
+    assert_uses(created, "ix_review_logs_user_created")
+
+
+def test_due_queue_uses_partial_due_index(plans):
+    for plan in plans(lambda db: (
+        due_page(db, "u", None, None, 50, NOW),
+        due_page(db, "u", None, (NOW - timedelta(days=1), "card"), 50, NOW),
+        due_counts(db, "u", NOW)
+    )):
+        assert_uses(plan, "ix_cards_user_due")
+
+
+def test_expired_registrations_use_partial_index(plans):
+    [plan] = plans(lambda db: expired_registrations(db, 100))
+    assert_uses(plan, "ix_users_unverified_expires")
+
+
+def test_token_lookups_use_hash_index(plans):
+    [plan] = plans(lambda db: db.scalar(select(OneTimeToken).where(OneTimeToken.token_hash == "h")))
+    assert_uses(plan, "ix_one_time_tokens_token_hash")
+
+
+def test_stats_ranges_read_the_rollup_key(plans):
+    [plan] = plans(lambda db: range_stats(db, "u", None, NOW.date() - timedelta(days=30), NOW.date()))
+    assert_uses(plan, "sqlite_autoindex_review_stats_1")
@@ -0,0 +1,61 @@
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.services import rate_limit
+from app.services.rate_limit import InMemoryRateLimitStore, LoginLimiter, _retry_after
+
+pytestmark = pytest.mark.anyio
+
+WINDOW = 60.0
+
+
+class Clock:
+    def __init__(self):
+        self.now = 600.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+@pytest.mark.parametrize("limit", [0, 1])
+async def test_tiny_limits_refuse_without_dividing_by_zero(clock, limit):
+    store = InMemoryRateLimitStore(max_keys=10)
+    for _ in range(limit):
+        assert await store.hit("k", limit, WINDOW) == 0
+    assert await store.hit("k", limit, WINDOW) >= 1
+
+    clock.now += 2 * WINDOW
+    assert await store.hit("k", limit, WINDOW) == (WINDOW if limit == 0 else 0)
+
+
+def test_retry_after_with_no_previous_window():
+    assert _retry_after(0, 0, 10.0, WINDOW, 0) == WINDOW
+    assert _retry_after(0, 1, 10.0, WINDOW, 1) == pytest.approx(2 * WINDOW - 10.0)
+    assert _retry_after(0, 0, 10.0, WINDOW, 1) == 1.0
+
+
+async def test_an_attempt_refused_by_one_limit_counts_against_none(clock, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_LOGIN_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "LOGIN_IP_MAX_ATTEMPTS", 2)
+    limiter = LoginLimiter(InMemoryRateLimitStore(max_keys=10))
+
+    await limiter.check("a@example.com", "10.0.0.1")
+    await limiter.check("b@example.com", "10.0.0.1")
+    for _ in range(5):
+        with pytest.raises(HTTPException) as refused:
+            await limiter.check("victim@example.com", "10.0.0.1")
+        assert refused.value.status_code == 429
+
+    #the address was refused every time, so the victim's email has no attempts counted
+    for address in ("10.0.0.2", "10.0.0.3", "10.0.0.4"):
+        await limiter.check("victim@example.com", address)
+    with pytest.raises(HTTPException):
+        await limiter.check("victim@example.com", "10.0.0.5")
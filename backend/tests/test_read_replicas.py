@@ -0,0 +1,217 @@
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import insert, select, func
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings
+from app.core.database import engine
+from app.models.models import User, ChangeLog
+from app.services import read_replicas
+from app.services.read_replicas import ReplicaRouter
+
+pytestmark = pytest.mark.anyio
+
+ALICE = SimpleNamespace(id="alice", shard=None)
+BOB = SimpleNamespace(id="bob", shard=None)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(read_replicas, "time", clock)
+    monkeypatch.setattr(settings, "REPLICA_MAX_LAG_SECONDS", 30.0)
+    return clock
+
+
+@pytest.fixture
+async def router(tmp_path):
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": user.id, "email": f"{user.id}@example.com", "hashed_password": "x"} for user in (ALICE, BOB)
+        ])
+    replica_path = tmp_path / "replica.db"
+    router = ReplicaRouter({0: [f"sqlite:///{replica_path}"]})
+    router.replica_path = replica_path
+    yield router
+    await router.stop()
+
+
+def write_change(user) -> int:
+    """Commit a change on the primary, returns its sequence number"""
+    with engine.begin() as conn:
+        conn.execute(insert(ChangeLog).values(user_id=user.id, entity_type="card", entity_id="c"))
+        return conn.scalar(select(func.max(ChangeLog.seq)))
+
+
+def replicate(router) -> None:
+    """Bring the replica up to the primary, as streaming replication would"""
+    primary = sqlite3.connect(make_url(settings.database_url).database)
+    replica = sqlite3.connect(router.replica_path)
+    primary.backup(replica)
+    replica.close()
+    primary.close()
+
+
+def replica_of(router):
+    return router.replicas[0][0]
+
+
+async def test_reads_go_to_a_caught_up_replica(router, clock):
+    write_change(ALICE)
+    replicate(router)
+    await router.poll()
+
+    assert replica_of(router).healthy
+    assert await router.read_sessions(ALICE) is replica_of(router).sessions
+
+
+async def test_no_replica_for_the_shard_reads_from_the_primary(router, clock):
+    write_change(ALICE)
+    replicate(router)
+    await router.poll()
+
+    assert await router.read_sessions(SimpleNamespace(id="carol", shard=3)) is None
+
+
+async def test_own_writes_stick_to_the_primary_until_the_replica_applies_them(router, clock):
+    write_change(ALICE)
+    replicate(router)
+    await router.poll()
+
+    router.note_write(ALICE.id, write_change(ALICE))
+    await router.poll()
+    assert await router.read_sessions(ALICE) is None
+    #other users are not held back by alice's write
+    assert await router.read_sessions(BOB) is replica_of(router).sessions
+
+    replicate(router)
+    await router.poll()
+    assert await router.read_sessions(ALICE) is replica_of(router).sessions
+    assert ALICE.id not in router._last_writes
+
+
+async def test_a_cursor_ahead_of_the_replica_reads_from_the_primary(router, clock):
+    seq = write_change(ALICE)
+    replicate(router)
+    await router.poll()
+
+    assert await router.read_sessions(ALICE, min_seq=seq) is replica_of(router).sessions
+    assert await router.read_sessions(ALICE, min_seq=seq + 1) is None
+
+
+def unapply(router, seq: int) -> None:
+    """Remove a change from the replica, as if its commit had not been applied yet"""
+    replica = sqlite3.connect(router.replica_path)
+    replica.execute("DELETE FROM change_log WHERE seq = ?", (seq,))
+    replica.commit()
+    replica.close()
+
+
+async def test_a_later_seq_of_another_user_does_not_stand_in_for_the_users_write(router, clock):
+    write_change(ALICE)
+    replicate(router)
+    await router.poll()
+
+    #on Postgres alice's commit may become visible after bob's higher seq
+    alice_seq = write_change(ALICE)
+    write_change(BOB)
+    router.note_write(ALICE.id, alice_seq)
+    replicate(router)
+    unapply(router, alice_seq)
+    await router.poll()
+
+    assert replica_of(router).head > alice_seq
+    assert await router.read_sessions(ALICE) is None
+    assert await router.read_sessions(BOB, min_seq=alice_seq) is replica_of(router).sessions
+    assert ALICE.id in router._last_writes
+
+    replicate(router)
+    await router.poll()
+    assert await router.read_sessions(ALICE) is replica_of(router).sessions
+    assert ALICE.id not in router._last_writes
+
+
+async def test_a_cursor_is_checked_on_the_users_own_changes(router, clock):
+    write_change(ALICE)
+    replicate(router)
+    await router.poll()
+
+    alice_seq = write_change(ALICE)
+    write_change(BOB)
+    replicate(router)
+    unapply(router, alice_seq)
+    await router.poll()
+
+    assert await router.read_sessions(ALICE, min_seq=alice_seq) is None
+    assert await router.read_sessions(ALICE, min_seq=alice_seq - 1) is replica_of(router).sessions
+
+
+async def test_unreachable_replica_fails_over_to_the_primary_and_back(router, clock):
+    write_change(ALICE)
+    replicate(router)
+    await router.poll()
+    assert await router.read_sessions(ALICE) is not None
+
+    await replica_of(router).engine.dispose()
+    router.replica_path.unlink()
+    await router.poll()
+    assert not replica_of(router).healthy
+    assert await router.read_sessions(ALICE) is None
+
+    replicate(router)
+    await router.poll()
+    assert replica_of(router).healthy
+    assert await router.read_sessions(ALICE) is replica_of(router).sessions
+
+
+async def test_replica_trailing_steady_writes_stays_healthy(router, clock):
+    write_change(ALICE)
+    replicate(router)
+    await router.poll()
+
+    #the replica is always a change behind, but never by more than a poll interval
+    for _ in range(50):
+        replicate(router)
+        write_change(BOB)
+        clock.now += 5
+        await router.poll()
+        assert replica_of(router).head < replica_of(router).primary_head
+        assert replica_of(router).lag_seconds <= 5
+        assert replica_of(router).healthy
+    assert len(router._primary_heads[0]) <= 2
+
+
+async def test_stalled_replica_lag_grows_until_it_is_dropped(router, clock):
+    write_change(ALICE)
+    replicate(router)
+    await router.poll()
+
+    write_change(BOB)
+    await router.poll()
+    for elapsed in (10, 20, 30):
+        clock.now += 10
+        write_change(BOB)
+        await router.poll()
+        assert replica_of(router).lag_seconds == elapsed
+        assert replica_of(router).healthy
+
+    clock.now += 10
+    await router.poll()
+    assert replica_of(router).lag_seconds == 40
+    assert not replica_of(router).healthy
+    assert await router.read_sessions(BOB) is None
+
+    replicate(router)
+    await router.poll()
+    assert replica_of(router).lag_seconds == 0
+    assert replica_of(router).healthy
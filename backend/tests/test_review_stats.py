@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select, delete
+
+from app.core.database import SessionLocal
+from app.main import app
+from app.models.models import ReviewLog, ReviewStats
+from app.services.review_stats import rebuild_user, ACCOUNT_TOTAL
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime.utcnow().replace(minute=30, second=0, microsecond=0)
+
+
+@pytest.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/api/auth/register", json={"email": "stats@example.com", "password": "password123"})
+        client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        client.user_id = response.json()["user"]["id"]
+        collection = (await client.post("/api/collections", json={"name": "c"})).json()
+        client.card_id = (await client.post("/api/cards", json={"collection_id": collection["id"], "front": "f", "back": "b"})).json()["id"]
+        yield client
+
+
+def log(card_id: str, log_id: str, quality: str, reviewed_at: datetime) -> dict:
+    return {
+        "id": log_id, "card_id": card_id, "quality": quality, "reviewed_at": reviewed_at.isoformat(),
+        "interval_before": 0, "interval_after": 1, "ease_factor_before": 2.5, "ease_factor_after": 2.5,
+    }
+
+
+def stored_rollups(user_id: str) -> list[tuple]:
+    with SessionLocal() as db:
+        return sorted(tuple(r) for r in db.execute(
+            select(ReviewStats.collection_id, ReviewStats.hour, ReviewStats.reviews, ReviewStats.wrong, ReviewStats.good)
+            .where(ReviewStats.user_id == user_id)
+        ))
+
+
+async def test_reviews_are_counted_once_per_insert(client):
+    first = log(client.card_id, "l1", "good", NOW - timedelta(days=1))
+    assert (await client.post("/api/review-logs", json=first)).status_code == 200
+    assert (await client.post("/api/review-logs", json=first)).status_code == 200
+    pushed = [first, log(client.card_id, "l2", "wrong", NOW), log(client.card_id, "l3", "good", NOW)]
+    assert (await client.post("/api/sync", json={"review_logs": pushed})).status_code == 200
+
+    stats = (await client.get("/api/stats")).json()
+    assert stats["totals"]["reviews"] == 3
+    assert stats["totals"]["wrong"] == 1
+    assert stats["retention"] == pytest.approx(2 / 3)
+    assert [day["reviews"] for day in stats["days"]] == [1, 2]
+    assert stats["current_streak"] == 2
+    assert stats["hours"][NOW.hour] == 3
+
+
+async def test_aware_review_times_are_stored_and_counted_in_utc(client):
+    local = (NOW - timedelta(hours=1)).replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=5)))
+    assert (await client.post("/api/review-logs", json=log(client.card_id, "l1", "good", local))).status_code == 200
+    assert (await client.post("/api/sync", json={"review_logs": [log(client.card_id, "l2", "good", local)]})).status_code == 200
+
+    with SessionLocal() as db:
+        stored = db.scalars(select(ReviewLog.reviewed_at)).all()
+    assert stored == [NOW - timedelta(hours=1)] * 2
+    [(_, hour, reviews, _, _), _] = stored_rollups(client.user_id)
+    assert (hour, reviews) == ((NOW - timedelta(hours=1)).replace(minute=0), 2)
+
+
+async def test_backfill_rebuilds_the_live_rollups(client):
+    pushed = [log(client.card_id, f"l{i}", ("good", "wrong", "easy")[i % 3], NOW - timedelta(hours=7 * i)) for i in range(30)]
+    assert (await client.post("/api/sync", json={"review_logs": pushed})).status_code == 200
+    live = stored_rollups(client.user_id)
+    assert sum(r[2] for r in live if r[0] == ACCOUNT_TOTAL) == 30
+
+    with SessionLocal() as db:
+        db.execute(delete(ReviewStats))
+        assert rebuild_user(db, client.user_id) == 30
+        assert rebuild_user(db, client.user_id) == 30
+        db.commit()
+    assert stored_rollups(client.user_id) == live
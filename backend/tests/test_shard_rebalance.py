@@ -0,0 +1,139 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select, func
+
+from app.core.config import settings
+from app.core.database import Base, SessionLocal
+from app.core.sharding import shard_map, DIRECTORY_SHARD
+from app.main import app
+from app.models.models import User, Collection, Card, ReviewLog, ChangeLog, SyncDigest
+from app.services import shard_rebalance
+from app.services.auth_cache import auth_cache
+from app.services.change_feed import head_seq
+
+pytestmark = pytest.mark.anyio
+
+ENTITIES = (Collection, Card, ReviewLog)
+
+
+@pytest.fixture
+def second_shard(tmp_path, monkeypatch):
+    monkeypatch.setattr(shard_map, "urls", shard_map.urls + [f"sqlite:///{tmp_path}/shard1.db"])
+    #the tool cannot reach this process's auth cache over memory://, so it is off and not waited for
+    monkeypatch.setattr(settings, "AUTH_USER_CACHE_TTL_SECONDS", 0)
+    monkeypatch.setattr(auth_cache.users, "ttl_seconds", 0)
+    sessions = shard_map.sessions(1)
+    Base.metadata.create_all(sessions.kw["bind"])
+    yield sessions
+    for registry in (shard_map._sessions, shard_map._async_sessions):
+        registry.pop(1, None)
+    shard_map._engines.pop(1).dispose()
+    shard_map._async_engines.pop(1, None)
+
+
+@pytest.fixture
+async def client(second_shard):
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+    response = await client.post("/api/auth/register", json={"email": "mover@example.com", "password": "password123"})
+    client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+    client.user_id = response.json()["user"]["id"]
+    collection = (await client.post("/api/collections", json={"name": "deck"})).json()
+    cards = [
+        (await client.post("/api/cards", json={"collection_id": collection["id"], "front": f"f{i}", "back": "b"})).json()
+        for i in range(3)
+    ]
+    await client.post("/api/review-logs", json={
+        "card_id": cards[0]["id"], "quality": "good", "interval_before": 0, "interval_after": 3,
+        "ease_factor_before": 2.5, "ease_factor_after": 2.5
+    })
+    yield client
+    await client.aclose()
+
+
+def snapshot(db, user_id: str) -> dict:
+    """The user's entities on a shard, as column dicts by table"""
+    return {
+        model.__tablename__: sorted(
+            (dict(row) for row in db.execute(select(model.__table__).where(model.user_id == user_id)).mappings()),
+            key=lambda row: row["id"]
+        )
+        for model in ENTITIES
+    }
+
+
+def count(db, model, user_id: str) -> int:
+    return db.scalar(select(func.count()).select_from(model).where(model.user_id == user_id))
+
+
+def shard_of(user_id: str) -> int:
+    with SessionLocal() as directory:
+        return shard_map.shard_of(directory.get(User, user_id))
+
+
+async def test_move_copies_the_rows_switches_the_directory_and_purges_the_source(client):
+    user_id = client.user_id
+    #registration places the user by hash, the move goes to the other shard
+    source = shard_of(user_id)
+    target = 1 - source
+    with shard_map.sessions(source)() as src:
+        before = snapshot(src, user_id)
+        source_head = head_seq(src, user_id)
+        digests = src.execute(select(SyncDigest.collection_id, SyncDigest.revision).where(SyncDigest.user_id == user_id)).all()
+    assert [len(rows) for rows in before.values()] == [1, 3, 1]
+
+    shard_rebalance.move_user(user_id, target, grace=0)
+
+    with shard_map.sessions(target)() as dst:
+        assert snapshot(dst, user_id) == before
+        #one change row per entity, numbered above anything a client of the source holds
+        seqs = dst.scalars(select(ChangeLog.seq).where(ChangeLog.user_id == user_id)).all()
+        assert len(seqs) == 5 and min(seqs) > source_head
+        assert sorted(dst.execute(select(SyncDigest.collection_id, SyncDigest.revision).where(SyncDigest.user_id == user_id)).all()) == sorted(digests)
+        assert dst.get(User, user_id) is not None
+
+    with SessionLocal() as directory:
+        user = directory.get(User, user_id)
+        assert (shard_map.shard_of(user), user.shard_moving) == (target, False)
+    with shard_map.sessions(source)() as src:
+        for model in ENTITIES + (ChangeLog, SyncDigest):
+            assert count(src, model, user_id) == 0
+        #the directory keeps the account, another shard only held a placeholder
+        assert (src.get(User, user_id) is not None) == (source == DIRECTORY_SHARD)
+
+    #the app now serves the user from the target
+    cards = (await client.get("/api/cards")).json()
+    assert sorted(card["id"] for card in cards) == [row["id"] for row in before["cards"]]
+    sync = (await client.post("/api/sync", json={})).json()
+    assert len(sync["cards"]) == 3 and sync["digest"]
+
+
+async def test_moving_a_user_to_its_own_shard_changes_nothing(client):
+    source = shard_of(client.user_id)
+    with shard_map.sessions(source)() as src:
+        before = snapshot(src, client.user_id)
+
+    shard_rebalance.move_user(client.user_id, source, grace=0)
+
+    assert shard_of(client.user_id) == source
+    with shard_map.sessions(source)() as src:
+        assert snapshot(src, client.user_id) == before
+    with shard_map.sessions(1 - source)() as other:
+        assert count(other, Card, client.user_id) == 0
+
+
+async def test_move_there_and_back(client):
+    #covers both directions whichever shard registration picked
+    source = shard_of(client.user_id)
+    with shard_map.sessions(source)() as src:
+        before = snapshot(src, client.user_id)
+
+    shard_rebalance.move_user(client.user_id, 1 - source, grace=0)
+    shard_rebalance.move_user(client.user_id, source, grace=0)
+
+    assert shard_of(client.user_id) == source
+    with shard_map.sessions(source)() as src:
+        assert snapshot(src, client.user_id) == before
+    with shard_map.sessions(1 - source)() as other:
+        for model in ENTITIES + (ChangeLog, SyncDigest):
+            assert count(other, model, client.user_id) == 0
+    assert len((await client.get("/api/cards")).json()) == 3
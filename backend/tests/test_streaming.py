@@ -0,0 +1,72 @@
+import json
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.core.database import SessionLocal
+from app.main import app
+from app.services.change_feed import head_seq
+
+pytestmark = pytest.mark.anyio
+
+NDJSON = {"Accept": "application/x-ndjson"}
+
+
+@pytest.fixture
+async def client():
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+    response = await client.post("/api/auth/register", json={"email": "stream@example.com", "password": "password123"})
+    client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+    client.user_id = response.json()["user"]["id"]
+    collection = (await client.post("/api/collections", json={"name": "deck"})).json()
+    client.cards = [
+        (await client.post("/api/cards", json={"collection_id": collection["id"], "front": f"f{i}", "back": "b"})).json()
+        for i in range(3)
+    ]
+    yield client
+    await client.aclose()
+
+
+def lines(body: str) -> list[dict]:
+    assert body == "" or body.endswith("\n")
+    return [json.loads(line) for line in body.split("\n")[:-1]]
+
+
+async def test_cards_stream_one_object_per_line(client):
+    response = await client.get("/api/cards", headers=NDJSON)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    cards = lines(response.text)
+    assert all(isinstance(card, dict) for card in cards)
+    assert sorted(card["id"] for card in cards) == sorted(card["id"] for card in client.cards)
+    assert cards == (await client.get("/api/cards")).json()
+
+
+async def test_stream_carries_the_change_feed_head(client):
+    with SessionLocal() as db:
+        head = head_seq(db, client.user_id)
+
+    response = await client.get("/api/cards", headers=NDJSON)
+    assert response.headers["X-Change-Seq"] == str(head)
+
+    #resuming from the header returns only what changed after the stream
+    assert lines((await client.get("/api/cards", params={"after_seq": head}, headers=NDJSON)).text) == []
+    edited = client.cards[1]
+    await client.put(f"/api/cards/{edited['id']}", json={"front": "edited", "version": edited["version"]})
+    response = await client.get("/api/cards", params={"after_seq": head}, headers=NDJSON)
+    assert [card["front"] for card in lines(response.text)] == ["edited"]
+    assert int(response.headers["X-Change-Seq"]) > head
+
+
+async def test_sync_stream_ends_with_the_cursor_and_digests(client):
+    response = await client.post("/api/sync", json={}, headers=NDJSON)
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    body = lines(response.text)
+    assert [line["type"] for line in body] == ["collection", "card", "card", "card", "cursor", "end"]
+    assert body[-1]["digest"] and not body[-1]["has_more"]
+    assert body[-1]["next_cursor"] == body[-2]["next_cursor"]
+
+    resumed = lines((await client.post("/api/sync", json={"cursor": body[-1]["next_cursor"]}, headers=NDJSON)).text)
+    assert [line["type"] for line in resumed] == ["end"]
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.sync_coalescer import SyncCoalescer
+
+pytestmark = pytest.mark.anyio
+
+WINDOW = 0.3
+
+
+class Passes:
+    """run_batch recording each pass's requests and when it started"""
+
+    def __init__(self):
+        self.batches: list[list] = []
+        self.started: list[float] = []
+
+    async def __call__(self, user_id: str, requests: list) -> list:
+        self.batches.append(list(requests))
+        self.started.append(time.monotonic())
+        return [ValueError(r) if r == "bad" else f"{user_id}:{r}" for r in requests]
+
+
+async def test_syncs_outside_the_window_run_at_once():
+    coalescer, passes = SyncCoalescer(WINDOW), Passes()
+
+    for request in ("a", "b"):
+        submitted = time.monotonic()
+        assert await coalescer.submit("u", request, passes) == (f"u:{request}", 1)
+        assert time.monotonic() - submitted < WINDOW / 2
+        await asyncio.sleep(WINDOW * 1.2)
+
+    assert passes.batches == [["a"], ["b"]]
+    assert (coalescer.requests, coalescer.passes, coalescer.coalesced) == (2, 2, 0)
+
+
+async def test_syncs_inside_the_window_share_one_pass():
+    coalescer, passes = SyncCoalescer(WINDOW), Passes()
+    first = time.monotonic()
+    assert await coalescer.submit("u", "a", passes) == ("u:a", 1)
+
+    second = asyncio.create_task(coalescer.submit("u", "b", passes))
+    await asyncio.sleep(WINDOW / 3)
+    third = asyncio.create_task(coalescer.submit("u", "bad", passes))
+    other_user = await coalescer.submit("v", "x", passes)
+
+    assert await second == ("u:b", 2)
+    with pytest.raises(ValueError):
+        await third
+    assert other_user == ("v:x", 1)
+    assert passes.batches == [["a"], ["x"], ["b", "bad"]]
+    #the debounced pass waited for the window that the first pass opened
+    assert passes.started[2] - first >= WINDOW * 0.9
+    assert coalescer.coalesced == 1
+
+
+async def test_simultaneous_first_syncs_share_one_pass():
+    coalescer, passes = SyncCoalescer(WINDOW), Passes()
+
+    results = await asyncio.gather(*(coalescer.submit("u", r, passes) for r in ("a", "b")))
+    assert results == [("u:a", 2), ("u:b", 2)]
+    assert passes.batches == [["a", "b"]]
+
+
+async def test_urgent_sync_ends_the_wait():
+    coalescer, passes = SyncCoalescer(WINDOW), Passes()
+    await coalescer.submit("u", "a", passes)
+
+    submitted = time.monotonic()
+    assert await coalescer.submit("u", "next page", passes, urgent=True) == ("u:next page", 1)
+    assert time.monotonic() - submitted < WINDOW / 2
+    await asyncio.sleep(WINDOW * 1.2)
+    assert not coalescer._running and not coalescer._pending and not coalescer._last_start
@@ -0,0 +1,55 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def client():
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+    response = await client.post("/api/auth/register", json={"email": "pager@example.com", "password": "password123"})
+    client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+    yield client
+    await client.aclose()
+
+
+async def pull(client: AsyncClient, cursor=None) -> dict:
+    response = await client.post("/api/sync", json={"cursor": cursor, "limit": 2})
+    assert response.status_code == 200
+    return response.json()
+
+
+def ids(page: dict) -> list[str]:
+    return [c["id"] for c in page["collections"]] + [c["id"] for c in page["cards"]]
+
+
+async def test_pages_deliver_every_row_once_and_changes_made_between_pages(client):
+    collection = (await client.post("/api/collections", json={"name": "deck"})).json()
+    cards = [
+        (await client.post("/api/cards", json={"collection_id": collection["id"], "front": f"f{i}", "back": "b"})).json()
+        for i in range(5)
+    ]
+
+    pages = [await pull(client)]
+    #the first card went out on the first page, its edit has to follow on a later one
+    edited = cards[0]
+    assert edited["id"] in ids(pages[0])
+    await client.put(f"/api/cards/{edited['id']}", json={"front": "edited", "version": edited["version"]})
+    while pages[-1]["has_more"]:
+        pages.append(await pull(client, pages[-1]["next_cursor"]))
+
+    delivered = [i for page in pages for i in ids(page)]
+    assert len(pages) == 4
+    assert all(len(ids(page)) == 2 for page in pages[:-1])
+    #within a page rows come grouped by type, not in feed order
+    assert sorted(delivered[:6]) == sorted([collection["id"]] + [card["id"] for card in cards])
+    assert delivered[6:] == [edited["id"]]
+    assert pages[-1]["cards"][0]["front"] == "edited"
+    assert pages[-1]["digest"] is not None
+    assert all(page["digest"] is None for page in pages[:-1])
+
+    #nothing after the last cursor
+    rest = await pull(client, pages[-1]["next_cursor"])
+    assert ids(rest) == [] and not rest["has_more"]
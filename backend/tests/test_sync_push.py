@@ -0,0 +1,71 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+
+from app.core.database import SessionLocal
+from app.main import app
+from app.models.models import Collection, Card, ChangeLog
+from app.services.change_feed import account_digest
+
+pytestmark = pytest.mark.anyio
+
+
+async def register(email: str) -> AsyncClient:
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+    response = await client.post("/api/auth/register", json={"email": email, "password": "password123"})
+    client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+    client.user_id = response.json()["user"]["id"]
+    return client
+
+
+@pytest.fixture
+async def users():
+    alice, mallory = await register("alice@example.com"), await register("mallory@example.com")
+    yield alice, mallory
+    await alice.aclose()
+    await mallory.aclose()
+
+
+def changes_of(user_id: str) -> list[tuple]:
+    with SessionLocal() as db:
+        return db.execute(
+            select(ChangeLog.entity_type, ChangeLog.entity_id).where(ChangeLog.user_id == user_id).order_by(ChangeLog.seq)
+        ).all()
+
+
+def digest_of(user_id: str) -> str:
+    with SessionLocal() as db:
+        return account_digest(db, user_id)
+
+
+async def test_pushing_foreign_ids_writes_and_records_nothing(users):
+    alice, mallory = users
+    collection = (await alice.post("/api/collections", json={"name": "alice's"})).json()
+    card = (await alice.post("/api/cards", json={"collection_id": collection["id"], "front": "f", "back": "b"})).json()
+    await mallory.post("/api/sync", json={"collections": [{"id": "own", "name": "mine", "version": 1}]})
+    changes, digest = changes_of(mallory.user_id), digest_of(mallory.user_id)
+
+    response = await mallory.post("/api/sync", json={
+        "collections": [{"id": collection["id"], "name": "taken", "version": 99}],
+        "cards": [{"id": card["id"], "front": "taken", "back": "x", "collection_id": "own", "version": 99}],
+    })
+
+    assert response.status_code == 200
+    assert changes_of(mallory.user_id) == changes
+    assert digest_of(mallory.user_id) == digest
+    with SessionLocal() as db:
+        assert db.get(Collection, collection["id"]).name == "alice's"
+        assert db.get(Card, card["id"]).front == "f"
+
+
+async def test_own_writes_are_recorded(users):
+    alice, _ = users
+    digest = digest_of(alice.user_id)
+
+    await alice.post("/api/sync", json={
+        "collections": [{"id": "c1", "name": "c", "version": 1}],
+        "cards": [{"id": "k1", "front": "f", "back": "b", "collection_id": "c1", "version": 1}],
+    })
+
+    assert changes_of(alice.user_id) == [("collection", "c1"), ("card", "k1")]
+    assert digest_of(alice.user_id) != digest
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal, engine
+from app.models.models import User, Collection, ChangeLog
+from app.services.write_pipeline import WritePipeline
+import app.services.change_feed  # noqa: F401  (registers the change feed hooks)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def pipeline():
+    with engine.begin() as conn:
+        conn.execute(insert(User).values(id="u", email="u@example.com", hashed_password="x"))
+    pipeline = WritePipeline(settings.database_url, max_batch=16)
+    yield pipeline
+    await pipeline.stop()
+
+
+def add_collection(db: Session, collection_id: str) -> str:
+    db.add(Collection(id=collection_id, user_id="u", name=collection_id))
+    db.flush()
+    return collection_id
+
+
+def add_then_fail(db: Session, collection_id: str) -> None:
+    add_collection(db, collection_id)
+    raise ValueError("rejected")
+
+
+async def test_a_failing_write_rolls_back_only_its_savepoint(pipeline):
+    results = await asyncio.gather(
+        pipeline.submit(add_collection, "a"),
+        pipeline.submit(add_then_fail, "b"),
+        pipeline.submit(add_collection, "a"),  #duplicate key, fails in the database
+        pipeline.submit(add_collection, "c"),
+        return_exceptions=True
+    )
+
+    assert results[0] == "a" and results[3] == "c"
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[2], IntegrityError)
+    assert (pipeline.writes, pipeline.batches) == (4, 1)
+
+    with SessionLocal() as db:
+        assert db.scalars(select(Collection.id).order_by(Collection.id)).all() == ["a", "c"]
+        #the failed writes' change rows went with their savepoints
+        assert db.scalars(select(ChangeLog.entity_id).order_by(ChangeLog.seq)).all() == ["a", "c"]
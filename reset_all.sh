@@ -64,6 +64,6 @@ echo ""
 echo "✅ Reset complete!"
 echo ""
 echo "💡 To restart the backend:"
-echo "   cd backend && ./venv/bin/python -m uvicorn app.main:app --reload"
+echo "   cd backend && ./run.sh"
 echo ""
-echo "💡 The databases will be automatically recreated on first use."
+echo "💡 run.sh recreates the backend database with Alembic migrations on startup."